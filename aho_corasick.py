@@ -0,0 +1,166 @@
+"""
+多关键词匹配模块 - V6.1
+Aho-Corasick自动机：关键词列表只构建一次，一次线性扫描找出文本中出现的所有关键词，
+可选不区分大小写（与 re.IGNORECASE 的规则一致）和整词匹配（与正则 \\b关键词\\b 的规则一致）
+"""
+import re
+
+# str.lower() 会把这几个字符变成多个字符，或与 re.IGNORECASE 的等价规则不同，单独指定
+_FOLD_SPECIAL = {'İ': 'i', 'ΐ': 'ΐ', 'ΰ': 'ΰ', 'ﬅ': 'ﬆ'}
+
+
+class _CaseFoldTable(dict):
+    """str.translate 用的大小写折叠表（按需计算并缓存，每个字符折叠后仍是一个字符）"""
+
+    def __missing__(self, code):
+        char = chr(code)
+        folded = _FOLD_SPECIAL.get(char)
+        if folded is None:
+            # 先转大写再转小写，ſ/ı/ς 等会与 s/i/σ 折叠到一起
+            upper = char.upper()
+            folded = upper.lower() if len(upper) == 1 else ''
+            if len(folded) != 1:
+                folded = char.lower()
+            if len(folded) != 1:
+                folded = char
+        self[code] = folded
+        return folded
+
+
+_fold_table = _CaseFoldTable()
+
+
+def fold_case(text):
+    """大小写折叠：与 re.IGNORECASE 认为相等的字符折叠为同一个字符，长度不变"""
+    return text.translate(_fold_table)
+
+
+def _is_word_char(char):
+    """与正则 \\w 相同（Unicode：字母、数字、下划线，中文也算）"""
+    return char.isalnum() or char == '_'
+
+
+def is_word_boundary(text, position):
+    """position 处是否为单词边界（与正则 \\b 相同）"""
+    before = position > 0 and _is_word_char(text[position - 1])
+    after = position < len(text) and _is_word_char(text[position])
+    return before != after
+
+
+class AhoCorasick:
+    """Aho-Corasick多关键词匹配"""
+
+    def __init__(self, keywords, ignore_case=False, whole_word=False):
+        """构建自动机
+
+        Args:
+            keywords: 关键词列表（结果用列表中的序号表示，重复的关键词各自计数）
+            ignore_case: 不区分大小写
+            whole_word: 只匹配整词（关键词前后是单词边界）
+        """
+        self.keywords = list(keywords)
+        self.ignore_case = ignore_case
+        self.whole_word = whole_word
+
+        self._goto = [{}]    # 每个状态的转移 {字符: 状态}
+        self._fail = [0]     # 失败指针
+        self._output = [()]  # 到达该状态时匹配到的关键词序号
+        self._lengths = []
+        self._empty = []     # 空关键词的序号
+
+        for index, keyword in enumerate(self.keywords):
+            pattern = fold_case(keyword) if ignore_case else keyword
+            self._lengths.append(len(pattern))
+            if not pattern:
+                self._empty.append(index)
+                continue
+            self._add(pattern, index)
+        self._build_failure_links()
+
+        # 自动机处于初始状态时，用正则直接跳到下一个可能开始匹配的字符
+        first_chars = sorted(self._goto[0])
+        self._start_re = re.compile('[' + ''.join(re.escape(char) for char in first_chars) + ']') \
+            if first_chars else None
+
+    def _add(self, pattern, index):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] += (index,)
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def iter_matches(self, text):
+        """逐个产出关键词出现的位置（不检查整词）
+
+        Yields:
+            (结束位置, 关键词序号)，开始位置 = 结束位置 - len(关键词)
+        """
+        if self._start_re is None:
+            return
+        if self.ignore_case:
+            text = fold_case(text)
+
+        goto, fail, output = self._goto, self._fail, self._output
+        search_start = self._start_re.search
+        position, length, state = 0, len(text), 0
+        while position < length:
+            if not state:
+                match = search_start(text, position)
+                if match is None:
+                    return
+                position = match.start()
+            char = text[position]
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            position += 1
+            for index in output[state]:
+                yield position, index
+
+    def search(self, text, limit=None):
+        """找出文本中出现的关键词
+
+        Args:
+            limit: 找到这么多个关键词后就停止扫描（只需要判断数量时使用）
+
+        Returns:
+            出现的关键词序号列表（按关键词列表中的顺序）
+        """
+        limit = len(self.keywords) if limit is None else limit
+        found = set()
+        if self._empty and (not self.whole_word or any(is_word_boundary(text, p) for p in range(len(text) + 1))):
+            found.update(self._empty[:limit])
+            if len(found) >= limit:
+                return sorted(found)
+
+        for end, index in self.iter_matches(text):
+            if index in found:
+                continue
+            if self.whole_word and not (is_word_boundary(text, end - self._lengths[index])
+                                        and is_word_boundary(text, end)):
+                continue
+            found.add(index)
+            if len(found) >= limit:
+                break
+        return sorted(found)
+
+    def find_keywords(self, text):
+        """找出文本中出现的关键词（按关键词列表中的顺序）"""
+        return [self.keywords[index] for index in self.search(text)]
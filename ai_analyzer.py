@@ -4,10 +4,15 @@ AI分析器模块 - V5.0
 """
 import logging
 import json
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
 from ai_cache import AICache
+from ai_retry import backoff_delay, classify_error
 from context_builder import ContextBuilder
+from rate_limiter import TokenBucketLimiter
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +41,21 @@ class AIAnalyzer:
         self.context_builder = ContextBuilder()  # V5.0：上下文构建器
         self.api_calls = 0  # API调用计数
         self.cache_hits = 0  # 缓存命中计数
+        self._stats_lock = threading.Lock()  # V6.1：并发分析时保护计数
+        
+        # V6.1：并发分析（线程数）和限流（每分钟请求数/token数，0 表示不限制），结果顺序不变
+        self.max_concurrency = max(1, config.get('max_concurrency', 1))
+        self.rate_limiter = TokenBucketLimiter(
+            requests_per_minute=config.get('requests_per_minute', 120),
+            tokens_per_minute=config.get('tokens_per_minute', 0)
+        )
+        
+        # V6.1：限流/服务器错误/超时时重试（优先按Retry-After等待，否则指数退避），认证失败等永久错误不重试
+        self.max_retries = config.get('max_retries', 4)
+        self.retry_base_delay = config.get('retry_base_delay', 2)
+        self.retry_max_delay = config.get('retry_max_delay', 60)
+        self.request_timeout = config.get('request_timeout', 60)
+        self.retries = 0  # 重试计数
         
         if self.enabled and self.api_key:
             self._initialize_client()
@@ -45,7 +65,8 @@ class AIAnalyzer:
         try:
             if self.provider == 'openai':
                 import openai
-                self.client = openai.OpenAI(api_key=self.api_key)
+                # 重试由 _call_with_retry 负责（同时调整共享限流器），关闭SDK自带的重试
+                self.client = openai.OpenAI(api_key=self.api_key, max_retries=0, timeout=self.request_timeout)
                 logger.info(f"✅ OpenAI客户端初始化成功 (模型: {self.model})")
             elif self.provider == 'gemini':
                 import google.generativeai as genai
@@ -85,12 +106,14 @@ class AIAnalyzer:
             # 先查缓存
             cached_analysis = self.cache.get(email_id, subject, body)
             if cached_analysis:
-                self.cache_hits += 1
+                with self._stats_lock:
+                    self.cache_hits += 1
                 logger.info(f"        → 使用缓存 ✓")
                 return cached_analysis
             
             # 缓存未命中，调用AI
-            self.api_calls += 1
+            with self._stats_lock:
+                self.api_calls += 1
             
             # 根据发件人类型显示不同的提示
             if sender_type == 'customer':
@@ -106,11 +129,11 @@ class AIAnalyzer:
             # 构建提示词（传入类型和上下文）
             prompt = self._build_prompt(sender_name, subject, body, sender_type, context_data)
             
-            # 调用AI
+            # 调用AI（V6.1：限流 + 重试）
             if self.provider == 'openai':
-                result = self._call_openai(prompt)
+                result = self._call_with_retry(self._call_openai, prompt)
             elif self.provider == 'gemini':
-                result = self._call_gemini(prompt)
+                result = self._call_with_retry(self._call_gemini, prompt)
             else:
                 return None
             
@@ -118,9 +141,6 @@ class AIAnalyzer:
             logger.info(f"        → AI响应成功 ✓")
             analysis = self._parse_result(result)
             
-            # 保存到缓存
-            self.cache.set(email_id, subject, body, analysis)
-            
             # V5.0：添加检测到的项目信息
             if context_data and context_data.get('detected_projects'):
                 analysis['detected_projects'] = context_data['detected_projects']
@@ -129,6 +149,9 @@ class AIAnalyzer:
             if context_data and context_data.get('keyword_result'):
                 analysis['keyword_result'] = context_data['keyword_result']
             
+            # 保存到缓存（V6.1：补充完信息后再保存，保存后不再修改，避免其他线程写缓存文件时内容变化）
+            self.cache.set(email_id, subject, body, analysis)
+            
             return analysis
             
         except Exception as e:
@@ -235,6 +258,40 @@ class AIAnalyzer:
 """
         return prompt
     
+    def _call_with_retry(self, call, prompt):
+        """V6.1：限流后调用AI接口，暂时性错误按 Retry-After 或指数退避重试
+        
+        服务器返回限流（429）时通知限流器暂停并降低所有线程的速率
+        """
+        # 预计token数 = 提示词 + 最大输出
+        tokens = TokenBucketLimiter.estimate_tokens(prompt) + self.max_tokens
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire(tokens)
+            try:
+                result = call(prompt)
+                self.rate_limiter.record_success()
+                return result
+            except Exception as e:
+                retryable, rate_limited, retry_after = classify_error(e)
+                if not retryable or attempt >= self.max_retries:
+                    if retryable:
+                        logger.error(f"        → 重试 {attempt} 次后仍失败，放弃")
+                    raise
+                
+                if retry_after is not None:
+                    retry_after = min(retry_after, self.retry_max_delay)
+                if rate_limited:
+                    self.rate_limiter.slow_down(retry_after)
+                delay = retry_after if retry_after is not None else backoff_delay(
+                    attempt, self.retry_base_delay, self.retry_max_delay)
+                attempt += 1
+                with self._stats_lock:
+                    self.retries += 1
+                logger.warning(f"        → {'接口限流' if rate_limited else '暂时性错误'}，"
+                               f"{delay:.1f} 秒后第 {attempt}/{self.max_retries} 次重试")
+                time.sleep(delay)
+    
     def _call_openai(self, prompt):
         """调用OpenAI API"""
         try:
@@ -309,45 +366,134 @@ class AIAnalyzer:
         logger.info(f"开始AI分析 {len(emails)} 封邮件...")
         logger.info(f"提示：AI分析需要一些时间，请耐心等待...")
         
+        analyzed_emails, success_count = self._analyze_items(emails, sender_type_map, len(emails))
+        
+        logger.info(f"✅ AI分析完成: {success_count}/{len(emails)} 封成功")
+        logger.info(f"   API调用: {self.api_calls} 次 | 缓存命中: {self.cache_hits} 次 | 重试: {self.retries} 次")
+        
+        # 显示成本
+        if self.api_calls > 0:
+            actual_cost = self.get_cost_estimate(self.api_calls)
+            logger.info(f"   预估成本: ${actual_cost:.4f}")
+        
+        return analyzed_emails
+    
+    def _analyze_item(self, email_item, sender_type_map, progress):
+        """分析单封邮件，结果写入 email_item['ai_analysis']，成功返回True"""
+        try:
+            # 更详细的进度显示
+            subject = email_item.get('subject', 'unknown')[:30]
+            logger.info(f"  [{progress}] 正在分析: {subject}")
+            
+            # 确定发件人类型
+            sender_email = email_item.get('from_email', '')
+            sender_type = 'normal'
+            if sender_type_map:
+                sender_type = sender_type_map.get(sender_email, 'normal')
+            
+            # 调用AI分析（传入类型；V6.1：限流由 rate_limiter 负责，不再固定等待）
+            analysis = self.analyze_email(email_item, sender_type)
+            email_item['ai_analysis'] = analysis or None
+            
+            return bool(analysis)
+            
+        except Exception as e:
+            logger.error(f"分析第{progress}封邮件失败: {str(e)}")
+            email_item['ai_analysis'] = None
+            return False
+    
+    def _analyze_items(self, email_iter, sender_type_map, total=None):
+        """V6.1：逐封或并发分析邮件（max_concurrency > 1 时使用线程池），返回顺序与输入顺序相同
+        
+        Returns:
+            (邮件列表, 成功数量)
+        """
         analyzed_emails = []
-        success_count = 0
         
-        for i, email_item in enumerate(emails, 1):
-            try:
-                # 更详细的进度显示
-                subject = email_item.get('subject', 'unknown')[:30]
-                logger.info(f"  [{i}/{len(emails)}] 正在分析: {subject}")
-                
-                # 确定发件人类型
-                sender_email = email_item.get('from_email', '')
-                sender_type = 'normal'
-                if sender_type_map:
-                    sender_type = sender_type_map.get(sender_email, 'normal')
-                
-                # 调用AI分析（传入类型）
-                analysis = self.analyze_email(email_item, sender_type)
-                
-                if analysis:
-                    email_item['ai_analysis'] = analysis
+        def progress(index):
+            return f"{index}/{total}" if total is not None else str(index)
+        
+        if self.max_concurrency <= 1:
+            success_count = 0
+            for i, email_item in enumerate(email_iter, 1):
+                if self._analyze_item(email_item, sender_type_map, progress(i)):
                     success_count += 1
-                else:
-                    email_item['ai_analysis'] = None
-                
                 analyzed_emails.append(email_item)
-                
-                # 添加延迟，避免API限流
-                time.sleep(0.5)
-                
-            except Exception as e:
-                logger.error(f"分析第{i}封邮件失败: {str(e)}")
-                email_item['ai_analysis'] = None
+            return analyzed_emails, success_count
+        
+        logger.info(f"   并发分析: {self.max_concurrency} 个线程 | 限流: "
+                    f"{self.rate_limiter.requests_per_minute or '不限'} 次/分钟, "
+                    f"{self.rate_limiter.tokens_per_minute or '不限'} token/分钟")
+        
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="ai-analyze") as executor:
+            futures = []
+            for i, email_item in enumerate(email_iter, 1):
+                futures.append(executor.submit(self._analyze_item, email_item, sender_type_map, progress(i)))
                 analyzed_emails.append(email_item)
-                continue
+            success_count = sum(1 for future in futures if future.result())
         
-        logger.info(f"✅ AI分析完成: {success_count}/{len(emails)} 封成功")
-        logger.info(f"   API调用: {self.api_calls} 次 | 缓存命中: {self.cache_hits} 次")
+        if self.rate_limiter.waited:
+            logger.info(f"   限流等待: 共 {self.rate_limiter.waited:.1f} 秒")
+        return analyzed_emails, success_count
+    
+    def analyze_emails_stream(self, email_iter, sender_type_map=None, prefetch=100):
+        """边获取边分析邮件（V6.1）
+        
+        后台线程从 email_iter（如 EmailClient.iter_emails_from_senders）读取邮件放入队列，
+        主线程逐封分析，网络下载和AI调用同时进行。
+        
+        Args:
+            email_iter: 邮件迭代器
+            sender_type_map: 发件人类型映射 {email: type}
+            prefetch: 队列中最多缓存的未分析邮件数
+            
+        Returns:
+            带有AI分析的邮件列表（按获取顺序；获取中途出错时为出错前已获取的部分）
+        """
+        if not self.is_available():
+            logger.warning("AI功能未启用，跳过AI分析")
+            return list(email_iter)
+        
+        logger.info("开始获取并AI分析邮件（边获取边分析）...")
+        
+        email_queue = queue.Queue(maxsize=max(1, prefetch))
+        done = object()
+        
+        def produce():
+            try:
+                for email_item in email_iter:
+                    email_queue.put(email_item)
+            except Exception as e:
+                email_queue.put(e)
+            finally:
+                email_queue.put(done)
+        
+        producer = threading.Thread(target=produce, name="email-fetch", daemon=True)
+        producer.start()
+        
+        error = None
+        
+        def consume():
+            nonlocal error
+            while True:
+                email_item = email_queue.get()
+                if email_item is done:
+                    return
+                if isinstance(email_item, Exception):
+                    error = email_item
+                    continue
+                yield email_item
+        
+        analyzed_emails, success_count = self._analyze_items(consume(), sender_type_map)
+        
+        producer.join()
+        if error is not None:
+            # 已获取的邮件照常返回，不因获取中断丢掉已完成的分析
+            logger.error(f"获取邮件中断，只返回已分析的 {len(analyzed_emails)} 封: {str(error)}")
+        
+        logger.info(f"✅ AI分析完成: {success_count}/{len(analyzed_emails)} 封成功")
+        logger.info(f"   API调用: {self.api_calls} 次 | 缓存命中: {self.cache_hits} 次 | 重试: {self.retries} 次")
         
-        # 显示成本
         if self.api_calls > 0:
             actual_cost = self.get_cost_estimate(self.api_calls)
             logger.info(f"   预估成本: ${actual_cost:.4f}")
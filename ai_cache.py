@@ -5,6 +5,7 @@ AI分析缓存模块 - 节省成本
 import json
 import os
 import hashlib
+import threading
 from datetime import datetime, timedelta
 import logging
 
@@ -25,6 +26,7 @@ class AICache:
         self.cache_days = cache_days
         self.cache_file = os.path.join(cache_dir, 'analysis_cache.json')
         self.cache_data = {}
+        self._lock = threading.RLock()  # V6.1：并发分析时多个线程同时读写缓存
         
         # 创建缓存目录
         if not os.path.exists(cache_dir):
@@ -62,7 +64,7 @@ class AICache:
     def _save_cache(self):
         """保存缓存数据"""
         try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
+            with self._lock, open(self.cache_file, 'w', encoding='utf-8') as f:
                 json.dump(self.cache_data, f, ensure_ascii=False, indent=2)
             logger.debug("缓存已保存")
         except Exception as e:
@@ -97,9 +99,10 @@ class AICache:
         """
         key = self._generate_key(email_id, subject, body)
         
-        if key in self.cache_data:
-            logger.debug(f"缓存命中: {email_id}")
-            return self.cache_data[key].get('analysis')
+        with self._lock:
+            if key in self.cache_data:
+                logger.debug(f"缓存命中: {email_id}")
+                return self.cache_data[key].get('analysis')
         
         return None
     
@@ -107,14 +110,15 @@ class AICache:
         """保存分析结果到缓存"""
         key = self._generate_key(email_id, subject, body)
         
-        self.cache_data[key] = {
-            'email_id': email_id,
-            'subject': subject[:100],
-            'analysis': analysis,
-            'cached_at': datetime.now().isoformat()
-        }
-        
-        self._save_cache()
+        with self._lock:
+            self.cache_data[key] = {
+                'email_id': email_id,
+                'subject': subject[:100],
+                'analysis': analysis,
+                'cached_at': datetime.now().isoformat()
+            }
+            
+            self._save_cache()
         logger.debug(f"缓存已保存: {email_id}")
     
     def get_stats(self):
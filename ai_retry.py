@@ -0,0 +1,81 @@
+"""
+AI接口重试模块 - V6.1
+区分可重试错误（限流429、服务器5xx、超时、连接错误）和永久错误（认证失败、请求无效、额度用完），
+可重试时优先按服务器的 Retry-After 等待，否则按带随机抖动的指数退避等待
+"""
+import random
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 类名中包含这些词的异常视为暂时性错误（openai / google-api-core 的超时和连接异常）
+_TRANSIENT_NAMES = ('Timeout', 'Connection', 'DeadlineExceeded', 'ServiceUnavailable', 'ResourceExhausted',
+                    'TooManyRequests', 'InternalServerError')
+
+# 返回429但重试也不会成功的错误（额度用完）
+_PERMANENT_CODES = ('insufficient_quota',)
+
+
+def get_status_code(error):
+    """从异常中取HTTP状态码（openai 为 status_code，google-api-core 为 code），没有时返回None"""
+    status = getattr(error, 'status_code', None)
+    if isinstance(status, int):
+        return status
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return int(code)
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status if isinstance(status, int) else None
+
+
+def get_retry_after(error):
+    """从异常的响应头中取服务器要求等待的秒数（Retry-After / retry-after-ms），没有时返回None"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        value = headers.get('retry-after-ms')
+        if value:
+            return max(0.0, float(value) / 1000)
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            retry_at = parsedate_to_datetime(value)
+            return max(0.0, (retry_at - datetime.now(retry_at.tzinfo)).total_seconds())
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def classify_error(error):
+    """判断AI接口异常是否可以重试
+
+    Returns:
+        (是否可重试, 是否为限流, Retry-After秒数或None)
+    """
+    if getattr(error, 'code', None) in _PERMANENT_CODES:
+        return False, False, None
+
+    status = get_status_code(error)
+    if status is not None:
+        rate_limited = status == 429
+        retryable = rate_limited or status == 408 or status >= 500
+        return retryable, rate_limited, get_retry_after(error) if retryable else None
+
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True, False, None
+    names = [cls.__name__ for cls in type(error).__mro__]
+    rate_limited = any(name in ('ResourceExhausted', 'TooManyRequests', 'RateLimitError') for name in names)
+    if rate_limited or any(word in name for name in names for word in _TRANSIENT_NAMES):
+        return True, rate_limited, get_retry_after(error)
+    return False, False, None
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=60.0):
+    """第 attempt 次重试（从0开始）前的等待秒数：指数退避，后一半随机抖动，避免多个线程同时重试"""
+    delay = min(max_delay, base_delay * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+ContentCleaner 基准测试 - V6.1
+1. 用 benchmarks/content_cleaner_golden.json 校验输出与基准完全一致
+2. 测量 clean_email_body 的吞吐量（封/秒、MB/秒）
+
+用法: python benchmark_content_cleaner.py [重复轮数，默认20]
+"""
+import json
+import os
+import sys
+import time
+from content_cleaner import ContentCleaner
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'content_cleaner_golden.json')
+CHECKED_METHODS = ('clean_email_body', 'remove_conversation_history', 'remove_reply_headers')
+
+
+def check_golden(cleaner, cases):
+    """校验输出与基准一致，返回不一致的数量"""
+    mismatches = 0
+    for index, case in enumerate(cases):
+        for method in CHECKED_METHODS:
+            output = getattr(cleaner, method)(case['input'])
+            if output != case[method]:
+                mismatches += 1
+                print(f"❌ 第 {index} 条 {method} 输出不一致")
+                print(f"   输入: {case['input'][:100]!r}")
+                print(f"   期望: {case[method][:100]!r}")
+                print(f"   实际: {output[:100]!r}")
+    return mismatches
+
+
+def benchmark(cleaner, bodies, rounds):
+    """测量 clean_email_body 的吞吐量"""
+    total_bytes = sum(len(body.encode('utf-8')) for body in bodies) * rounds
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for body in bodies:
+            cleaner.clean_email_body(body)
+    elapsed = time.perf_counter() - started
+    return len(bodies) * rounds / elapsed, total_bytes / elapsed / 1024 / 1024, elapsed
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    with open(GOLDEN_FILE, 'r', encoding='utf-8') as f:
+        cases = json.load(f)['cases']
+
+    cleaner = ContentCleaner()
+
+    print("=" * 60)
+    print(f"校验基准输出（{len(cases)} 条）...")
+    mismatches = check_golden(cleaner, cases)
+    if mismatches:
+        print(f"❌ {mismatches} 处输出与基准不一致")
+        sys.exit(1)
+    print("✅ 输出与基准完全一致")
+
+    print("=" * 60)
+    bodies = [case['input'] for case in cases]
+    emails_per_second, mb_per_second, elapsed = benchmark(cleaner, bodies, rounds)
+    print(f"吞吐量测试: {len(bodies)} 封 × {rounds} 轮，耗时 {elapsed:.2f} 秒")
+    print(f"   {emails_per_second:,.0f} 封/秒 | {mb_per_second:.2f} MB/秒")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+正文缓存模块 - V6.1
+按 原始正文字节 + 清理规则版本 的哈希缓存清理后的正文（SQLite），
+检查窗口内的邮件每天都会被重新获取，命中缓存时不再重新解码和清理
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BodyCache:
+    """清理后正文的持久缓存（SQLite）"""
+
+    def __init__(self, db_path='data/body_cache.db', cache_days=30, batch_size=200):
+        """初始化正文缓存
+
+        Args:
+            db_path: SQLite数据库文件路径
+            cache_days: 超过该天数未被使用的缓存会被删除
+            batch_size: 新写入的缓存积累到该数量时写入数据库
+        """
+        self.db_path = db_path
+        self.cache_days = cache_days
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending = {}     # 待写入的缓存 {键: 正文}
+        self._touched = set()  # 命中过、待更新使用时间的键
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+            logger.info(f"创建正文缓存目录: {db_dir}")
+
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._init_schema()
+        self._clean_expired()
+
+    def _init_schema(self):
+        """创建表结构"""
+        with self._lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS cleaned_bodies (
+                    key TEXT PRIMARY KEY,
+                    body TEXT NOT NULL,
+                    used_at REAL NOT NULL
+                )
+            """)
+
+    def _clean_expired(self):
+        """删除长期未使用的缓存"""
+        with self._lock, self.conn:
+            cursor = self.conn.execute("DELETE FROM cleaned_bodies WHERE used_at < ?",
+                                       (time.time() - self.cache_days * 86400,))
+        if cursor.rowcount:
+            logger.info(f"清理过期正文缓存: {cursor.rowcount} 条")
+
+    @staticmethod
+    def make_key(raw, *salt):
+        """生成缓存键
+
+        Args:
+            raw: 原始正文字节（整封邮件或单独获取的正文部分）
+            salt: 影响清理结果的其他因素（清理规则版本、截断长度、字符集等）
+        """
+        digest = hashlib.sha256(repr(salt).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(raw)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """获取缓存的正文，没有时返回None"""
+        with self._lock:
+            body = self._pending.get(key)
+            if body is None:
+                row = self.conn.execute("SELECT body FROM cleaned_bodies WHERE key = ?", (key,)).fetchone()
+                body = row[0] if row else None
+                if body is not None:
+                    self._touched.add(key)
+            if body is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return body
+
+    def set(self, key, body):
+        """写入缓存（积累到 batch_size 条时统一写入数据库）"""
+        with self._lock:
+            self._pending[key] = body
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self):
+        """把积累的缓存和使用时间写入数据库"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending and not self._touched:
+            return
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO cleaned_bodies (key, body, used_at) VALUES (?, ?, ?)",
+                [(key, body, now) for key, body in self._pending.items()])
+            self.conn.executemany("UPDATE cleaned_bodies SET used_at = ? WHERE key = ?",
+                                  [(now, key) for key in self._touched])
+        self._pending = {}
+        self._touched = set()
+
+    def get_stats(self):
+        """获取缓存统计信息"""
+        with self._lock:
+            total = self.conn.execute("SELECT COUNT(*) FROM cleaned_bodies").fetchone()[0]
+        return {
+            'total': total + len(self._pending),
+            'hits': self.hits,
+            'misses': self.misses,
+            'cache_file': self.db_path
+        }
+
+    def close(self):
+        """写入剩余缓存并关闭数据库连接"""
+        self.flush()
+        with self._lock:
+            self.conn.close()
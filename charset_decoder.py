@@ -0,0 +1,101 @@
+"""
+字符集解码模块 - V6.1
+邮件声明的字符集缺失或错误时，不再按 utf-8 + errors='ignore' 丢掉中文：
+依次尝试 声明的字符集 → UTF-8 → GB18030（GBK/GB2312的超集），
+纯ASCII内容（且声明的字符集兼容ASCII）直接返回，其他情况通常一次严格解码即可成功
+"""
+import codecs
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Python不认识的常见别名
+_ALIASES = {
+    'x-gbk': 'gbk',
+    'gb_2312-80': 'gb2312',
+    'x-gb2312': 'gb2312',
+    'x-euc-cn': 'gb2312',
+    'gb-2312': 'gb2312',
+    'x-mac-chinesesimp': 'gb2312',
+    'utf8': 'utf-8',
+    'unicode-1-1-utf-8': 'utf-8',
+}
+
+# 声明为GB2312/GBK的邮件常包含超出其范围的字符，统一按超集GB18030解码
+_GB_FAMILY = {'gb2312', 'gbk', 'gb18030'}
+
+# 单字节字符集解码永远不会失败，部分旧客户端把中文邮件标为这些字符集
+_SINGLE_BYTE = {'ascii', 'iso8859-1', 'cp1252'}
+
+# 这些字符集用转义序列表示非ASCII字符（ISO-2022-JP、HZ、UTF-7）或每个字符占多个字节（UTF-16/32），
+# 编码后的字节可能全是ASCII，必须按声明的字符集解码
+_NON_ASCII_COMPATIBLE = ('iso2022', 'hz', 'utf-7', 'utf-16', 'utf-32')
+
+def normalize_charset(charset):
+    """规范化字符集名称，无法识别时返回None"""
+    if not charset:
+        return None
+    name = str(charset).strip().strip('"\'').lower()
+    name = _ALIASES.get(name, name)
+    try:
+        name = codecs.lookup(name).name
+    except LookupError:
+        return None
+    return 'gb18030' if name in _GB_FAMILY else name
+
+
+def _try_decode(data, charset, final):
+    """严格解码，失败时返回None（final为False时忽略末尾被截断的不完整字符）"""
+    try:
+        if final:
+            return data.decode(charset)
+        return codecs.getincrementaldecoder(charset)().decode(data, final=False)
+    except (UnicodeDecodeError, LookupError):
+        return None
+
+
+class CharsetDecoder:
+    """邮件正文/邮件头字节解码"""
+
+    # 解码规则版本，修改规则后需要更新（正文缓存按版本失效）
+    VERSION = '6.1.2'
+
+    def _candidates(self, declared):
+        """按优先级排列要尝试的字符集"""
+        candidates = []
+        if declared in _SINGLE_BYTE:
+            # 标为单字节字符集的非ASCII内容先确认是否为UTF-8
+            candidates.append('utf-8')
+        if declared:
+            candidates.append(declared)
+
+        # 有效的UTF-8几乎不可能是GBK文本，反过来UTF-8文本却常能按GB18030解码成乱码，所以UTF-8在前
+        candidates.extend(('utf-8', 'gb18030'))
+        return list(dict.fromkeys(candidates))
+
+    def decode(self, data, charset=None, final=True):
+        """把字节解码为字符串
+
+        Args:
+            data: 字节
+            charset: 声明的字符集（可选）
+            final: 数据是否完整（部分获取被截断时为False，末尾不完整的字符会被丢弃）
+
+        Returns:
+            字符串（所有字符集都无法严格解码时，按第一个候选字符集解码并替换无法识别的字节）
+        """
+        if not data:
+            return ""
+        declared = normalize_charset(charset)
+        if data.isascii() and not (declared and declared.startswith(_NON_ASCII_COMPATIBLE)):
+            return data.decode('ascii')
+
+        candidates = self._candidates(declared)
+        for candidate in candidates:
+            text = _try_decode(data, candidate, final)
+            if text is not None:
+                if declared and candidate != declared:
+                    logger.debug(f"内容与声明的字符集 {charset} 不符，按 {candidate} 解码")
+                return text
+
+        return data.decode(candidates[0], errors='replace')
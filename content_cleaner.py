@@ -1,8 +1,10 @@
 """
 邮件内容清理模块 - 去除签名等无关信息
+V6.1：所有规则预编译，每类标记合并为一个正则，截断历史对话、识别签名和整理空白在一次遍历中完成
 """
 import re
 import logging
+from aho_corasick import AhoCorasick
 
 logger = logging.getLogger(__name__)
 
@@ -10,6 +12,9 @@ logger = logging.getLogger(__name__)
 class ContentCleaner:
     """邮件内容清理器"""
     
+    # V6.1：清理规则版本，修改规则后需要更新（正文缓存按版本失效）
+    VERSION = '6.1.1'
+    
     def __init__(self):
         # 常见的签名分隔符
         self.signature_patterns = [
@@ -53,12 +58,46 @@ class ContentCleaner:
             r'^>\s*',  # 引用符号
         ]
         
+        # 历史对话开始标记（前两类不区分大小写）
+        self.history_markers = [
+            r'(?i:-+\s*(原始邮件|转发邮件|回复|答复)\s*-+)',
+            r'(?i:-+\s*(Original Message|Forwarded Message|Reply|From)\s*-+)',
+            r'(在.{1,50}写道|On.{1,50}wrote)[：:]',
+            r'(发件人|From|发送时间|Sent|收件人|To|主题|Subject)[：:]',  # 邮件头部字段（连续出现表示是历史记录）
+        ]
+        
         # HTML标签
         self.html_pattern = re.compile(r'<[^>]+>')
+        
+        # V6.1：每类标记预编译为一个正则
+        self.history_re = re.compile('^(?:' + '|'.join(self.history_markers) + ')')
+        self.signature_re = re.compile('|'.join(self.signature_patterns))
+        self.reply_re = re.compile('|'.join(self.reply_markers), re.IGNORECASE)
+        self.reply_header_re = re.compile(r'^(发件人|From|发送时间|Sent)[:：]', re.IGNORECASE)
+        # 签名关键词自动机：一次扫描找出一行中出现的所有关键词
+        self.keyword_matcher = AhoCorasick(self.signature_keywords)
+        self.contact_line_re = re.compile(
+            r'^(Tel|电话|手机|Mobile)[：:：\s]*[\d\s\-\+]+$'   # 单独的电话号码
+            r'|^(E-?mail)[：:：\s]*[\w\.-]+@[\w\.-]+$'          # 单独的邮箱
+            r'|^[\d\s\-\+\(\)]{10,}$',                          # 纯数字（可能是电话或邮编）
+            re.IGNORECASE
+        )
+        self.phone_re = re.compile(
+            r'\d{3,4}[-\s]?\d{7,8}'   # 固定电话
+            r'|1[3-9]\d{9}'            # 手机号
+            r'|\+86[-\s]?\d+'          # 国际号码
+            r'|\d{11}'                 # 11位数字（手机号）
+        )
+        self.email_address_re = re.compile(r'[\w\.-]+@[\w\.-]+\.\w+')
+        self.email_keyword_re = re.compile(r'E-?mail', re.IGNORECASE)
+        self.postcode_re = re.compile(r'(邮编|邮政编码|Zip|Post)[：:：\s]*\d{6}', re.IGNORECASE)
+        self.address_re = re.compile(r'(地址|Address)[：:：]', re.IGNORECASE)
     
     def clean_email_body(self, body):
         """清理邮件正文，去除签名等无关信息（V3.0增强版）
         
+        V6.1：截断历史对话、识别签名和整理空白在一次遍历中完成，结果与逐步处理相同
+        
         Args:
             body: 原始邮件正文
             
@@ -71,68 +110,49 @@ class ContentCleaner:
         # 1. 去除HTML标签
         body = self.html_pattern.sub('', body)
         
-        # 2. 检测并移除历史对话（最重要）
-        body = self.remove_conversation_history(body)
-        
-        # 3. 按行处理，移除签名
-        lines = body.split('\n')
+        # 2. 逐行处理：遇到历史对话或签名时截断，后续内容全部忽略
         cleaned_lines = []
-        found_signature = False
         
-        for i, line in enumerate(lines):
-            original_line = line
+        for line in body.split('\n'):
             line = line.strip()
             
-            # 如果已经找到签名，后续内容全部忽略
-            if found_signature:
-                break
-            
-            # 跳过空行（但记录）
+            # 空行：不保留开头的空行，连续空行只保留一个
             if not line:
-                if cleaned_lines:  # 不在开头的空行保留
+                if cleaned_lines and cleaned_lines[-1]:
                     cleaned_lines.append('')
                 continue
             
-            # 检测签名分隔符
-            for pattern in self.signature_patterns:
-                if re.search(pattern, line):
-                    found_signature = True
-                    break
-            
-            if found_signature:
-                break
-            
-            # 检测回复/转发标记
-            is_reply_marker = False
-            for pattern in self.reply_markers:
-                if re.search(pattern, line, re.IGNORECASE):
-                    found_signature = True
-                    is_reply_marker = True
-                    break
-            
-            if is_reply_marker:
-                break
-            
-            # 检测签名关键词（如果一行中包含2个以上签名关键词，可能是签名）
-            keyword_count = sum(1 for keyword in self.signature_keywords if keyword in line)
-            if keyword_count >= 2:
-                # 检查是否包含联系方式模式
-                if self.contains_contact_info(line):
-                    found_signature = True
-                    break
-            
-            # 单独的邮箱地址或电话号码也可能是签名
-            if self.is_contact_line(line):
-                found_signature = True
+            if self.is_signature_line(line):
                 break
             
             cleaned_lines.append(line)
         
-        # 4. 去除多余的空白
-        result = '\n'.join(cleaned_lines)
-        result = self.clean_whitespace(result)
+        # 3. 去除结尾的空行
+        while cleaned_lines and not cleaned_lines[-1]:
+            cleaned_lines.pop()
         
-        return result
+        return '\n'.join(cleaned_lines)
+    
+    def is_signature_line(self, line):
+        """判断（已去除首尾空白的）一行是否为历史对话或签名的开始"""
+        # 历史对话开始标记（最重要）
+        if self.history_re.search(line):
+            return True
+        
+        # 签名分隔符
+        if self.signature_re.search(line):
+            return True
+        
+        # 回复/转发标记
+        if self.reply_re.search(line):
+            return True
+        
+        # 签名关键词（如果一行中包含2个以上签名关键词，并且包含联系方式，可能是签名）
+        if len(self.keyword_matcher.search(line, limit=2)) >= 2 and self.contains_contact_info(line):
+            return True
+        
+        # 单独的邮箱地址或电话号码也可能是签名
+        return self.is_contact_line(line)
     
     def remove_conversation_history(self, text):
         """移除邮件对话历史
@@ -143,80 +163,38 @@ class ContentCleaner:
         clean_lines = []
         
         for line in lines:
-            line_stripped = line.strip()
-            
-            # 检测历史对话开始标记
-            is_history_start = False
-            
-            # 中文标记
-            if re.search(r'^-+\s*(原始邮件|转发邮件|回复|答复)\s*-+', line_stripped, re.IGNORECASE):
-                is_history_start = True
-            
-            # 英文标记
-            if re.search(r'^-+\s*(Original Message|Forwarded Message|Reply|From)\s*-+', line_stripped, re.IGNORECASE):
-                is_history_start = True
-            
-            # "在...写道:" 或 "On...wrote:"
-            if re.search(r'^(在.{1,50}写道|On.{1,50}wrote)[：:]', line_stripped):
-                is_history_start = True
-            
-            # 邮件头部字段（连续出现表示是历史记录）
-            if re.search(r'^(发件人|From|发送时间|Sent|收件人|To|主题|Subject)[：:]', line_stripped):
-                is_history_start = True
-            
-            if is_history_start:
-                # 找到历史记录开始，后续内容全部丢弃
+            # 找到历史记录开始，后续内容全部丢弃
+            if self.history_re.search(line.strip()):
                 break
-            
             clean_lines.append(line)
         
         return '\n'.join(clean_lines)
     
     def is_contact_line(self, text):
         """判断是否是单独的联系方式行"""
-        # 单独的电话号码
-        if re.match(r'^(Tel|电话|手机|Mobile)[：:：\s]*[\d\s\-\+]+$', text, re.IGNORECASE):
-            return True
-        
-        # 单独的邮箱
-        if re.match(r'^(E-?mail)[：:：\s]*[\w\.-]+@[\w\.-]+$', text, re.IGNORECASE):
-            return True
-        
-        # 纯数字（可能是电话或邮编）
-        if re.match(r'^[\d\s\-\+\(\)]{10,}$', text):
-            return True
-        
-        return False
+        return self.contact_line_re.match(text) is not None
     
     def contains_contact_info(self, text):
         """检查文本是否包含联系方式信息"""
         # 电话号码模式
-        phone_patterns = [
-            r'\d{3,4}[-\s]?\d{7,8}',  # 固定电话
-            r'1[3-9]\d{9}',            # 手机号
-            r'\+86[-\s]?\d+',          # 国际号码
-            r'\d{11}',                 # 11位数字（手机号）
-        ]
-        
-        for pattern in phone_patterns:
-            if re.search(pattern, text):
-                return True
+        if self.phone_re.search(text):
+            return True
         
         # 邮箱地址（在签名上下文中）
-        if re.search(r'[\w\.-]+@[\w\.-]+\.\w+', text):
+        if self.email_address_re.search(text):
             # 如果包含E-mail/Email关键词，肯定是签名
-            if re.search(r'E-?mail', text, re.IGNORECASE):
+            if self.email_keyword_re.search(text):
                 return True
             # 如果一行中有多个@，也可能是签名
             if text.count('@') >= 2:
                 return True
         
         # 邮编
-        if re.search(r'(邮编|邮政编码|Zip|Post)[：:：\s]*\d{6}', text, re.IGNORECASE):
+        if self.postcode_re.search(text):
             return True
         
         # 公司地址（通常很长）
-        if re.search(r'(地址|Address)[：:：]', text, re.IGNORECASE) and len(text) > 20:
+        if self.address_re.search(text) and len(text) > 20:
             return True
         
         return False
@@ -236,13 +214,11 @@ class ContentCleaner:
             is_header = False
             
             # 检测邮件头部字段
-            for pattern in self.reply_markers:
-                if re.match(pattern, line_stripped, re.IGNORECASE):
-                    is_header = True
-                    # 如果是"发件人:"这类，后续几行可能也是头部
-                    if re.match(r'^(发件人|From|发送时间|Sent)[:：]', line_stripped, re.IGNORECASE):
-                        skip_next = 3  # 跳过后续3行（通常是发件人、时间、收件人、主题）
-                    break
+            if self.reply_re.match(line_stripped):
+                is_header = True
+                # 如果是"发件人:"这类，后续几行可能也是头部
+                if self.reply_header_re.match(line_stripped):
+                    skip_next = 3  # 跳过后续3行（通常是发件人、时间、收件人、主题）
             
             if not is_header:
                 cleaned.append(line)
@@ -4,8 +4,10 @@
 """
 import json
 import logging
+import sys
 from datetime import datetime
 from email_client import EmailClient
+from message_store import MessageStore
 from person_manager import PersonManager
 
 # 配置日志
@@ -17,7 +19,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def debug_email_filter():
+def debug_email_filter(offline=False):
     """调试邮件过滤"""
     print("=" * 70)
     print("邮件过滤调试工具")
@@ -57,25 +59,30 @@ def debug_email_filter():
         print(f"  - {name} ({email})")
     print()
     
-    # 连接邮箱
-    email_account = config['email_account']
-    client = EmailClient(
-        username=email_account['username'],
-        password=email_account['password'],
-        imap_server=email_account['imap_server'],
-        imap_port=email_account['imap_port'],
-        smtp_server=email_account['smtp_server'],
-        smtp_port=email_account['smtp_port']
-    )
-    
-    if not client.connect_imap():
-        print("无法连接到邮箱")
-        return
-    
-    # 获取邮件
+    # 获取邮件（V6.1：--offline 时从本地邮件库读取，不连接邮箱）
     days_to_check = config.get('days_to_check', 1)
     print(f"正在获取最近 {days_to_check} 天的邮件...")
-    all_emails = client.fetch_emails_from_senders(all_senders, days_to_check)
+    client = None
+    if offline:
+        store = MessageStore(config.get('fetch_config', {}).get('message_store_path', 'data/messages.db'))
+        all_emails = store.fetch_emails_from_senders(all_senders, days_to_check)
+    else:
+        email_account = config['email_account']
+        client = EmailClient(
+            username=email_account['username'],
+            password=email_account['password'],
+            imap_server=email_account['imap_server'],
+            imap_port=email_account['imap_port'],
+            smtp_server=email_account['smtp_server'],
+            smtp_port=email_account['smtp_port'],
+            fetch_config=config.get('fetch_config', {})
+        )
+        
+        if not client.connect_imap():
+            print("无法连接到邮箱")
+            return
+        
+        all_emails = client.fetch_emails_from_senders(all_senders, days_to_check)
     
     print(f"总共获取: {len(all_emails)} 封邮件")
     print()
@@ -115,7 +122,8 @@ def debug_email_filter():
         print(f"配置中的姜新宇邮箱: {jiangxy_email}")
         print(f"是否在员工列表中: {jiangxy_email in employees}")
     
-    client.disconnect_imap()
+    if client:
+        client.disconnect_imap()
     
     print("=" * 70)
     print("调试完成")
@@ -123,5 +131,6 @@ def debug_email_filter():
 
 
 if __name__ == '__main__':
-    debug_email_filter()
+    # python debug_email_filter.py --offline  从本地邮件库读取（V6.1）
+    debug_email_filter(offline='--offline' in sys.argv)
 
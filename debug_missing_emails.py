@@ -4,8 +4,10 @@
 """
 import json
 import logging
+import sys
 from datetime import datetime
 from email_client import EmailClient
+from message_store import MessageStore
 from person_manager import PersonManager
 from ai_analyzer import AIAnalyzer
 from email_analyzer import EmailAnalyzer
@@ -18,7 +20,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def debug_missing_emails():
+def debug_missing_emails(offline=False):
     """调试遗漏的邮件"""
     print("=" * 80)
     print("遗漏邮件调试")
@@ -38,24 +40,29 @@ def debug_missing_emails():
     customers = person_mgr.get_persons_by_type('customer')
     suppliers = person_mgr.get_persons_by_type('supplier')
     
-    # 连接邮箱
-    email_account = config['email_account']
-    client = EmailClient(
-        username=email_account['username'],
-        password=email_account['password'],
-        imap_server=email_account['imap_server'],
-        imap_port=email_account['imap_port'],
-        smtp_server=email_account['smtp_server'],
-        smtp_port=email_account['smtp_port']
-    )
-    
-    if not client.connect_imap():
-        print("无法连接到邮箱")
-        return
-    
-    # 获取邮件
+    # 获取邮件（V6.1：--offline 时从本地邮件库读取，不连接邮箱）
     days_to_check = config.get('days_to_check', 1)
-    all_emails = client.fetch_emails_from_senders(all_senders, days_to_check)
+    client = None
+    if offline:
+        store = MessageStore(config.get('fetch_config', {}).get('message_store_path', 'data/messages.db'))
+        all_emails = store.fetch_emails_from_senders(all_senders, days_to_check)
+    else:
+        email_account = config['email_account']
+        client = EmailClient(
+            username=email_account['username'],
+            password=email_account['password'],
+            imap_server=email_account['imap_server'],
+            imap_port=email_account['imap_port'],
+            smtp_server=email_account['smtp_server'],
+            smtp_port=email_account['smtp_port'],
+            fetch_config=config.get('fetch_config', {})
+        )
+        
+        if not client.connect_imap():
+            print("无法连接到邮箱")
+            return
+        
+        all_emails = client.fetch_emails_from_senders(all_senders, days_to_check)
     
     print(f"获取到 {len(all_emails)} 封邮件")
     print()
@@ -123,7 +130,8 @@ def debug_missing_emails():
             priority = email.get('ai_analysis', {}).get('priority', '无')
             print(f"  [{date_str}] {sender_name:8s} | {email['subject'][:30]} | 优先级:{priority}")
     
-    client.disconnect_imap()
+    if client:
+        client.disconnect_imap()
     
     print()
     print("=" * 80)
@@ -132,5 +140,6 @@ def debug_missing_emails():
 
 
 if __name__ == '__main__':
-    debug_missing_emails()
+    # python debug_missing_emails.py --offline  从本地邮件库读取（V6.1）
+    debug_missing_emails(offline='--offline' in sys.argv)
 
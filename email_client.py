@@ -1,22 +1,53 @@
 import imaplib
 import email
+import base64
+import quopri
 from email.header import decode_header
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
 import ssl
 import logging
+import re
+import select
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from body_cache import BodyCache
+from charset_decoder import CharsetDecoder
 from content_cleaner import ContentCleaner
+from html_to_text import html_to_text
+from imap_compress import CompressedIMAP4, CompressedIMAP4_SSL, TrafficStats
+from imap_session import ImapSession, UidValidityChangedError
+from imap_utils import (build_message_set, build_or_from_query, chunked, extract_uid, iter_body_parts,
+                        parse_fetch_items, parse_fetch_response, parse_message_set)
+from message_store import MessageStore
+from outbox import Outbox, OutboxSender, make_report_id
+from parse_pool import ParsePool
+from smtp_delivery import SmtpDelivery
+from sync_state import SyncStateStore
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# V6.1：两阶段获取时第一阶段只取的邮件头字段（PEEK不会标记为已读）
+HEADER_FETCH_ITEM = 'BODY.PEEK[HEADER.FIELDS (FROM DATE SUBJECT MESSAGE-ID)]'
+
 
 class EmailClient:
     """邮箱客户端类，处理邮件的接收和发送"""
     
-    def __init__(self, username, password, imap_server, imap_port, smtp_server, smtp_port):
+    def __init__(self, username, password, imap_server, imap_port, smtp_server, smtp_port, fetch_config=None,
+                 sync_state=None, message_store=None, delivery_config=None):
+        """初始化邮箱客户端
+        
+        Args:
+            fetch_config: 邮件获取配置（V6.1，可选），对应config.json中的fetch_config
+            delivery_config: 邮件发送配置（V6.1，可选），对应config.json中的delivery_config
+            sync_state: 共享的SyncStateStore（V6.1，可选，多个客户端同时运行时传入）
+            message_store: 共享的MessageStore（V6.1，可选，多个客户端同时运行时传入）
+        """
+        fetch_config = fetch_config or {}
         self.username = username
         self.password = password
         self.imap_server = imap_server
@@ -25,13 +56,118 @@ class EmailClient:
         self.smtp_port = smtp_port
         self.imap_conn = None
         self.content_cleaner = ContentCleaner()  # 内容清理器
+        self.charset_decoder = CharsetDecoder()  # V6.1：字符集解码（声明缺失或错误时识别GB18030/UTF-8）
+        
+        # V6.1：IMAP是否使用SSL（连接本地测试服务器时可设为false）
+        self.imap_ssl = fetch_config.get('imap_ssl', True)
+        
+        # V6.1：服务器支持时启用COMPRESS=DEFLATE，并统计网络流量
+        self.imap_compress = fetch_config.get('imap_compress', True)
+        self.traffic = TrafficStats()
+        
+        # V6.1：两阶段获取（先过滤邮件头，只下载关注发件人的邮件）
+        self.header_first = fetch_config.get('header_first', True)
+        
+        # V6.1：批量FETCH，每批邮件数量（1 表示逐封获取）
+        self.fetch_batch_size = fetch_config.get('batch_size', 200)
+        
+        # V6.1：正文最多保留的字符数；HTML正文转换为纯文本（丢弃样式/脚本，解码实体），达到上限后停止解析
+        self.body_max_chars = fetch_config.get('body_max_chars', 10000)
+        self.html_to_text = fetch_config.get('html_to_text', True)
+        
+        # V6.1：正文获取策略（rfc822：下载整封邮件；bodystructure：只下载正文部分的前 body_max_bytes 字节）
+        self.body_strategy = fetch_config.get('body_strategy', 'rfc822')
+        self.body_max_bytes = fetch_config.get('body_max_bytes', 131072)
+        
+        # V6.1：服务器端发件人过滤（auto：根据发件人数量和搜索结果数量自动选择；true/always：总是；false/never：从不）
+        self.server_filter = self._parse_server_filter(fetch_config.get('server_filter', 'auto'))
+        self.server_filter_chunk_size = fetch_config.get('server_filter_chunk_size', 20)
+        self.server_filter_min_messages = fetch_config.get('server_filter_min_messages', 100)
+        self.server_filter_ratio = fetch_config.get('server_filter_ratio', 10)
+        
+        # V6.1：并行获取的连接数上限（注意邮箱服务商的并发连接限制）
+        self.fetch_workers = max(1, fetch_config.get('fetch_workers', 1))
+        self.parallel_min_per_worker = fetch_config.get('parallel_min_per_worker', 50)
+        
+        # V6.1：基于UID的增量同步（检查点按账号/文件夹保存）
+        self.incremental_sync = fetch_config.get('incremental_sync', False)
+        self.sync_state = sync_state or SyncStateStore(fetch_config.get('sync_state_dir', 'sync_state'))
+        self._failed_uids = []  # 本次获取失败的UID（检查点不会越过它们）
+        
+        # V6.1：同步邮件库中邮件的标记变化和已删除邮件（服务器支持CONDSTORE/QRESYNC时只获取变化部分）
+        self.flag_sync = fetch_config.get('flag_sync', True)
+        self.flag_fetch_batch_size = fetch_config.get('flag_fetch_batch_size', 1000)
+        
+        # V6.1：断线重连（按指数退避重连、重新选择文件夹后从中断的批次继续）
+        self.reconnect_retries = fetch_config.get('reconnect_retries', 3)
+        self.reconnect_delay = fetch_config.get('reconnect_delay', 2)
+        self.keepalive_interval = fetch_config.get('keepalive_interval', 300)
+        # 读写超时（秒，0 表示不限制）：半开连接上recv超时后抛出异常，由会话重连；IDLE等待不受影响
+        self.imap_timeout = fetch_config.get('imap_timeout', 60) or None
+        
+        # V6.1：SMTP发送（一次运行复用一个会话，只在服务器限流时退避重试）
+        self.delivery_config = delivery_config or {}
+        
+        # V6.1：发件箱（报告先写入本地发件箱，由后台线程发送，失败时退避重试）
+        self.outbox = None
+        self._outbox_sender = None
+        if self.delivery_config.get('outbox', False):
+            self.outbox = Outbox(
+                self.delivery_config.get('outbox_path', 'data/outbox.db'),
+                max_attempts=self.delivery_config.get('outbox_max_attempts', 8),
+                retry_delay=self.delivery_config.get('outbox_retry_delay', 60),
+                max_retry_delay=self.delivery_config.get('outbox_max_retry_delay', 3600)
+            )
+        
+        # V6.1：清理后正文的持久缓存（按原始正文哈希 + 清理规则版本），窗口内的邮件不再重复解码和清理
+        # （默认关闭，由 config.json 开启，避免调试脚本在当前目录创建数据库）
+        self.body_cache = None
+        if fetch_config.get('body_cache', False):
+            self.body_cache = BodyCache(
+                fetch_config.get('body_cache_path', 'data/body_cache.db'),
+                cache_days=fetch_config.get('body_cache_days', 30)
+            )
+        
+        # V6.1：用进程池并行解析和清理原始邮件（0/1 表示在当前线程解析；邮件较少时不启动进程池）
+        self.fetch_config = fetch_config
+        self.parse_workers = fetch_config.get('parse_workers', 0)
+        self.parse_min_messages = fetch_config.get('parse_min_messages', 100)
+        self.parse_chunk_size = fetch_config.get('parse_chunk_size', 20)
+        self._parse_pool = None
+        self._parse_pool_lock = threading.Lock()
+        
+        # V6.1：本地邮件库（SQLite），保存获取到的邮件和AI分析结果，供离线查询
+        self.message_store = message_store
+        if message_store is None and fetch_config.get('message_store', False):
+            self.message_store = MessageStore(fetch_config.get('message_store_path', 'data/messages.db'))
+    
+    def _open_imap_connection(self):
+        """建立一个新的已登录IMAP连接"""
+        if self.imap_ssl:
+            conn = CompressedIMAP4_SSL(self.imap_server, self.imap_port, traffic=self.traffic,
+                                       timeout=self.imap_timeout)
+        else:
+            conn = CompressedIMAP4(self.imap_server, self.imap_port, traffic=self.traffic,
+                                   timeout=self.imap_timeout)
+        conn.login(self.username, self.password)
+        return conn
+    
+    def _open_session(self, enable_qresync=True):
+        """V6.1：建立可自动重连的IMAP会话
+        
+        Args:
+            enable_qresync: 是否启用QRESYNC（只获取邮件的并行连接不需要）
+        """
+        return ImapSession(self._open_imap_connection,
+                           on_connect=lambda conn: self._prepare_connection(conn, enable_qresync),
+                           retries=self.reconnect_retries, reconnect_delay=self.reconnect_delay,
+                           keepalive_interval=self.keepalive_interval)
     
     def connect_imap(self):
         """连接到IMAP服务器"""
         try:
             logger.info(f"正在连接到 IMAP 服务器: {self.imap_server}:{self.imap_port}")
-            self.imap_conn = imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
-            self.imap_conn.login(self.username, self.password)
+            self.imap_conn = self._open_session()
             logger.info("IMAP 登录成功")
             return True
         except Exception as e:
@@ -43,10 +179,14 @@ class EmailClient:
         if self.imap_conn:
             try:
                 self.imap_conn.close()
+            except:
+                pass  # 未选择文件夹或连接已断开
+            try:
                 self.imap_conn.logout()
                 logger.info("IMAP 连接已关闭")
             except:
                 pass
+            self.imap_conn = None  # V6.1：断开后可重新 connect_imap
     
     def decode_mime_words(self, s):
         """解码邮件头部信息"""
@@ -56,17 +196,19 @@ class EmailClient:
         result = []
         for part, encoding in decoded_parts:
             if isinstance(part, bytes):
-                if encoding:
-                    try:
-                        result.append(part.decode(encoding))
-                    except:
-                        result.append(part.decode('utf-8', errors='ignore'))
-                else:
-                    result.append(part.decode('utf-8', errors='ignore'))
+                # V6.1：未编码的8位邮件头（unknown-8bit）和声明错误的字符集由解码器识别
+                result.append(self.charset_decoder.decode(part, encoding))
             else:
                 result.append(str(part))
         return ''.join(result)
     
+    def _decode_payload(self, part):
+        """V6.1：解码邮件部分的正文（传输编码 + 字符集）"""
+        payload = part.get_payload(decode=True)
+        if not isinstance(payload, bytes):
+            return ""
+        return self.charset_decoder.decode(payload, part.get_content_charset())
+    
     def get_email_body(self, msg):
         """提取邮件正文"""
         body = ""
@@ -77,45 +219,894 @@ class EmailClient:
                 
                 if "attachment" not in content_disposition:
                     if content_type == "text/plain":
-                        try:
-                            charset = part.get_content_charset() or 'utf-8'
-                            body = part.get_payload(decode=True).decode(charset, errors='ignore')
-                            if body:
-                                break
-                        except:
-                            pass
+                        body = self._decode_payload(part)
+                        if body:
+                            break
                     elif content_type == "text/html" and not body:
-                        try:
-                            charset = part.get_content_charset() or 'utf-8'
-                            body = part.get_payload(decode=True).decode(charset, errors='ignore')
-                        except:
-                            pass
+                        body = self._convert_html(self._decode_payload(part))
+        else:
+            body = self._decode_payload(msg)
+            if msg.get_content_type() == "text/html":
+                body = self._convert_html(body)
+        
+        return body.strip()
+    
+    def _convert_html(self, html):
+        """V6.1：HTML正文转纯文本（多保留一个字符，超长时由 _build_email_record 截断并标注）"""
+        if not self.html_to_text:
+            return html
+        return html_to_text(html, self.body_max_chars + 1)
+    
+    def _parse_date(self, date_str):
+        """解析邮件日期为本地时间，解析失败时返回当前时间"""
+        try:
+            date_tuple = email.utils.parsedate_tz(date_str)
+            if date_tuple:
+                return datetime.fromtimestamp(email.utils.mktime_tz(date_tuple))
+        except:
+            pass
+        return datetime.now()
+    
+    def _match_sender(self, from_addr, subject, sender_emails_lower, exclude_self_lower):
+        """检查发件人是否为关注的发件人
+        
+        Returns:
+            (原始邮箱, 姓名)，不匹配时返回None
+        """
+        # 从发件人地址中提取邮箱
+        # 格式可能是："Name <email@example.com>" 或 "email@example.com"
+        email_match = re.search(r'[\w\.-]+@[\w\.-]+', from_addr)
+        if not email_match:
+            return None
+        
+        sender_email = email_match.group(0).lower()
+        
+        # 过滤掉自己发送的邮件
+        if exclude_self_lower and sender_email == exclude_self_lower:
+            logger.debug(f"跳过自己发送的邮件: {subject}")
+            return None
+        
+        # 检查是否是目标发件人
+        return sender_emails_lower.get(sender_email)
+    
+    def _get_uidvalidity(self, folder):
+        """获取当前文件夹的UIDVALIDITY（SELECT响应中没有时用STATUS查询）"""
+        try:
+            _, data = self.imap_conn.response('UIDVALIDITY')
+            if not data or data[0] is None:
+                _, data = self.imap_conn.status(folder, '(UIDVALIDITY)')
+                match = re.search(rb'UIDVALIDITY (\d+)', data[0] or b'')
+                return int(match.group(1)) if match else None
+            return int(data[0])
+        except Exception as e:
+            logger.warning(f"获取UIDVALIDITY失败: {str(e)}")
+            return None
+    
+    def _has_capability(self, name):
+        """当前连接是否支持某个IMAP扩展"""
+        return name in self.imap_conn.capabilities
+    
+    @property
+    def qresync_enabled(self):
+        """主连接是否已启用QRESYNC（状态保存在各自的连接上，并行获取的连接不影响主连接）"""
+        return bool(self.imap_conn and getattr(self.imap_conn, 'qresync_enabled', False))
+    
+    def _prepare_connection(self, conn, enable_qresync=True):
+        """V6.1：每次（重新）登录后：刷新服务器能力，启用压缩和QRESYNC"""
+        try:
+            # 部分服务器登录后才公布COMPRESS/CONDSTORE/QRESYNC
+            status, data = conn.capability()
+            if status == 'OK' and data and data[-1]:
+                conn.capabilities = tuple(data[-1].decode('ascii', errors='ignore').upper().split())
+        except Exception as e:
+            logger.warning(f"获取服务器能力失败: {str(e)}")
+        
+        self._start_compression(conn)
+        if enable_qresync:
+            self._enable_qresync(conn)
+    
+    def _start_compression(self, conn):
+        """V6.1：服务器支持时启用COMPRESS=DEFLATE（RFC 4978）"""
+        if not self.imap_compress or 'COMPRESS=DEFLATE' not in conn.capabilities:
+            return
+        try:
+            if conn.start_compression():
+                logger.info("已启用IMAP压缩（COMPRESS=DEFLATE）")
+        except Exception as e:
+            logger.warning(f"启用IMAP压缩失败，使用未压缩连接: {str(e)}")
+    
+    def _enable_qresync(self, conn):
+        """V6.1：服务器支持时启用QRESYNC（需在SELECT之前，每个连接都要启用，结果记录在连接上）"""
+        conn.qresync_enabled = False
+        try:
+            if self.flag_sync and 'QRESYNC' in conn.capabilities:
+                status, _ = conn.enable('QRESYNC')
+                conn.qresync_enabled = status == 'OK'
+                if conn.qresync_enabled:
+                    logger.info("已启用QRESYNC：只同步变化的标记和已删除的邮件")
+        except Exception as e:
+            logger.warning(f"启用QRESYNC失败，使用普通同步: {str(e)}")
+    
+    def _get_highest_modseq(self, folder):
+        """获取当前文件夹的HIGHESTMODSEQ，服务器不支持CONDSTORE时返回None"""
+        try:
+            _, data = self.imap_conn.response('HIGHESTMODSEQ')
+            if data and data[-1] is not None:
+                return int(data[-1])
+            if not (self.qresync_enabled or self._has_capability('CONDSTORE')):
+                return None
+            _, data = self.imap_conn.status(folder, '(HIGHESTMODSEQ)')
+            match = re.search(rb'HIGHESTMODSEQ (\d+)', data[0] or b'')
+            return int(match.group(1)) if match else None
+        except Exception as e:
+            logger.warning(f"获取HIGHESTMODSEQ失败: {str(e)}")
+            return None
+    
+    def _parse_flags(self, data):
+        """解析 (UID FLAGS) 的FETCH响应为 {uid: [标记, ...]}"""
+        flags_by_uid = {}
+        for _, items in parse_fetch_items(data):
+            uid, flags = items.get('UID'), items.get('FLAGS')
+            if uid and uid.isdigit():
+                flags_by_uid[int(uid)] = [flag for flag in flags if isinstance(flag, str)] \
+                    if isinstance(flags, list) else []
+        return flags_by_uid
+    
+    def _fetch_flags(self, uids):
+        """按UID批量获取标记
+        
+        Returns:
+            ({uid: [标记, ...]}, 服务器没有返回的UID集合（即已删除；获取失败的批次不计入）)
+        """
+        flags_by_uid = {}
+        missing = set()
+        for batch in chunked(list(uids), self.flag_fetch_batch_size):
+            status, data = self.imap_conn.uid('FETCH', build_message_set(batch), '(UID FLAGS)')
+            if status != 'OK':
+                logger.warning(f"获取 {len(batch)} 封邮件的标记失败")
+                continue
+            batch_flags = self._parse_flags(data)
+            flags_by_uid.update(batch_flags)
+            missing.update(int(uid) for uid in batch if int(uid) not in batch_flags)
+        return flags_by_uid, missing
+    
+    def _fetch_changed_flags(self, last_modseq):
+        """CONDSTORE：只获取 modseq 之后标记有变化的邮件（QRESYNC时同时返回VANISHED）"""
+        modifier = f"CHANGEDSINCE {last_modseq}" + (" VANISHED" if self.qresync_enabled else "")
+        status, data = self.imap_conn.uid('FETCH', '1:*', f'(UID FLAGS) ({modifier})')
+        if status != 'OK':
+            raise self.imap_conn.error(f"CHANGEDSINCE 获取失败: {data}")
+        return self._parse_flags(data)
+    
+    def _pop_vanished(self):
+        """读取QRESYNC的 VANISHED (EARLIER) 响应中的UID"""
+        _, data = self.imap_conn.response('VANISHED')
+        vanished = set()
+        for item in data or []:
+            if item:
+                vanished.update(parse_message_set(re.sub(rb'^\(EARLIER\)\s*', b'', item)))
+        return vanished
+    
+    def _find_expunged(self, stored_uids):
+        """用 UID SEARCH 找出邮件库中服务器上已不存在的UID（只返回UID，不下载内容）"""
+        existing = set()
+        for batch in chunked(list(stored_uids), self.flag_fetch_batch_size):
+            status, data = self.imap_conn.uid('SEARCH', None, f'UID {build_message_set(batch)}')
+            if status != 'OK':
+                # 搜索失败时不能判断哪些被删除，保守起见当作都存在
+                existing.update(batch)
+                continue
+            existing.update(int(uid) for uid in data[0].split())
+        return set(stored_uids) - existing
+    
+    def _sync_store_changes(self, folder, uidvalidity, checkpoint_key):
+        """V6.1：同步邮件库中邮件的标记变化，删除服务器上已删除的邮件
+        
+        - QRESYNC：UID FETCH 1:* (FLAGS) (CHANGEDSINCE modseq VANISHED)，只返回变化
+        - CONDSTORE：CHANGEDSINCE获取标记变化，UID SEARCH检查已删除的邮件
+        - 都不支持：获取邮件库中所有邮件的标记，没有返回的即已删除
+        每次同步后保存HIGHESTMODSEQ，下次只请求之后的变化。
+        """
+        stored_uids = self.message_store.get_uids(self.username, folder)
+        highest_modseq = self._get_highest_modseq(folder)
+        last_modseq = self.sync_state.get_modseq(checkpoint_key, uidvalidity)
+        
+        if stored_uids:
+            if highest_modseq is not None and last_modseq is not None:
+                if highest_modseq == last_modseq and self.qresync_enabled:
+                    # QRESYNC服务器在expunge时也会增加modseq，没有变化可以直接跳过
+                    flags_by_uid, vanished = {}, set()
+                elif highest_modseq == last_modseq:
+                    flags_by_uid, vanished = {}, self._find_expunged(stored_uids)
+                else:
+                    flags_by_uid = self._fetch_changed_flags(last_modseq)
+                    vanished = self._pop_vanished() if self.qresync_enabled else self._find_expunged(stored_uids)
+                
+                # 上次同步之后才保存的邮件还没有标记
+                unknown_uids = self.message_store.get_uids(self.username, folder, flags_unknown=True)
+                unknown_uids = [uid for uid in unknown_uids if uid not in flags_by_uid and uid not in vanished]
+                if unknown_uids:
+                    unknown_flags, unknown_missing = self._fetch_flags(unknown_uids)
+                    flags_by_uid.update(unknown_flags)
+                    vanished |= unknown_missing
+            else:
+                flags_by_uid, vanished = self._fetch_flags(stored_uids)
+            
+            stored = set(stored_uids)
+            vanished &= stored
+            flags_by_uid = {uid: flags for uid, flags in flags_by_uid.items() if uid in stored and uid not in vanished}
+            self.message_store.update_flags(self.username, folder, flags_by_uid)
+            self.message_store.delete_uids(self.username, folder, vanished)
+            logger.info(f"标记同步完成：{len(flags_by_uid)} 封标记更新，{len(vanished)} 封已删除"
+                        f"（{'QRESYNC' if self.qresync_enabled else 'CONDSTORE' if highest_modseq is not None else '全量'}）")
+        
+        if highest_modseq is not None:
+            self.sync_state.update_modseq(checkpoint_key, uidvalidity, highest_modseq)
+    
+    def _search_new_uids(self, last_uid):
+        """V6.1：增量同步 - 搜索检查点之后的新邮件UID
+        
+        Returns:
+            (UID列表, 搜索条件)，失败时返回 (None, None)
+        """
+        criteria = f'UID {last_uid + 1}:*'
+        logger.info(f"增量同步：搜索 UID {last_uid + 1} 之后的新邮件")
+        status, messages = self.imap_conn.uid('SEARCH', None, criteria)
+        if status != "OK":
+            logger.error("搜索新邮件失败")
+            return None, None
+        
+        # UID n:* 在没有新邮件时也会返回最后一封，需要再过滤一次
+        uids = [uid for uid in messages[0].split() if int(uid) > last_uid]
+        logger.info(f"✅ 增量搜索成功！找到 {len(uids)} 封新邮件")
+        return uids, criteria
+    
+    def _search_recent_ids(self, days):
+        """搜索最近几天的邮件UID（SINCE搜索失败时退回检查最近的邮件）
+        
+        Returns:
+            (UID列表, 搜索条件)；备用方案没有可复用的搜索条件，失败时UID列表为None
+        """
+        # 尝试使用SINCE日期搜索（更精确）
+        since_date = (datetime.now() - timedelta(days=days)).strftime("%d-%b-%Y")
+        logger.info(f"尝试使用日期搜索：SINCE {since_date}")
+        
+        try:
+            # 尝试1：标准SINCE格式
+            criteria = f'SINCE {since_date}'
+            status, messages = self.imap_conn.uid('SEARCH', None, criteria)
+            
+            if status == "OK":
+                email_ids = messages[0].split()
+                logger.info(f"✅ 日期搜索成功！找到 {len(email_ids)} 封邮件")
+                return email_ids, criteria
+            else:
+                raise Exception("日期搜索不支持，使用备用方案")
+                
+        except UidValidityChangedError:
+            raise
+        except Exception as e:
+            logger.warning(f"日期搜索失败: {str(e)}，使用备用方案（检查最近邮件）")
+            
+            # 备用方案：获取所有邮件ID，取最近的
+            try:
+                status, messages = self.imap_conn.uid('SEARCH', None, 'ALL')
+                if status != "OK":
+                    logger.error("搜索邮件失败")
+                    return None, None
+                
+                email_ids = messages[0].split()
+                total_emails = len(email_ids)
+                logger.info(f"收件箱中共有 {total_emails} 封邮件，正在筛选...")
+                
+                # 只处理最近的N封邮件（避免处理过多）
+                # 根据检查天数动态调整：3天大约100-150封邮件已经足够
+                max_check = min(150, total_emails)  # V3.0优化：最多检查最近150封
+                recent_email_ids = email_ids[-max_check:] if total_emails > max_check else email_ids
+                
+                if total_emails:
+                    logger.info(f"将检查最近 {len(recent_email_ids)} 封邮件（约占收件箱的 {len(recent_email_ids)*100//total_emails}%）")
+                return recent_email_ids, None
+            except UidValidityChangedError:
+                raise
+            except Exception as inner_e:
+                logger.error(f"备用方案也失败: {str(inner_e)}")
+                return None, None
+    
+    @staticmethod
+    def _parse_server_filter(value):
+        """V6.1：规范化 fetch_config.server_filter 为 'auto' / True / False，无法识别时警告并使用 auto"""
+        if isinstance(value, bool):
+            return value
+        modes = {'auto': 'auto', 'always': True, 'never': False}
+        name = str(value).strip().lower()
+        if name in modes:
+            return modes[name]
+        logger.warning(f"fetch_config.server_filter 的值无效: {value!r}（可选 auto/always/never/true/false），使用 auto")
+        return 'auto'
+    
+    def _should_filter_on_server(self, sender_count, candidate_count):
+        """V6.1：决定在服务器端还是本地过滤发件人
+        
+        关注的发件人相对收件箱邮件量较少时，用服务器端 OR FROM 搜索代替逐封下载邮件头
+        """
+        if self.server_filter != 'auto':
+            return self.server_filter
+        
+        return (candidate_count >= self.server_filter_min_messages
+                and sender_count * self.server_filter_ratio <= candidate_count)
+    
+    def _filter_on_server(self, base_criteria, candidate_uids, sender_addresses):
+        """V6.1：服务器端发件人过滤
+        
+        发件人分组构造 SEARCH <条件> (OR FROM a OR FROM b FROM c) 查询，控制命令长度，
+        合并去重各组结果。FROM是子串匹配，结果仍会在本地按邮件头精确过滤。
+        
+        Returns:
+            过滤后的UID列表；任何一组搜索失败时返回原列表（退回本地过滤）
+        """
+        if any(not address.isascii() for address in sender_addresses):
+            logger.info("发件人包含非ASCII地址，使用本地过滤")
+            return candidate_uids
+        
+        sender_chunks = list(chunked(sorted(sender_addresses), self.server_filter_chunk_size))
+        logger.info(f"服务器端过滤：{len(sender_addresses)} 个发件人分 {len(sender_chunks)} 次搜索")
+        
+        matched = set()
+        for sender_chunk in sender_chunks:
+            criteria = f'{base_criteria} ({build_or_from_query(sender_chunk)})'
+            try:
+                status, messages = self.imap_conn.uid('SEARCH', None, criteria)
+            except UidValidityChangedError:
+                raise
+            except Exception as e:
+                logger.warning(f"服务器端过滤失败: {str(e)}，使用本地过滤")
+                return candidate_uids
+            if status != "OK":
+                logger.warning("服务器端过滤失败，使用本地过滤")
+                return candidate_uids
+            matched.update(messages[0].split())
+        
+        candidate_set = set(candidate_uids)
+        filtered = sorted((uid for uid in matched if uid in candidate_set), key=int)
+        logger.info(f"✅ 服务器端过滤完成：{len(filtered)}/{len(candidate_uids)} 封来自关注的发件人")
+        return filtered
+    
+    def _fetch_batch(self, email_ids, fetch_item, conn=None):
+        """V6.1：按批次获取邮件，每批一次UID FETCH往返（如 101:300）
+        
+        Args:
+            email_ids: 邮件UID列表
+            fetch_item: FETCH数据项，如 RFC822
+            conn: 使用的IMAP连接（默认为主连接）
+            
+        Yields:
+            (邮件UID bytes, 字面量内容 bytes)
+        """
+        conn = conn or self.imap_conn
+        for chunk in chunked(email_ids, self.fetch_batch_size):
+            message_set = build_message_set(chunk)
+            try:
+                status, msg_data = conn.uid('FETCH', message_set, f"({fetch_item})")
+            except UidValidityChangedError:
+                # 重连后UID已失效，继续获取后面的批次会取到错误的邮件
+                raise
+            except Exception as e:
+                logger.error(f"批量获取邮件失败 ({len(chunk)} 封): {str(e)}")
+                self._failed_uids.extend(chunk)
+                continue
+            
+            if status != "OK":
+                logger.warning(f"批量获取邮件失败 ({len(chunk)} 封)")
+                self._failed_uids.extend(chunk)
+                continue
+            
+            for _, meta, literals in parse_fetch_response(msg_data):
+                uid = extract_uid(meta)
+                if uid and literals:
+                    yield uid, literals[0]
+    
+    def _filter_by_headers(self, email_ids, sender_emails_lower, cutoff_date, exclude_self_lower):
+        """V6.1：第一阶段 - 只获取邮件头，在本地按日期和发件人过滤
+        
+        Returns:
+            需要下载完整内容的邮件ID列表
+        """
+        logger.info(f"第一阶段：获取 {len(email_ids)} 封邮件的头部信息...")
+        matched_ids = []
+        processed = 0
+        
+        for email_id, header_bytes in self._fetch_batch(email_ids, HEADER_FETCH_ITEM):
+            try:
+                processed += 1
+                if processed == 1 or processed % 50 == 0 or processed == len(email_ids):
+                    logger.info(f"头部获取进度: {processed}/{len(email_ids)} 封...")
+                
+                header_msg = email.message_from_bytes(header_bytes)
+                subject = self.decode_mime_words(header_msg.get("Subject", ""))
+                from_addr = self.decode_mime_words(header_msg.get("From", ""))
+                
+                if self._parse_date(header_msg.get("Date", "")) < cutoff_date:
+                    continue
+                
+                if self._match_sender(from_addr, subject, sender_emails_lower, exclude_self_lower):
+                    matched_ids.append(email_id)
+                    
+            except Exception as e:
+                logger.error(f"解析邮件 #{processed} 头部失败: {str(e)}")
+                continue
+        
+        logger.info(f"✅ 头部过滤完成：{len(matched_ids)}/{len(email_ids)} 封来自关注的发件人")
+        return matched_ids
+    
+    def _build_email_record(self, email_id, msg, sender_emails_lower, cutoff_date, exclude_self_lower, body=None,
+                            body_part=None, raw=None):
+        """解析完整邮件并生成邮件数据，不符合条件时返回None
+        
+        Args:
+            body: 已单独获取的正文（V6.1部分获取时使用），为None时从msg中提取
+            body_part: 单独获取的正文部分 (原始字节, 正文部分信息, 是否截断)（V6.1），需要时才解码
+            raw: 整封邮件的原始字节（V6.1，用于正文缓存）
+        """
+        # 提取邮件信息
+        subject = self.decode_mime_words(msg.get("Subject", ""))
+        from_addr = self.decode_mime_words(msg.get("From", ""))
+        
+        logger.debug(f"邮件 #{email_id.decode()}: {subject[:30]}")
+        
+        # 过滤日期：只保留指定天数内的邮件
+        local_date = self._parse_date(msg.get("Date", ""))
+        if local_date < cutoff_date:
+            return None
+        
+        matched = self._match_sender(from_addr, subject, sender_emails_lower, exclude_self_lower)
+        if not matched:
+            return None
+        
+        # 获取发件人姓名
+        original_email, sender_name = matched
+        
+        # V6.1：相同的原始正文直接使用缓存的清理结果
+        cache_key = None
+        if self.body_cache and body is None:
+            cache_key = self._body_cache_key(raw, body_part)
+        cached_body = self.body_cache.get(cache_key) if cache_key else None
+        
+        if cached_body is not None:
+            body = cached_body
         else:
+            # 获取邮件正文（限制大小，避免过大邮件）
+            if body_part is not None:
+                body = self._decode_body_part(*body_part).strip()
+            else:
+                body = self.get_email_body(msg) if body is None else body.strip()
+            
+            # 限制邮件内容大小（避免处理超大邮件）
+            if len(body) > self.body_max_chars:
+                body = body[:self.body_max_chars] + "\n...(内容过长，已截断)"
+                logger.debug(f"邮件内容过长，已截断: {subject[:30]}")
+            
+            # 清理邮件内容（V3.0新增）
+            body = self.content_cleaner.clean_email_body(body)
+            
+            if cache_key:
+                self.body_cache.set(cache_key, body)
+        
+        return {
+            'id': email_id.decode(),
+            'message_id': msg.get("Message-ID", "").strip(),
+            'account': self.username,
+            'from': from_addr,
+            'from_email': original_email,
+            'from_name': sender_name,
+            'subject': subject,
+            'date': local_date,
+            'body': body
+        }
+    
+    def _body_cache_key(self, raw=None, body_part=None):
+        """V6.1：正文缓存键（整封邮件或单独获取的正文部分 + 影响清理结果的设置），无法缓存时返回None"""
+        salt = (ContentCleaner.VERSION, CharsetDecoder.VERSION, self.body_max_chars, self.html_to_text)
+        if body_part is not None:
+            data, part, truncated = body_part
+            return self.body_cache.make_key(data, *salt, part['encoding'], part['charset'], part['content_type'],
+                                            truncated)
+        if raw is not None:
+            return self.body_cache.make_key(raw, *salt)
+        return None
+    
+    def _get_parse_pool(self, count=None):
+        """V6.1：获取解析进程池（没有配置、或邮件数量少于 parse_min_messages 时返回None）"""
+        if self.parse_workers <= 1 or (count is not None and count < self.parse_min_messages):
+            return None
+        with self._parse_pool_lock:
+            if self._parse_pool is None:
+                self._parse_pool = ParsePool(self.username, self.fetch_config, self.parse_workers,
+                                             self.parse_chunk_size)
+                logger.info(f"⚡ 使用 {self.parse_workers} 个进程并行解析邮件")
+            return self._parse_pool
+    
+    def _close_parse_pool(self):
+        """V6.1：关闭解析进程池（每次获取结束后关闭，下次需要时重新启动）"""
+        with self._parse_pool_lock:
+            if self._parse_pool is not None:
+                self._parse_pool.close()
+                self._parse_pool = None
+    
+    def _parse_raw_emails(self, raw_emails, sender_emails_lower, cutoff_date, exclude_self_lower, count=None):
+        """V6.1：解析原始邮件并生成邮件数据（配置了 parse_workers 且邮件较多时交给进程池）
+        
+        Args:
+            raw_emails: 可迭代的 (邮件编号 bytes, 原始邮件 bytes)
+            count: 邮件数量（未知时为None）
+            
+        Yields:
+            (邮件编号, 邮件数据)，不符合条件或解析失败时邮件数据为None
+        """
+        pool = self._get_parse_pool(count)
+        if pool:
+            for email_id, email_record, error in pool.parse(raw_emails, sender_emails_lower, cutoff_date,
+                                                            exclude_self_lower, self.body_cache,
+                                                            self._body_cache_key):
+                if error:
+                    logger.error(f"解析邮件 #{email_id.decode()} 失败: {error}")
+                yield email_id, email_record
+            return
+        
+        for email_id, raw_email in raw_emails:
             try:
-                charset = msg.get_content_charset() or 'utf-8'
-                body = msg.get_payload(decode=True).decode(charset, errors='ignore')
+                msg = email.message_from_bytes(raw_email)
+                email_record = self._build_email_record(email_id, msg, sender_emails_lower,
+                                                        cutoff_date, exclude_self_lower, raw=raw_email)
+            except Exception as e:
+                logger.error(f"解析邮件 #{email_id.decode()} 失败: {str(e)}")
+                email_record = None
+            yield email_id, email_record
+    
+    def iter_raw_emails(self, raw_emails, senders_dict, days=7, exclude_self=None, folder=None, now=None):
+        """V6.1：用与IMAP获取相同的解析、清理和发件人/日期过滤处理本地原始邮件（离线回放）
+        
+        Args:
+            raw_emails: [(邮件编号, 原始邮件bytes), ...]
+            senders_dict: 字典格式 {email: name}
+            days: 只保留 now 之前几天内的邮件
+            exclude_self: 要排除的自己的邮箱地址（可选）
+            folder: 邮件数据中的folder字段（来源说明）
+            now: 回放的"当前时间"（默认为现在），晚于它的邮件也会被过滤
+            
+        Yields:
+            邮件数据
+        """
+        sender_emails_lower = {email.lower(): (email, name) for email, name in senders_dict.items()}
+        exclude_self_lower = exclude_self.lower() if exclude_self else None
+        cutoff_date = (now or datetime.now()) - timedelta(days=days)
+        
+        raw_emails = ((str(email_id).encode(), raw_email) for email_id, raw_email in raw_emails)
+        try:
+            for _, email_record in self._parse_raw_emails(raw_emails, sender_emails_lower, cutoff_date,
+                                                          exclude_self_lower):
+                if email_record and (now is None or email_record['date'] <= now):
+                    email_record['folder'] = folder
+                    yield email_record
+        finally:
+            self._close_parse_pool()
+            if self.body_cache:
+                self.body_cache.flush()
+    
+    def _process_full_emails(self, email_ids, folder, sender_emails_lower, cutoff_date, exclude_self_lower,
+                             conn=None, worker_name=""):
+        """下载并解析完整邮件（按UID顺序逐封产出）"""
+        if self.body_strategy == 'bodystructure':
+            yield from self._process_partial_emails(email_ids, folder, sender_emails_lower, cutoff_date,
+                                                    exclude_self_lower, conn, worker_name)
+            return
+        
+        processed = 0
+        
+        # V6.1：批量获取，每批一次往返；解析可交给进程池，与网络收发同时进行
+        raw_emails = self._fetch_batch(email_ids, "RFC822", conn)
+        for email_id, email_record in self._parse_raw_emails(raw_emails, sender_emails_lower, cutoff_date,
+                                                             exclude_self_lower, count=len(email_ids)):
+            processed += 1
+            
+            # 更频繁的进度显示
+            if processed == 1 or processed % 10 == 0 or processed == len(email_ids):
+                logger.info(f"{worker_name}处理进度: {processed}/{len(email_ids)} 封...")
+            
+            if email_record:
+                email_record['folder'] = folder
+                yield email_record
+        
+        logger.info(f"{worker_name}邮件获取循环完成，共处理 {processed} 封")
+    
+    def _select_body_part(self, structure):
+        """V6.1：按 get_email_body 的规则从BODYSTRUCTURE中选择正文部分
+        
+        多部分邮件优先第一个非附件的text/plain，其次text/html；单部分邮件直接取正文
+        """
+        parts = list(iter_body_parts(structure))
+        if isinstance(structure, list) and structure and not isinstance(structure[0], list):
+            return parts[0] if parts else None
+        
+        candidates = [part for part in parts if not part['is_attachment']]
+        for content_type in ("text/plain", "text/html"):
+            for part in candidates:
+                if part['content_type'] == content_type:
+                    return part
+        return None
+    
+    def _decode_body_part(self, data, part, truncated):
+        """V6.1：解码部分获取的正文（传输编码 + 字符集），截断处不完整的编码和字符会被丢弃"""
+        encoding = part['encoding']
+        try:
+            if encoding == 'base64':
+                data = re.sub(rb'[^A-Za-z0-9+/=]', b'', data)
+                if truncated:
+                    data = data[:len(data) // 4 * 4]
+                data = base64.b64decode(data)
+            elif encoding == 'quoted-printable':
+                if truncated:
+                    data = re.sub(rb'=[0-9A-Fa-f]?$', b'', data)
+                data = quopri.decodestring(data)
+        except Exception as e:
+            logger.debug(f"正文解码失败: {str(e)}")
+            return ""
+        
+        text = self.charset_decoder.decode(data, part['charset'], final=not truncated)
+        if part['content_type'] == "text/html":
+            text = self._convert_html(text)
+        return text
+    
+    def _process_partial_emails(self, email_ids, folder, sender_emails_lower, cutoff_date, exclude_self_lower,
+                                conn=None, worker_name=""):
+        """V6.1：按BODYSTRUCTURE只获取正文部分（BODY.PEEK[n]<0.N>），附件不会被下载
+        
+        1. 获取 BODYSTRUCTURE 和邮件头，选出正文部分
+        2. 按部分编号分组，批量获取正文的前 body_max_bytes 字节
+        """
+        conn = conn or self.imap_conn
+        pending = []  # [(uid, 邮件头, 正文部分)]
+        
+        for chunk in chunked(email_ids, self.fetch_batch_size):
+            try:
+                status, msg_data = conn.uid('FETCH', build_message_set(chunk), "(UID BODYSTRUCTURE BODY.PEEK[HEADER])")
+            except UidValidityChangedError:
+                raise
+            except Exception as e:
+                logger.error(f"{worker_name}获取邮件结构失败 ({len(chunk)} 封): {str(e)}")
+                self._failed_uids.extend(chunk)
+                continue
+            if status != "OK":
+                logger.warning(f"{worker_name}获取邮件结构失败 ({len(chunk)} 封)")
+                self._failed_uids.extend(chunk)
+                continue
+            
+            for _, items in parse_fetch_items(msg_data):
+                header_bytes = items.get('BODY[HEADER]')
+                if not items.get('UID') or not isinstance(header_bytes, bytes):
+                    continue
+                pending.append((items['UID'].encode(), email.message_from_bytes(header_bytes),
+                                self._select_body_part(items.get('BODYSTRUCTURE'))))
+        
+        # 按部分编号分组批量获取正文
+        sections = {}
+        for uid, _, part in pending:
+            if part:
+                sections.setdefault(part['section'], []).append(uid)
+        
+        bodies = {}
+        for section, uids in sections.items():
+            fetch_item = f"BODY.PEEK[{section}]<0.{self.body_max_bytes}>"
+            for uid, data in self._fetch_batch(uids, fetch_item, conn):
+                bodies[uid] = data
+        
+        missing = []  # 正文部分没有取到的邮件
+        for processed, (uid, header_msg, part) in enumerate(pending, 1):
+            try:
+                body, body_part = "", None
+                if part:
+                    data = bodies.get(uid) or b""
+                    if not data and part['size']:
+                        missing.append(uid)
+                        continue
+                    truncated = len(data) >= self.body_max_bytes and part['size'] > self.body_max_bytes
+                    body, body_part = None, (data, part, truncated)
+                
+                email_record = self._build_email_record(uid, header_msg, sender_emails_lower,
+                                                        cutoff_date, exclude_self_lower, body=body,
+                                                        body_part=body_part)
+                if email_record:
+                    email_record['folder'] = folder
+                    yield email_record
+            except Exception as e:
+                logger.error(f"解析邮件 #{processed} 失败: {str(e)}")
+                continue
+        
+        # 正文为空的邮件不能存入邮件库和缓存、交给AI分析，改为下载完整邮件
+        if missing:
+            logger.warning(f"{worker_name}{len(missing)} 封邮件的正文部分获取失败，改为下载完整邮件")
+            raw_emails = self._fetch_batch(missing, "RFC822", conn)
+            for _, email_record in self._parse_raw_emails(raw_emails, sender_emails_lower, cutoff_date,
+                                                          exclude_self_lower, count=len(missing)):
+                if email_record:
+                    email_record['folder'] = folder
+                    yield email_record
+        
+        logger.info(f"{worker_name}邮件获取循环完成（部分获取），共处理 {len(pending)} 封")
+    
+    def _fetch_partition(self, worker_index, email_ids, folder, sender_emails_lower, cutoff_date, exclude_self_lower):
+        """V6.1：工作线程 - 用独立连接获取一段UID，连接失败时返回None（UIDVALIDITY变化时抛出异常）"""
+        worker_name = f"[连接{worker_index}] "
+        try:
+            conn = self._open_session(enable_qresync=False)
+        except Exception as e:
+            logger.warning(f"{worker_name}建立连接失败: {str(e)}，这部分邮件改用主连接获取")
+            return None
+        
+        # 连接建立后无论SELECT是否成功都要退出登录，否则失败的工作连接会一直占用服务器的连接数
+        try:
+            try:
+                status, _ = conn.select(folder)
+                if status != 'OK':
+                    raise imaplib.IMAP4.error(f"SELECT {folder} 返回 {status}")
+            except Exception as e:
+                logger.warning(f"{worker_name}选择文件夹失败: {str(e)}，这部分邮件改用主连接获取")
+                return None
+            
+            # 主连接SELECT之后UIDVALIDITY变化时，这段UID在新连接上指向的是别的邮件
+            if self.imap_conn.uidvalidity is not None and conn.uidvalidity != self.imap_conn.uidvalidity:
+                raise UidValidityChangedError(
+                    f"文件夹 {folder} 的UIDVALIDITY已变化（{self.imap_conn.uidvalidity} → {conn.uidvalidity}），需要重新同步")
+            return list(self._process_full_emails(email_ids, folder, sender_emails_lower, cutoff_date,
+                                                  exclude_self_lower, conn, worker_name))
+        finally:
+            try:
+                conn.close()
             except:
                 pass
+            try:
+                conn.logout()
+            except:
+                pass
+    
+    def _fetch_full_emails(self, email_ids, folder, sender_emails_lower, cutoff_date, exclude_self_lower):
+        """V6.1：获取完整邮件，邮件较多时用多个连接并行获取
         
-        return body.strip()
+        UID按顺序切成连续的几段，每个连接获取一段，结果按原顺序产出，
+        排序后与单连接获取的结果完全一致。
+        """
+        workers = min(self.fetch_workers, len(email_ids) // max(1, self.parallel_min_per_worker))
+        if workers <= 1:
+            yield from self._process_full_emails(email_ids, folder, sender_emails_lower, cutoff_date,
+                                                 exclude_self_lower)
+            return
+        
+        partition_size = -(-len(email_ids) // workers)
+        partitions = list(chunked(email_ids, partition_size))
+        logger.info(f"⚡ 使用 {len(partitions)} 个连接并行获取 {len(email_ids)} 封邮件")
+        
+        with ThreadPoolExecutor(max_workers=len(partitions)) as executor:
+            futures = [executor.submit(self._fetch_partition, i, partition, folder, sender_emails_lower,
+                                       cutoff_date, exclude_self_lower)
+                       for i, partition in enumerate(partitions, 1)]
+            
+            for partition, future in zip(partitions, futures):
+                partition_emails = future.result()
+                if partition_emails is None:
+                    partition_emails = self._process_full_emails(partition, folder, sender_emails_lower,
+                                                                 cutoff_date, exclude_self_lower)
+                yield from partition_emails
+    
+    def _iter_stored_emails(self, fetched_ids, senders_dict, days, exclude_self, folder):
+        """V6.1：产出邮件库中窗口内已获取过、本次没有重新获取的邮件"""
+        stored = [item for item in self.message_store.query_emails(
+                      senders_dict, days, exclude_self, account=self.username, folder=folder)
+                  if item['id'] not in fetched_ids]
+        logger.info(f"从本地邮件库读取窗口内已获取的邮件 {len(stored)} 封")
+        yield from stored
+    
+    def save_analysis(self, emails):
+        """V6.1：把AI分析结果写回本地邮件库"""
+        if self.message_store:
+            self.message_store.save_analysis(emails)
     
-    def fetch_emails_from_senders(self, senders_dict, days=7, exclude_self=None):
-        """从指定发件人获取最近几天的邮件
+    def _log_traffic(self, started, traffic_before):
+        """V6.1：记录本次获取的耗时和网络流量（启用压缩时显示压缩前后的字节数）"""
+        wire_in, wire_out, data_in, data_out = (now - before for now, before
+                                                in zip(self.traffic.snapshot(), traffic_before))
+        message = (f"📶 获取耗时 {time.monotonic() - started:.1f} 秒，"
+                   f"接收 {wire_in / 1024:.1f} KB，发送 {wire_out / 1024:.1f} KB")
+        if data_in != wire_in:
+            ratio = wire_in / data_in * 100 if data_in else 0
+            message += f"（压缩前 {data_in / 1024:.1f} KB，压缩后为 {ratio:.0f}%）"
+        logger.info(message)
+    
+    def _update_sync_checkpoint(self, checkpoint_key, uidvalidity, searched_uids, last_uid):
+        """V6.1：推进增量同步检查点（不越过获取失败的UID）"""
+        if uidvalidity is None or not searched_uids:
+            return
+        
+        new_last_uid = max(int(uid) for uid in searched_uids)
+        if self._failed_uids:
+            new_last_uid = min(int(uid) for uid in self._failed_uids) - 1
+            logger.warning(f"有 {len(self._failed_uids)} 封邮件获取失败，检查点停在 UID {new_last_uid}")
+        
+        if last_uid is not None:
+            new_last_uid = max(new_last_uid, last_uid)
+        
+        self.sync_state.update_checkpoint(checkpoint_key, uidvalidity, new_last_uid)
+    
+    def fetch_emails_from_senders(self, senders_dict, days=7, exclude_self=None, folder="INBOX"):
+        """从指定发件人获取最近几天的邮件（按日期倒序的列表，V6.1起基于 iter_emails_from_senders）
         
         Args:
             senders_dict: 字典格式 {email: name}
             days: 获取最近几天的邮件
             exclude_self: 要排除的自己的邮箱地址（可选）
+            folder: 邮箱文件夹
             
         Returns:
             邮件数据列表，每封邮件包含发件人姓名信息
         """
+        emails_data = list(self.iter_emails_from_senders(senders_dict, days, exclude_self, folder))
+        
+        # 按日期排序
+        logger.info(f"正在排序邮件...")
+        emails_data.sort(key=lambda x: x['date'], reverse=True)
+        logger.info(f"✅ 总共筛选出 {len(emails_data)} 封符合条件的邮件")
+        
+        return emails_data
+    
+    def iter_emails_from_senders(self, senders_dict, days=7, exclude_self=None, folder="INBOX", new_only=False):
+        """V6.1：逐封产出指定发件人最近几天的邮件（生成器，邮件下载后立即产出，不排序）
+        
+        调用方可以边获取边处理（清理、AI分析），不必等所有邮件下载完。
+        生成器完整遍历后才会推进增量同步检查点。
+        
+        V6.1：默认先只获取邮件头（BODY.PEEK[HEADER.FIELDS ...]），在本地按发件人和日期过滤后，
+        只下载关注发件人的完整邮件；可通过 fetch_config.header_first=false 关闭。
+        两个阶段都按 fetch_config.batch_size 批量获取，避免每封邮件一次往返。
+        
+        V6.1：使用UID命令，邮件id为稳定的UID；每次运行后按账号/文件夹保存检查点，
+        开启 fetch_config.incremental_sync 后只获取检查点之后的新邮件（UIDVALIDITY变化时重新全量扫描）。
+        
+        Args:
+            senders_dict: 字典格式 {email: name}
+            days: 获取最近几天的邮件
+            exclude_self: 要排除的自己的邮箱地址（可选）
+            folder: 邮箱文件夹
+            new_only: 只产出检查点之后的新邮件，不读取邮件库中的旧邮件（IDLE守护进程使用；
+                      没有检查点时仍扫描最近几天的邮件）
+            
+        Yields:
+            邮件数据，每封邮件包含发件人姓名信息
+        """
         if not self.imap_conn:
             logger.error("未连接到 IMAP 服务器")
-            return []
+            return
+        
+        started = time.monotonic()
+        traffic_before = self.traffic.snapshot()
         
         try:
-            self.imap_conn.select("INBOX")
+            self.imap_conn.select(folder)
+            self._failed_uids = []
+            
+            # V6.1：增量同步检查点
+            uidvalidity = self._get_uidvalidity(folder)
+            checkpoint_key = SyncStateStore.make_key(self.username, self.imap_server, folder)
+            last_uid = None
+            if uidvalidity is not None:
+                last_uid = self.sync_state.get_checkpoint(checkpoint_key, uidvalidity)
+                if self.message_store:
+                    self.message_store.purge_folder(self.username, folder, uidvalidity)
+                    if self.flag_sync:
+                        try:
+                            self._sync_store_changes(folder, uidvalidity, checkpoint_key)
+                        except UidValidityChangedError:
+                            raise
+                        except Exception as e:
+                            logger.warning(f"同步邮件标记失败，跳过: {str(e)}")
             
             # 计算日期范围（用于本地过滤）
             cutoff_date = datetime.now() - timedelta(days=days)
@@ -126,168 +1117,149 @@ class EmailClient:
             # 如果设置了exclude_self，将其转为小写
             exclude_self_lower = exclude_self.lower() if exclude_self else None
             
-            emails_data = []
-            
             logger.info(f"正在获取最近 {days} 天的邮件（将在本地过滤发件人）...")
             
-            # 尝试使用SINCE日期搜索（更精确）
-            since_date = (datetime.now() - timedelta(days=days)).strftime("%d-%b-%Y")
-            logger.info(f"尝试使用日期搜索：SINCE {since_date}")
+            if (self.incremental_sync or new_only) and last_uid is not None:
+                recent_email_ids, search_criteria = self._search_new_uids(last_uid)
+            else:
+                recent_email_ids, search_criteria = self._search_recent_ids(days)
+            if recent_email_ids is None:
+                return
+            searched_uids = list(recent_email_ids)
+            
+            # V6.1：关注的发件人较少时，先在服务器端按发件人缩小范围
+            if (search_criteria and recent_email_ids
+                    and self._should_filter_on_server(len(sender_emails_lower), len(recent_email_ids))):
+                recent_email_ids = self._filter_on_server(search_criteria, recent_email_ids,
+                                                          list(sender_emails_lower.keys()))
+            
+            # V6.1：两阶段获取，先用邮件头过滤，避免下载无关邮件的正文和附件
+            if self.header_first and recent_email_ids:
+                recent_email_ids = self._filter_by_headers(recent_email_ids, sender_emails_lower,
+                                                           cutoff_date, exclude_self_lower)
             
-            try:
-                # 尝试1：标准SINCE格式
-                status, messages = self.imap_conn.search(None, f'SINCE {since_date}')
-                
-                if status == "OK":
-                    email_ids = messages[0].split()
-                    logger.info(f"✅ 日期搜索成功！找到 {len(email_ids)} 封邮件")
-                    recent_email_ids = email_ids
-                else:
-                    raise Exception("日期搜索不支持，使用备用方案")
-                    
-            except Exception as e:
-                logger.warning(f"日期搜索失败: {str(e)}，使用备用方案（检查最近邮件）")
-                
-                # 备用方案：获取所有邮件ID，取最近的
-                try:
-                    status, messages = self.imap_conn.search(None, 'ALL')
-                    if status != "OK":
-                        logger.error("搜索邮件失败")
-                        return []
-                    
-                    email_ids = messages[0].split()
-                    total_emails = len(email_ids)
-                    logger.info(f"收件箱中共有 {total_emails} 封邮件，正在筛选...")
-                    
-                    # 只处理最近的N封邮件（避免处理过多）
-                    # 根据检查天数动态调整：3天大约100-150封邮件已经足够
-                    max_check = min(150, total_emails)  # V3.0优化：最多检查最近150封
-                    recent_email_ids = email_ids[-max_check:] if total_emails > max_check else email_ids
-                    
-                    logger.info(f"将检查最近 {len(recent_email_ids)} 封邮件（约占收件箱的 {len(recent_email_ids)*100//total_emails}%）")
-                except Exception as inner_e:
-                    logger.error(f"备用方案也失败: {str(inner_e)}")
-                    return []
-                
             # 处理邮件
             logger.info(f"开始处理邮件，总共 {len(recent_email_ids)} 封")
-            processed = 0
+            fetched_ids = set()
+            pending_store = []
+            cache_stats_before = self.body_cache.get_stats() if self.body_cache else None
             
-            for email_id in recent_email_ids:
-                try:
-                    processed += 1
-                    
-                    # 更频繁的进度显示
-                    if processed == 1 or processed % 10 == 0 or processed == len(recent_email_ids):
-                        logger.info(f"处理进度: {processed}/{len(recent_email_ids)} 封...")
-                    
-                    # 获取邮件（可能耗时）
-                    logger.debug(f"正在获取邮件 #{processed}")
-                    status, msg_data = self.imap_conn.fetch(email_id, "(RFC822)")
-                    if status != "OK":
-                        logger.warning(f"邮件 #{processed} 获取失败")
-                        continue
-                    
-                    logger.debug(f"正在解析邮件 #{processed}")
-                    msg = email.message_from_bytes(msg_data[0][1])
-                    
-                    # 提取邮件信息
-                    subject = self.decode_mime_words(msg.get("Subject", ""))
-                    from_addr = self.decode_mime_words(msg.get("From", ""))
-                    date_str = msg.get("Date", "")
-                    
-                    logger.debug(f"邮件 #{processed}: {subject[:30]}")
-                    
-                    # 解析日期
-                    try:
-                        date_tuple = email.utils.parsedate_tz(date_str)
-                        if date_tuple:
-                            local_date = datetime.fromtimestamp(email.utils.mktime_tz(date_tuple))
-                        else:
-                            local_date = datetime.now()
-                    except:
-                        local_date = datetime.now()
-                    
-                    # 过滤日期：只保留指定天数内的邮件
-                    if local_date < cutoff_date:
-                        continue
-                    
-                    # 从发件人地址中提取邮箱
-                    # 格式可能是："Name <email@example.com>" 或 "email@example.com"
-                    import re
-                    email_match = re.search(r'[\w\.-]+@[\w\.-]+', from_addr)
-                    if not email_match:
-                        continue
-                    
-                    sender_email = email_match.group(0).lower()
-                    
-                    # 过滤掉自己发送的邮件
-                    if exclude_self_lower and sender_email == exclude_self_lower:
-                        logger.debug(f"跳过自己发送的邮件: {subject}")
-                        continue
-                    
-                    # 检查是否是目标发件人
-                    if sender_email not in sender_emails_lower:
-                        continue
-                    
-                    # 获取发件人姓名
-                    original_email, sender_name = sender_emails_lower[sender_email]
-                    
-                    # 获取邮件正文（限制大小，避免过大邮件）
-                    body = self.get_email_body(msg)
-                    
-                    # 限制邮件内容大小（避免处理超大邮件）
-                    if len(body) > 10000:
-                        body = body[:10000] + "\n...(内容过长，已截断)"
-                        logger.debug(f"邮件内容过长，已截断: {subject[:30]}")
-                    
-                    # 清理邮件内容（V3.0新增）
-                    body = self.content_cleaner.clean_email_body(body)
-                    
-                    emails_data.append({
-                        'id': email_id.decode(),
-                        'from': from_addr,
-                        'from_email': original_email,
-                        'from_name': sender_name,
-                        'subject': subject,
-                        'date': local_date,
-                        'body': body
-                    })
-                        
-                except Exception as e:
-                    logger.error(f"解析邮件 #{processed} 失败: {str(e)}")
-                    continue
+            for email_record in self._fetch_full_emails(recent_email_ids, folder, sender_emails_lower,
+                                                        cutoff_date, exclude_self_lower):
+                fetched_ids.add(email_record['id'])
+                
+                # V6.1：分批写入本地邮件库
+                if self.message_store:
+                    pending_store.append(email_record)
+                    if len(pending_store) >= self.fetch_batch_size:
+                        self.message_store.save_emails(self.username, folder, uidvalidity, pending_store)
+                        pending_store = []
+                
+                yield email_record
             
-            logger.info(f"邮件获取循环完成，共处理 {processed} 封")
+            if self.body_cache:
+                self.body_cache.flush()
+                stats = self.body_cache.get_stats()
+                logger.info(f"正文缓存: 命中 {stats['hits'] - cache_stats_before['hits']} 封，"
+                            f"未命中 {stats['misses'] - cache_stats_before['misses']} 封")
             
-            # 按日期排序
-            logger.info(f"正在排序邮件...")
-            emails_data.sort(key=lambda x: x['date'], reverse=True)
-            logger.info(f"✅ 总共筛选出 {len(emails_data)} 封符合条件的邮件")
+            # V6.1：增量同步时窗口内的旧邮件直接从邮件库读取
+            if self.message_store:
+                self.message_store.save_emails(self.username, folder, uidvalidity, pending_store)
+                if self.incremental_sync and not new_only and last_uid is not None:
+                    yield from self._iter_stored_emails(fetched_ids, senders_dict, days, exclude_self, folder)
             
-            return emails_data
+            self._update_sync_checkpoint(checkpoint_key, uidvalidity, searched_uids, last_uid)
+            self._log_traffic(started, traffic_before)
             
+        except UidValidityChangedError as e:
+            # 中止本次获取且不推进检查点，下次运行时检查点因UIDVALIDITY不符而失效，重新全量扫描
+            logger.error(f"获取邮件中止，检查点未更新: {str(e)}")
         except Exception as e:
             logger.error(f"获取邮件失败: {str(e)}")
-            return []
+        finally:
+            self._close_parse_pool()
     
-    def send_email(self, to_email, subject, body_html):
-        """发送邮件（V3.0优化版 - 提高送达率）"""
-        try:
-            logger.info(f"正在发送邮件到: {to_email}")
-            
-            msg = MIMEMultipart('alternative')
-            msg['From'] = self.username
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            # 添加更多邮件头信息，提高送达率
-            msg['X-Mailer'] = 'Email Assistant V3.0'
-            msg['X-Priority'] = '3'  # 正常优先级
-            msg['Importance'] = 'Normal'
+    def _wait_readable(self, timeout):
+        """等待IMAP连接上有数据可读（读取缓冲区或SSL缓冲区中已有数据时立即返回）"""
+        sock = self.imap_conn.sock
+        if self.imap_conn.has_buffered_data():
+            return True
+        if isinstance(sock, ssl.SSLSocket) and sock.pending():
+            return True
+        readable, _, _ = select.select([sock], [], [], timeout)
+        return bool(readable)
+    
+    def _read_idle_line(self):
+        """读取IDLE期间的一行响应，连接关闭（EOF或BYE）时抛出abort"""
+        line = self.imap_conn.readline()
+        if not line:
+            raise self.imap_conn.abort("IDLE 期间连接已关闭")
+        if line.startswith(b'* BYE'):
+            raise self.imap_conn.abort(f"服务器关闭了连接: {line.strip()!r}")
+        return line
+    
+    def idle_wait(self, timeout, poll_interval=60):
+        """V6.1：IMAP IDLE - 等待服务器推送新邮件通知（需先select文件夹）
+        
+        服务器不支持IDLE时退回为等待 poll_interval 秒后NOOP轮询。
+        连接断开或被服务器关闭时抛出 imaplib.IMAP4.abort / OSError，由调用方重连。
+        
+        Args:
+            timeout: 最长等待秒数（RFC 2177 建议不超过29分钟，超时后重新IDLE）
+            poll_interval: 不支持IDLE时的轮询间隔（秒）
             
-            # 添加纯文本版本（重要！很多邮箱要求有纯文本备份）
-            text_body = f"""
+        Returns:
+            True 收到新邮件（EXISTS）通知或需要检查新邮件，False 超时
+        """
+        conn = self.imap_conn
+        if 'IDLE' not in conn.capabilities:
+            time.sleep(min(timeout, poll_interval))
+            conn.noop()
+            return True
+        
+        # imaplib（Python 3.13及以前）没有IDLE命令，这里直接收发原始命令行
+        tag = conn._new_tag()
+        conn.send(tag + b' IDLE\r\n')
+        line = self._read_idle_line()
+        if not line.startswith(b'+'):
+            raise conn.abort(f"服务器拒绝IDLE: {line.strip()!r}")
+        
+        new_mail = False
+        deadline = time.monotonic() + timeout
+        while not new_mail:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._wait_readable(remaining):
+                break
+            line = self._read_idle_line()
+            new_mail = line.rstrip().upper().endswith(b' EXISTS')
+        
+        # 结束IDLE，读取到本次IDLE命令的完成响应为止
+        conn.send(b'DONE\r\n')
+        while True:
+            line = self._read_idle_line()
+            if line.startswith(tag):
+                break
+            new_mail = new_mail or line.rstrip().upper().endswith(b' EXISTS')
+        
+        if not line.startswith(tag + b' OK'):
+            raise conn.error(f"IDLE 失败: {line.strip()!r}")
+        return new_mail
+    
+    def _build_html_message(self, to_email, subject, body_html):
+        """构建HTML邮件（V3.0优化版 - 提高送达率）"""
+        msg = MIMEMultipart('alternative')
+        msg['From'] = self.username
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        
+        # 添加更多邮件头信息，提高送达率
+        msg['X-Mailer'] = 'Email Assistant V3.0'
+        msg['X-Priority'] = '3'  # 正常优先级
+        msg['Importance'] = 'Normal'
+        
+        # 添加纯文本版本（重要！很多邮箱要求有纯文本备份）
+        text_body = f"""
 邮件助手每日报告
 
 本邮件为HTML格式，请使用支持HTML的邮件客户端查看。
@@ -302,18 +1274,28 @@ class EmailClient:
 ---
 邮件助手自动发送
 """
-            text_part = MIMEText(text_body, 'plain', 'utf-8')
-            msg.attach(text_part)
-            
-            # 添加HTML内容
-            html_part = MIMEText(body_html, 'html', 'utf-8')
-            msg.attach(html_part)
+        text_part = MIMEText(text_body, 'plain', 'utf-8')
+        msg.attach(text_part)
+        
+        # 添加HTML内容
+        html_part = MIMEText(body_html, 'html', 'utf-8')
+        msg.attach(html_part)
+        return msg
+    
+    def send_email(self, to_email, subject, body_html, report_id=None):
+        """发送邮件（V3.0优化版 - 提高送达率）
+        
+        启用发件箱（V6.1）时只加入发件箱，由后台线程发送，返回是否已加入
+        """
+        if self.outbox:
+            return self._enqueue('html', {to_email: body_html}, subject, report_id)[to_email]
+        
+        try:
+            logger.info(f"正在发送邮件到: {to_email}")
             
-            # 使用SSL连接SMTP服务器
-            context = ssl.create_default_context()
-            with smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, context=context) as server:
-                server.login(self.username, self.password)
-                server.send_message(msg)
+            msg = self._build_html_message(to_email, subject, body_html)
+            with self._create_delivery() as delivery:
+                delivery.send(msg)
             
             logger.info("邮件发送成功")
             logger.info(f"提示：如果未收到，请检查垃圾邮件、订阅邮件文件夹")
@@ -323,33 +1305,159 @@ class EmailClient:
             logger.error(f"邮件发送失败: {str(e)}")
             return False
     
-    def send_email_text(self, to_email, subject, body_text):
-        """发送纯文本邮件（V3.0 - 伪装成普通邮件，避免拦截）"""
+    def _create_delivery(self):
+        """创建SMTP发送器（V6.1：同一个会话可发送多封邮件）"""
+        config = self.delivery_config
+        return SmtpDelivery(
+            self.smtp_server, self.smtp_port, self.username, self.password,
+            use_ssl=config.get('smtp_ssl', True),
+            max_retries=config.get('max_retries', 3),
+            retry_delay=config.get('retry_delay', 5),
+            max_retry_delay=config.get('max_retry_delay', 120),
+            timeout=config.get('timeout', 60)
+        )
+    
+    def _build_text_message(self, to_email, subject, body_text):
+        """构建纯文本邮件（V3.0 - 伪装成普通邮件，避免拦截）"""
+        msg = MIMEText(body_text, 'plain', 'utf-8')
+        msg['From'] = self.username
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        # 去掉X-Mailer标识，伪装成普通邮件
+        # msg['X-Mailer'] = 'Email Assistant V3.0'
+        return msg
+    
+    def send_email_text(self, to_email, subject, body_text, report_id=None):
+        """发送纯文本邮件（V3.0 - 伪装成普通邮件，避免拦截）
+        
+        启用发件箱（V6.1）时只加入发件箱，由后台线程发送，返回是否已加入
+        """
+        if self.outbox:
+            return self._enqueue('text', {to_email: body_text}, subject, report_id)[to_email]
+        
         try:
             logger.info(f"正在发送纯文本邮件到: {to_email}")
             
-            msg = MIMEText(body_text, 'plain', 'utf-8')
-            msg['From'] = self.username
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            # 去掉X-Mailer标识，伪装成普通邮件
-            # msg['X-Mailer'] = 'Email Assistant V3.0'
-            
-            # 使用SSL连接SMTP服务器
-            context = ssl.create_default_context()
-            with smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, context=context) as server:
-                server.login(self.username, self.password)
-                server.send_message(msg)
+            msg = self._build_text_message(to_email, subject, body_text)
+            with self._create_delivery() as delivery:
+                delivery.send(msg)
             
             logger.info("✅ 纯文本邮件发送成功")
-            
-            # 添加延迟，避免频繁发送被限制
-            import time
-            time.sleep(2)
-            
             return True
             
         except Exception as e:
             logger.error(f"❌ 邮件发送失败: {str(e)}")
             return False
+    
+    def send_email_text_many(self, to_emails, subject, body_text, report_id=None):
+        """用同一个SMTP会话把纯文本邮件分别发送给多个收件人（V6.1）
+        
+        只登录一次，正常情况下不加固定延迟；服务器限流（421/4xx）时才退避重试。
+        启用发件箱时只加入发件箱，由后台线程发送
+        
+        Returns:
+            {收件人: 是否发送成功（启用发件箱时为是否已加入发件箱）}
+        """
+        return self.send_email_text_each({to_email: body_text for to_email in to_emails}, subject, report_id)
+    
+    def send_email_text_each(self, bodies, subject, report_id=None):
+        """用同一个SMTP会话给每个收件人发送各自的纯文本邮件（V6.1：个性化报告）
+        
+        Args:
+            bodies: {收件人: 邮件正文}
+        
+        Returns:
+            {收件人: 是否发送成功（启用发件箱时为是否已加入发件箱）}
+        """
+        bodies = {to_email: body_text for to_email, body_text in bodies.items() if to_email}
+        if not bodies:
+            return {}
+        
+        if self.outbox:
+            return self._enqueue('text', bodies, subject, report_id)
+        
+        messages = [(to_email, self._build_text_message(to_email, subject, body_text))
+                    for to_email, body_text in bodies.items()]
+        started = time.monotonic()
+        with self._create_delivery() as delivery:
+            errors = delivery.send_many(messages)
+            sessions = delivery.sessions
+        
+        results = {}
+        for to_email in bodies:
+            error = errors.get(to_email)
+            results[to_email] = error is None
+            if error is None:
+                logger.info(f"✅ 纯文本邮件发送成功: {to_email}")
+            else:
+                logger.error(f"❌ 邮件发送失败: {to_email}: {error}")
+        
+        logger.info(f"📤 发送完成: {sum(results.values())}/{len(results)} 封成功，"
+                    f"SMTP会话 {sessions} 个，耗时 {time.monotonic() - started:.1f} 秒")
+        return results
+    
+    def _enqueue(self, kind, bodies, subject, report_id=None):
+        """加入发件箱并唤醒后台发送线程（V6.1）
+        
+        Args:
+            bodies: {收件人: 邮件正文}
+        
+        Returns:
+            {收件人: 是否在发件箱中（新加入或之前已加入）}
+        """
+        results = {}
+        for to_email, body in bodies.items():
+            try:
+                self.outbox.enqueue(report_id or make_report_id(kind, subject, body), to_email, subject, body, kind)
+                results[to_email] = True
+            except Exception as e:
+                logger.error(f"❌ 加入发件箱失败: {to_email}: {str(e)}")
+                results[to_email] = False
+        self.start_outbox_sender()
+        return results
+    
+    def _deliver_outbox_items(self, items):
+        """发送发件箱中取出的一批邮件（共用一个SMTP会话，连接失败后其余邮件留到下次重试）
+        
+        Returns:
+            {邮件id: None（成功）或异常}
+        """
+        builders = {'text': self._build_text_message, 'html': self._build_html_message}
+        messages = [(item['id'], builders[item['kind']](item['recipient'], item['subject'], item['body']))
+                    for item in items]
+        with self._create_delivery() as delivery:
+            return delivery.send_many(messages)
+    
+    def start_outbox_sender(self):
+        """启动发件箱的后台发送线程（V6.1，会先发送上次运行遗留的邮件）"""
+        if not self.outbox:
+            return
+        if self._outbox_sender is None:
+            self._outbox_sender = OutboxSender(
+                self.outbox, self._deliver_outbox_items,
+                is_permanent=SmtpDelivery.is_permanent,
+                poll_interval=self.delivery_config.get('outbox_poll_interval', 30)
+            )
+        self._outbox_sender.start()
+    
+    def wait_outbox(self, timeout=None):
+        """等待发件箱中的邮件发送完成（V6.1）
+        
+        Args:
+            timeout: 最长等待秒数（默认取 delivery_config.outbox_wait）
+        
+        Returns:
+            是否已全部完成；超时后剩余邮件由后台线程或下次运行继续发送
+        """
+        if not self.outbox:
+            return True
+        if timeout is None:
+            timeout = self.delivery_config.get('outbox_wait', 10)
+        self.start_outbox_sender()
+        return self._outbox_sender.wait(timeout)
+    
+    def stop_outbox_sender(self, timeout=5):
+        """停止发件箱的后台发送线程（最多等待 timeout 秒；线程是守护线程，正在退避重试时不阻塞退出）"""
+        if self._outbox_sender:
+            self._outbox_sender.stop(timeout)
 
@@ -0,0 +1,196 @@
+"""
+本地IMAP测试服务器 - V6.1
+只实现 EmailClient / IdleDaemon 用到的最小命令集（LOGIN、SELECT、UID SEARCH、UID FETCH、IDLE等），
+邮件保存在内存中，用于在不连接真实邮箱的情况下测试获取、增量同步和IDLE推送
+"""
+import re
+import socket
+import socketserver
+import threading
+
+
+class FakeImapServer:
+    """内存中的单文件夹IMAP服务器（明文，监听 127.0.0.1 的随机端口）"""
+
+    def __init__(self, capabilities=('IMAP4rev1', 'IDLE'), uidvalidity=1):
+        self.capabilities = ' '.join(capabilities)
+        self.uidvalidity = uidvalidity
+        self.messages = []          # [(uid, 原始邮件bytes)]
+        self.next_uid = 1
+        self.arrive_on_idle = []    # 下次收到IDLE时投递的邮件（EXISTS与"+ idling"在同一次发送中）
+        self.commands = []          # 收到的命令（不含tag），便于测试断言
+        self._lock = threading.Lock()
+        self._idling = set()        # 正在IDLE的连接
+        self._connections = set()
+
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                server._handle(self.request, self.rfile)
+
+        self._server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-imap", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务器并断开所有连接"""
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def add_message(self, raw):
+        """添加邮件（不通知客户端），返回UID"""
+        with self._lock:
+            uid = self.next_uid
+            self.next_uid += 1
+            self.messages.append((uid, raw))
+            return uid
+
+    def deliver(self, raw):
+        """投递新邮件，并向正在IDLE的连接推送 * N EXISTS，返回UID"""
+        uid = self.add_message(raw)
+        with self._lock:
+            idling = list(self._idling)
+            exists = len(self.messages)
+        for conn in idling:
+            conn.sendall(f"* {exists} EXISTS\r\n".encode())
+        return uid
+
+    # ---------------- 协议处理 ----------------
+
+    def _handle(self, conn, rfile):
+        with self._lock:
+            self._connections.add(conn)
+        try:
+            conn.sendall(f"* OK [CAPABILITY {self.capabilities}] fake imap ready\r\n".encode())
+            while True:
+                line = rfile.readline()
+                if not line:
+                    return
+                tag, _, rest = line.decode('utf-8', errors='replace').rstrip('\r\n').partition(' ')
+                command, _, args = rest.partition(' ')
+                command = command.upper()
+                if command == 'UID':
+                    command, _, args = args.partition(' ')
+                    command = 'UID ' + command.upper()
+                self.commands.append(f"{command} {args}".strip())
+
+                if command == 'IDLE':
+                    if not self._idle(conn, rfile, tag):
+                        return
+                    continue
+                if not self._dispatch(conn, tag, command, args):
+                    return
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._idling.discard(conn)
+                self._connections.discard(conn)
+
+    def _dispatch(self, conn, tag, command, args):
+        """处理一条命令，返回False表示连接结束"""
+        out = []
+        if command == 'CAPABILITY':
+            out.append(f"* CAPABILITY {self.capabilities}")
+        elif command in ('SELECT', 'EXAMINE'):
+            with self._lock:
+                out.append(f"* {len(self.messages)} EXISTS")
+                out.append(f"* OK [UIDVALIDITY {self.uidvalidity}] UIDs valid")
+                out.append(f"* OK [UIDNEXT {self.next_uid}] predicted next UID")
+        elif command == 'STATUS':
+            out.append(f"* STATUS INBOX (UIDVALIDITY {self.uidvalidity} UIDNEXT {self.next_uid})")
+        elif command == 'UID SEARCH':
+            out.append("* SEARCH " + ' '.join(str(uid) for uid in self._search(args)))
+        elif command == 'UID FETCH':
+            conn.sendall(self._fetch(args))
+        elif command == 'LOGOUT':
+            conn.sendall(f"* BYE logging out\r\n{tag} OK LOGOUT completed\r\n".encode())
+            return False
+        elif command not in ('LOGIN', 'NOOP', 'CLOSE', 'ENABLE'):
+            conn.sendall(f"{tag} BAD unsupported command\r\n".encode())
+            return True
+        out.append(f"{tag} OK {command} completed")
+        conn.sendall(''.join(line + '\r\n' for line in out).encode())
+        return True
+
+    def _idle(self, conn, rfile, tag):
+        """IDLE：先回复继续请求（有待投递邮件时在同一次发送中推送EXISTS），等待客户端发送DONE"""
+        with self._lock:
+            arrivals, self.arrive_on_idle = self.arrive_on_idle, []
+        for raw in arrivals:
+            self.add_message(raw)
+        with self._lock:
+            response = b"+ idling\r\n"
+            if arrivals:
+                response += f"* {len(self.messages)} EXISTS\r\n".encode()
+            self._idling.add(conn)
+        conn.sendall(response)
+
+        line = rfile.readline()
+        with self._lock:
+            self._idling.discard(conn)
+        if not line:
+            return False
+        conn.sendall(f"{tag} OK IDLE terminated\r\n".encode())
+        return True
+
+    def _uids(self):
+        with self._lock:
+            return [uid for uid, _ in self.messages]
+
+    def _search(self, criteria):
+        """支持 UID n:* 和其他任意条件（返回全部邮件）"""
+        uids = self._uids()
+        match = re.search(r'UID (\d+):\*', criteria, re.I)
+        if match:
+            start = int(match.group(1))
+            selected = [uid for uid in uids if uid >= start]
+            # 与真实服务器相同：n:* 没有匹配时返回最后一封
+            return selected or uids[-1:]
+        return uids
+
+    def _parse_set(self, message_set):
+        uids = self._uids()
+        top = uids[-1] if uids else 0
+        wanted = set()
+        for item in message_set.split(','):
+            start, _, end = item.partition(':')
+            start = top if start == '*' else int(start)
+            end = start if not end else (top if end == '*' else int(end))
+            wanted.update(range(min(start, end), max(start, end) + 1))
+        return wanted
+
+    def _fetch(self, args):
+        """UID FETCH：支持 RFC822、BODY.PEEK[HEADER...]、FLAGS"""
+        message_set, _, items = args.partition(' ')
+        items = items.upper()
+        wanted = self._parse_set(message_set)
+        with self._lock:
+            messages = [(seq, uid, raw) for seq, (uid, raw) in enumerate(self.messages, 1) if uid in wanted]
+
+        out = b""
+        for seq, uid, raw in messages:
+            parts = [f"UID {uid}".encode()]
+            if 'FLAGS' in items:
+                parts.append(b"FLAGS ()")
+            if 'RFC822' in items:
+                parts.append(f"RFC822 {{{len(raw)}}}\r\n".encode() + raw)
+            elif 'BODY.PEEK[HEADER' in items:
+                header = raw.split(b'\r\n\r\n', 1)[0] + b'\r\n\r\n'
+                parts.append(f"BODY[HEADER] {{{len(header)}}}\r\n".encode() + header)
+            out += f"* {seq} FETCH (".encode() + b' '.join(parts) + b")\r\n"
+        return out
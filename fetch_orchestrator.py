@@ -0,0 +1,137 @@
+"""
+邮件获取编排模块 - V6.1
+同时从多个邮箱账号/文件夹获取邮件，按Message-ID去重后合并为一个邮件流
+"""
+import queue
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from email_client import EmailClient
+from message_store import MessageStore
+from sync_state import SyncStateStore
+
+logger = logging.getLogger(__name__)
+
+
+class FetchOrchestrator:
+    """多账号/多文件夹邮件获取"""
+
+    def __init__(self, config):
+        """初始化
+
+        Args:
+            config: config.json配置，mail_sources 为邮件来源列表：
+                [{"folders": ["INBOX", "客户"]},                       # 默认账号（email_account）
+                 {"email_account": {...}, "folders": ["INBOX"]}]       # 其他账号，如团队共享邮箱
+                每个来源还可以用 fetch_config 覆盖全局的 fetch_config
+        """
+        self.fetch_config = config.get('fetch_config', {})
+        self.sources = self._build_sources(config)
+        self.max_workers = max(1, min(config.get('fetch_concurrency', 4), len(self.sources) or 1))
+
+        # 所有来源共享检查点和邮件库，避免多个实例互相覆盖
+        self.sync_state = SyncStateStore(self.fetch_config.get('sync_state_dir', 'sync_state'))
+        self.message_store = None
+        if self.fetch_config.get('message_store', False):
+            self.message_store = MessageStore(self.fetch_config.get('message_store_path', 'data/messages.db'))
+
+    @staticmethod
+    def _build_sources(config):
+        """展开为 [(邮箱账号配置, 文件夹, 获取配置), ...]"""
+        default_account = config['email_account']
+        fetch_config = config.get('fetch_config', {})
+        sources = []
+        for source in config.get('mail_sources') or [{}]:
+            account = source.get('email_account', default_account)
+            source_fetch_config = {**fetch_config, **source.get('fetch_config', {})}
+            for folder in source.get('folders', ['INBOX']):
+                sources.append((account, folder, source_fetch_config))
+        return sources
+
+    def _create_client(self, account, fetch_config):
+        """为一个来源创建邮件客户端（每个来源独立的IMAP连接）"""
+        return EmailClient(
+            username=account['username'],
+            password=account['password'],
+            imap_server=account['imap_server'],
+            imap_port=account['imap_port'],
+            smtp_server=account.get('smtp_server', ''),
+            smtp_port=account.get('smtp_port', 465),
+            fetch_config=fetch_config,
+            sync_state=self.sync_state,
+            message_store=self.message_store
+        )
+
+    def _fetch_source(self, account, folder, fetch_config, senders_dict, days, exclude_self, email_queue):
+        """获取一个来源的邮件，逐封放入队列"""
+        label = f"{account['username']}/{folder}"
+        client = self._create_client(account, fetch_config)
+        count = 0
+        try:
+            if not client.connect_imap():
+                logger.error(f"[{label}] 无法连接到邮箱服务器，跳过")
+                return
+            for email_item in client.iter_emails_from_senders(senders_dict, days, exclude_self, folder):
+                email_queue.put(email_item)
+                count += 1
+            logger.info(f"[{label}] 获取完成: {count} 封")
+        except Exception as e:
+            logger.error(f"[{label}] 获取邮件失败: {str(e)}")
+        finally:
+            client.disconnect_imap()
+
+    @staticmethod
+    def _dedupe_key(email_item):
+        """去重key：Message-ID（没有时用 账号/文件夹/UID）"""
+        message_id = email_item.get('message_id', '').strip().lower()
+        if message_id:
+            return message_id
+        return (email_item.get('account'), email_item.get('folder'), email_item['id'])
+
+    def iter_emails_from_senders(self, senders_dict, days=7, exclude_self=None):
+        """同时从所有来源获取邮件，去重后逐封产出（接口与 EmailClient.iter_emails_from_senders 相同）
+
+        Yields:
+            邮件数据（包含 account、folder 字段），按到达顺序，不排序
+        """
+        logger.info(f"从 {len(self.sources)} 个来源获取邮件（并发 {self.max_workers}）...")
+        email_queue = queue.Queue()
+        done = object()
+
+        def run(source):
+            try:
+                self._fetch_source(*source, senders_dict, days, exclude_self, email_queue)
+            finally:
+                email_queue.put(done)
+
+        seen = set()
+        duplicates = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="mail-source") as executor:
+            for source in self.sources:
+                executor.submit(run, source)
+
+            remaining = len(self.sources)
+            while remaining:
+                email_item = email_queue.get()
+                if email_item is done:
+                    remaining -= 1
+                    continue
+
+                key = self._dedupe_key(email_item)
+                if key in seen:
+                    duplicates += 1
+                    continue
+                seen.add(key)
+                yield email_item
+
+        logger.info(f"✅ 多来源获取完成: {len(seen)} 封（去重 {duplicates} 封）")
+
+    def save_analysis(self, emails):
+        """把AI分析结果写回共享的本地邮件库"""
+        if self.message_store:
+            self.message_store.save_analysis(emails)
+
+    def fetch_emails_from_senders(self, senders_dict, days=7, exclude_self=None):
+        """同时从所有来源获取邮件（按日期倒序的列表）"""
+        emails_data = list(self.iter_emails_from_senders(senders_dict, days, exclude_self))
+        emails_data.sort(key=lambda x: x['date'], reverse=True)
+        return emails_data
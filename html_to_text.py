@@ -0,0 +1,143 @@
+"""
+HTML转文本模块 - V6.1
+基于标准库 html.parser 逐块解析HTML正文：丢弃 style/script 等不可见内容，解码实体，
+块级元素换行，合并多余空白，达到字符上限后立即停止解析，减少发送给AI的内容
+"""
+import re
+from html.parser import HTMLParser
+
+# 内容不可见的元素
+SKIP_TAGS = {'script', 'style', 'head', 'title', 'noscript', 'template', 'svg', 'object', 'iframe', 'xml'}
+
+# 块级元素（前后换行）
+BLOCK_TAGS = {
+    'p', 'div', 'br', 'hr', 'li', 'ul', 'ol', 'dl', 'dt', 'dd', 'tr', 'table', 'thead', 'tbody', 'tfoot',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'pre', 'address', 'section', 'article', 'header',
+    'footer', 'nav', 'aside', 'form', 'fieldset', 'figure', 'figcaption', 'center', 'caption',
+}
+
+# 单元格之间用空格分隔
+CELL_TAGS = {'td', 'th'}
+
+_WHITESPACE_RE = re.compile(r'[ \t\n\r\f\xa0]+')
+
+
+class HtmlTextExtractor(HTMLParser):
+    """增量HTML转文本（可多次 feed，达到字符上限后 done 为True，之后的内容被忽略）"""
+
+    def __init__(self, max_chars=None):
+        """初始化
+
+        Args:
+            max_chars: 最多输出的字符数（None 表示不限制）
+        """
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.done = False
+        self._parts = []
+        self._length = 0
+        self._skip_depth = 0
+        self._pre_depth = 0
+        self._at_line_start = True
+        self._pending_space = False
+
+    def _emit(self, text):
+        if self.max_chars is not None and self._length + len(text) >= self.max_chars:
+            text = text[:self.max_chars - self._length]
+            self.done = True
+        self._parts.append(text)
+        self._length += len(text)
+        if text:
+            self._at_line_start = text.endswith('\n')
+
+    def _newline(self):
+        self._pending_space = False
+        if not self._at_line_start:
+            self._emit('\n')
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == 'body':
+            # 未闭合的 <head> 等不应吞掉正文
+            self._skip_depth = 0
+        elif tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif self._skip_depth:
+            return
+        elif tag == 'br':
+            self._pending_space = False
+            self._emit('\n')
+        elif tag in BLOCK_TAGS:
+            self._newline()
+            if tag == 'pre':
+                self._pre_depth += 1
+        elif tag in CELL_TAGS:
+            self._pending_space = not self._at_line_start
+
+    def handle_startendtag(self, tag, attrs):
+        # <br/> 等自闭合标签没有结束标签
+        self.handle_starttag(tag, attrs)
+        if tag in SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_endtag(self, tag):
+        if self.done:
+            return
+        if tag in SKIP_TAGS:
+            if self._skip_depth:
+                self._skip_depth -= 1
+        elif self._skip_depth:
+            return
+        elif tag in BLOCK_TAGS and tag != 'br':
+            self._newline()
+            if tag == 'pre' and self._pre_depth:
+                self._pre_depth -= 1
+
+    def handle_data(self, data):
+        if self.done or self._skip_depth:
+            return
+        if self._pre_depth:
+            self._pending_space = False
+            self._emit(data)
+            return
+
+        text = _WHITESPACE_RE.sub(' ', data)
+        if text.startswith(' '):
+            self._pending_space = True
+            text = text[1:]
+        if not text:
+            return
+        if self._pending_space and not self._at_line_start:
+            text = ' ' + text
+        self._pending_space = text.endswith(' ')
+        self._emit(text.rstrip(' '))
+
+    def get_text(self):
+        """已转换的文本"""
+        return ''.join(self._parts)
+
+
+def html_to_text(html, max_chars=None, chunk_size=8192):
+    """把HTML正文转换为纯文本
+
+    Args:
+        html: HTML字符串
+        max_chars: 最多输出的字符数，达到后停止解析剩余的HTML（None 表示不限制）
+        chunk_size: 每次送入解析器的字符数
+
+    Returns:
+        纯文本
+    """
+    # 部分获取的正文可能截断在标签中间，丢弃不完整的标签
+    last_open = html.rfind('<')
+    if last_open > html.rfind('>'):
+        html = html[:last_open]
+
+    extractor = HtmlTextExtractor(max_chars)
+    for start in range(0, len(html), chunk_size):
+        extractor.feed(html[start:start + chunk_size])
+        if extractor.done:
+            return extractor.get_text()
+    extractor.close()
+    return extractor.get_text()
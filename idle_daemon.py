@@ -0,0 +1,189 @@
+"""
+IDLE守护进程 - V6.1
+长连接IMAP IDLE，关注的发件人来新邮件后几秒内完成清理和AI分析，
+分析结果保存在本地邮件库和AI缓存中，每日报告（main_v4）运行时直接复用
+"""
+import imaplib
+import json
+import logging
+import sys
+import time
+from datetime import datetime
+from email_client import EmailClient
+from ai_analyzer import AIAnalyzer
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(f'idle_daemon_{datetime.now().strftime("%Y%m%d")}.log', encoding='utf-8'),
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+
+logger = logging.getLogger(__name__)
+
+
+def load_config(config_file='config.json'):
+    """加载配置文件"""
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        logger.info("配置文件加载成功")
+        return config
+    except Exception as e:
+        logger.error(f"加载配置文件失败: {str(e)}")
+        sys.exit(1)
+
+
+def load_senders(config):
+    """加载关注的发件人和发件人类型映射（与main_v4相同：优先人员文件，其次config.json）
+
+    Returns:
+        (all_senders {email: name}, sender_type_map {email: type})
+    """
+    from person_manager import PersonManager
+    person_mgr = PersonManager(persons_root='persons')
+
+    if person_mgr.has_profiles():
+        customers = person_mgr.get_persons_by_type('customer')
+        suppliers = person_mgr.get_persons_by_type('supplier')
+        all_senders = person_mgr.get_all_key_senders()
+    else:
+        customers = config.get('customers', {})
+        suppliers = config.get('suppliers', {})
+        all_senders = {}
+        for key in ('leaders', 'project_managers', 'employees', 'customers', 'suppliers'):
+            all_senders.update(config.get(key, {}))
+
+    sender_type_map = {}
+    for email in customers.keys():
+        sender_type_map[email] = 'customer'
+    for email in suppliers.keys():
+        sender_type_map[email] = 'supplier'
+
+    return all_senders, sender_type_map
+
+
+class IdleDaemon:
+    """IMAP IDLE守护进程"""
+
+    def __init__(self, config, client=None, ai_analyzer=None):
+        """初始化守护进程
+
+        Args:
+            config: config.json配置（idle_config为守护进程配置）
+            client: EmailClient（可选，默认按email_account创建）
+            ai_analyzer: AIAnalyzer（可选，默认按ai_config创建）
+        """
+        idle_config = config.get('idle_config', {})
+        self.folder = idle_config.get('folder', 'INBOX')
+        self.days = idle_config.get('days', config.get('days_to_check', 1))
+        self.idle_timeout = idle_config.get('idle_timeout', 1500)  # RFC 2177：29分钟内需重新IDLE
+        self.poll_interval = idle_config.get('poll_interval', 60)
+        self.reconnect_delay = idle_config.get('reconnect_delay', 5)
+        self.max_reconnect_delay = idle_config.get('max_reconnect_delay', 300)
+
+        if client is None:
+            email_account = config['email_account']
+            client = EmailClient(
+                username=email_account['username'],
+                password=email_account['password'],
+                imap_server=email_account['imap_server'],
+                imap_port=email_account['imap_port'],
+                smtp_server=email_account['smtp_server'],
+                smtp_port=email_account['smtp_port'],
+                fetch_config=config.get('fetch_config', {})
+            )
+        self.client = client
+        self.ai_analyzer = ai_analyzer or AIAnalyzer(config.get('ai_config', {}))
+        self.self_email = config.get('self_email', client.username)
+        self.senders, self.sender_type_map = load_senders(config)
+
+        self.running = False
+        self.processed_count = 0
+
+        if not self.client.message_store:
+            logger.warning("未启用本地邮件库（fetch_config.message_store），分析结果只保存在AI缓存中")
+
+    def _connect(self):
+        """连接并选择文件夹，失败时按指数退避重试，直到成功或守护进程停止"""
+        delay = self.reconnect_delay
+        while self.running:
+            self.client.disconnect_imap()
+            if self.client.connect_imap():
+                status, _ = self.client.imap_conn.select(self.folder)
+                if status == 'OK':
+                    return True
+                logger.error(f"选择文件夹失败: {self.folder}")
+
+            logger.info(f"{delay} 秒后重新连接...")
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+        return False
+
+    def process_new_mail(self):
+        """获取检查点之后的新邮件并立即分析
+
+        Returns:
+            本次处理的邮件列表
+        """
+        email_iter = self.client.iter_emails_from_senders(self.senders, self.days, exclude_self=self.self_email,
+                                                          folder=self.folder, new_only=True)
+        if self.ai_analyzer.is_available():
+            emails = self.ai_analyzer.analyze_emails_stream(email_iter, self.sender_type_map)
+            self.client.save_analysis(emails)
+        else:
+            emails = list(email_iter)
+
+        for email_item in emails:
+            analysis = email_item.get('ai_analysis') or {}
+            urgency = analysis.get('urgency', '-')
+            logger.info(f"📬 [{urgency}] {email_item['from_name']}: {email_item['subject'][:50]}")
+
+        self.processed_count += len(emails)
+        return emails
+
+    def run(self):
+        """运行守护进程（Ctrl+C 或 stop() 停止）"""
+        logger.info("=" * 50)
+        logger.info(f"IDLE守护进程启动: {self.client.username} / {self.folder}")
+        logger.info(f"关注发件人: {len(self.senders)} 个")
+        logger.info("=" * 50)
+
+        self.running = True
+        try:
+            while self.running:
+                if not self._connect():
+                    break
+
+                try:
+                    # 连接（或重连）后先补上离线期间的新邮件
+                    self.process_new_mail()
+                    while self.running:
+                        self.client.idle_wait(self.idle_timeout, self.poll_interval)
+                        # IDLE超时也检查一次，避免漏掉通知
+                        self.process_new_mail()
+                except (imaplib.IMAP4.abort, imaplib.IMAP4.error, OSError) as e:
+                    logger.warning(f"IMAP连接中断，准备重连: {str(e)}")
+        except KeyboardInterrupt:
+            logger.info("收到停止信号")
+        finally:
+            self.running = False
+            self.client.disconnect_imap()
+            logger.info(f"IDLE守护进程已停止，共处理 {self.processed_count} 封邮件")
+
+    def stop(self):
+        """请求停止（当前IDLE结束后退出）"""
+        self.running = False
+
+
+def main():
+    """主函数"""
+    config = load_config()
+    IdleDaemon(config).run()
+
+
+if __name__ == '__main__':
+    main()
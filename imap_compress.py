@@ -0,0 +1,123 @@
+"""
+IMAP压缩模块 - V6.1
+COMPRESS=DEFLATE（RFC 4978）：协商成功后透明地压缩/解压连接上的所有数据，
+并统计网络上实际传输的字节数，用于在日志中对比压缩效果。
+无论是否压缩，读取都经过同一个缓冲区，has_buffered_data() 能准确判断是否还有未读数据（IDLE等待时使用）
+"""
+import imaplib
+import threading
+import zlib
+
+
+class TrafficStats:
+    """IMAP流量统计（多个连接可共享同一个实例）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.wire_received = 0   # 网络上收到的字节数（压缩后）
+        self.wire_sent = 0
+        self.data_received = 0   # 解压后的IMAP数据字节数
+        self.data_sent = 0
+
+    def add(self, wire_received=0, wire_sent=0, data_received=0, data_sent=0):
+        with self._lock:
+            self.wire_received += wire_received
+            self.wire_sent += wire_sent
+            self.data_received += data_received
+            self.data_sent += data_sent
+
+    def snapshot(self):
+        """返回当前计数 (wire_received, wire_sent, data_received, data_sent)"""
+        with self._lock:
+            return self.wire_received, self.wire_sent, self.data_received, self.data_sent
+
+
+class _CompressMixin:
+    """为imaplib连接增加COMPRESS=DEFLATE和流量统计"""
+
+    def _init_compress(self, traffic):
+        self.traffic = traffic or TrafficStats()
+        self.compressing = False
+        self._compressor = None
+        self._decompressor = None
+        self._rbuf = bytearray()
+
+    def start_compression(self):
+        """发送 COMPRESS DEFLATE，成功后之后的数据都经过压缩
+
+        Returns:
+            是否已启用压缩
+        """
+        if self.compressing:
+            return True
+        typ, _ = self.xatom('COMPRESS', 'DEFLATE')
+        if typ != 'OK':
+            return False
+
+        # RFC 4978：原始deflate流（无zlib头），每条命令后SYNC_FLUSH
+        self._compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self._decompressor = zlib.decompressobj(-15)
+        self.compressing = True
+        # OK响应之后已读入缓冲区的数据已经是压缩数据
+        if self._rbuf:
+            self._rbuf = bytearray(self._decompressor.decompress(bytes(self._rbuf)))
+        return True
+
+    def has_buffered_data(self):
+        """是否有已读入缓冲区但尚未处理的数据（此时socket可能不再可读）"""
+        return bool(self._rbuf)
+
+    def _fill(self):
+        """从socket读取一块数据（压缩时先解压）到缓冲区，连接关闭时返回False"""
+        data = self.sock.recv(65536)
+        if not data:
+            return False
+        plain = self._decompressor.decompress(data) if self.compressing else data
+        self.traffic.add(wire_received=len(data), data_received=len(plain))
+        self._rbuf.extend(plain)
+        return True
+
+    def read(self, size):
+        # 不使用 imaplib 的 self.file（BufferedReader）：它缓冲的数据 select() 看不到
+        while len(self._rbuf) < size and self._fill():
+            pass
+        data = bytes(self._rbuf[:size])
+        del self._rbuf[:size]
+        return data
+
+    def readline(self):
+        while True:
+            end = self._rbuf.find(b'\n')
+            if end >= 0:
+                break
+            if len(self._rbuf) > imaplib._MAXLINE:
+                raise self.error(f"got more than {imaplib._MAXLINE} bytes")
+            if not self._fill():
+                end = len(self._rbuf) - 1
+                break
+        line = bytes(self._rbuf[:end + 1])
+        del self._rbuf[:end + 1]
+        return line
+
+    def send(self, data):
+        plain_size = len(data)
+        if self.compressing:
+            data = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.traffic.add(wire_sent=len(data), data_sent=plain_size)
+        super().send(data)
+
+
+class CompressedIMAP4(_CompressMixin, imaplib.IMAP4):
+    """支持COMPRESS=DEFLATE的IMAP4连接"""
+
+    def __init__(self, host='', port=imaplib.IMAP4_PORT, traffic=None, **kwargs):
+        self._init_compress(traffic)
+        super().__init__(host, port, **kwargs)
+
+
+class CompressedIMAP4_SSL(_CompressMixin, imaplib.IMAP4_SSL):
+    """支持COMPRESS=DEFLATE的IMAP4_SSL连接"""
+
+    def __init__(self, host='', port=imaplib.IMAP4_SSL_PORT, traffic=None, **kwargs):
+        self._init_compress(traffic)
+        super().__init__(host, port, **kwargs)
@@ -0,0 +1,164 @@
+"""
+IMAP会话模块 - V6.1
+包装imaplib连接：检测断开的连接，按指数退避重连、重新选择文件夹并重试当前命令，
+长时间空闲后先NOOP探测连接是否还活着。UID在重连后不变，批量获取可以从中断的批次继续
+"""
+import imaplib
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class UidValidityChangedError(imaplib.IMAP4.error):
+    """重连后文件夹的UIDVALIDITY已变化，之前的UID全部失效，不能续传"""
+
+
+class ImapSession:
+    """可自动重连的IMAP会话
+
+    未包装的属性和方法（capabilities、response、logout等）直接转发给当前的imaplib连接。
+    """
+
+    def __init__(self, connect, on_connect=None, retries=3, reconnect_delay=2, max_reconnect_delay=60,
+                 keepalive_interval=300):
+        """建立会话（首次连接失败时直接抛出异常）
+
+        Args:
+            connect: 返回已登录imaplib连接的函数
+            on_connect: 每次（重新）连接后调用，参数为新连接（如启用QRESYNC）
+            retries: 命令失败后最多重连重试的次数
+            reconnect_delay: 第一次重连前等待的秒数（之后每次翻倍）
+            max_reconnect_delay: 重连等待的最大秒数
+            keepalive_interval: 空闲超过该秒数后，下一条命令前先NOOP探测连接（0 表示不探测）
+        """
+        self.conn = None
+        self._connect = connect
+        self._on_connect = on_connect
+        self.retries = retries
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.keepalive_interval = keepalive_interval
+
+        self.folder = None
+        self.readonly = False
+        self.uidvalidity = None
+        self.reconnects = 0
+        self.last_activity = 0
+
+        self._open()
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get('conn')
+        if conn is None:
+            raise AttributeError(name)
+        return getattr(conn, name)
+
+    def _open(self):
+        """建立新连接"""
+        conn = self._connect()
+        if self._on_connect:
+            self._on_connect(conn)
+        self.conn = conn
+        self.last_activity = time.monotonic()
+
+    def _peek_uidvalidity(self):
+        """读取SELECT响应中的UIDVALIDITY（不取走，调用方仍可用 response('UIDVALIDITY') 读取）"""
+        data = self.conn.untagged_responses.get('UIDVALIDITY')
+        try:
+            return int(data[-1]) if data else None
+        except (TypeError, ValueError):
+            return None
+
+    def _drop_connection(self):
+        """丢弃已断开的连接"""
+        try:
+            self.conn.shutdown()
+        except Exception:
+            pass
+
+    def _reconnect(self, error):
+        """重连并重新选择文件夹，按指数退避重试，全部失败时抛出abort"""
+        self._drop_connection()
+        delay = self.reconnect_delay
+
+        for attempt in range(1, self.retries + 1):
+            logger.warning(f"IMAP连接中断（{error}），{delay} 秒后第 {attempt}/{self.retries} 次重连...")
+            time.sleep(delay)
+            try:
+                self._open()
+                if self.folder is not None:
+                    self._reselect()
+                self.reconnects += 1
+                logger.info(f"IMAP重连成功{f'，已重新选择文件夹 {self.folder}' if self.folder else ''}")
+                return
+            except UidValidityChangedError:
+                raise
+            except (imaplib.IMAP4.error, OSError) as e:
+                error = e
+                self._drop_connection()
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+        raise imaplib.IMAP4.abort(f"IMAP重连失败（已重试 {self.retries} 次）: {error}")
+
+    def _reselect(self):
+        """重连后重新选择原来的文件夹，并确认UID仍然有效"""
+        status, _ = self.conn.select(self.folder, self.readonly)
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"重新选择文件夹失败: {self.folder}")
+
+        uidvalidity = self._peek_uidvalidity()
+        if self.uidvalidity is not None and uidvalidity is not None and uidvalidity != self.uidvalidity:
+            raise UidValidityChangedError(
+                f"文件夹 {self.folder} 的UIDVALIDITY已变化（{self.uidvalidity} → {uidvalidity}），需要重新同步")
+
+    def _keepalive(self):
+        """空闲过久时先NOOP探测，连接已断开则重连"""
+        if not self.keepalive_interval or time.monotonic() - self.last_activity < self.keepalive_interval:
+            return
+        try:
+            self.conn.noop()
+            self.last_activity = time.monotonic()
+        except (imaplib.IMAP4.abort, OSError) as e:
+            self._reconnect(e)
+
+    def _call(self, name, *args):
+        """执行命令，连接断开时重连后重试（服务器返回NO/BAD不重试）"""
+        self._keepalive()
+        for attempt in range(self.retries + 1):
+            try:
+                result = getattr(self.conn, name)(*args)
+                self.last_activity = time.monotonic()
+                return result
+            except (imaplib.IMAP4.abort, OSError) as e:
+                if attempt >= self.retries:
+                    raise
+                self._reconnect(e)
+
+    def select(self, mailbox='INBOX', readonly=False):
+        """选择文件夹（重连后会自动重新选择）"""
+        result = self._call('select', mailbox, readonly)
+        if result[0] == 'OK':
+            self.folder = mailbox
+            self.readonly = readonly
+            self.uidvalidity = self._peek_uidvalidity()
+        return result
+
+    def uid(self, command, *args):
+        return self._call('uid', command, *args)
+
+    def search(self, charset, *criteria):
+        return self._call('search', charset, *criteria)
+
+    def fetch(self, message_set, message_parts):
+        return self._call('fetch', message_set, message_parts)
+
+    def status(self, mailbox, names):
+        return self._call('status', mailbox, names)
+
+    def noop(self):
+        return self._call('noop')
+
+    def close(self):
+        self.folder = None
+        return self.conn.close()
@@ -0,0 +1,292 @@
+"""
+IMAP工具模块 - V6.1
+构造消息集合（message set）并解析批量FETCH的多段响应
+"""
+import re
+
+# FETCH响应开头的消息编号，如 b'12 (UID 345 RFC822 {2048}'
+_FETCH_START = re.compile(rb'^(\d+) \(')
+_FETCH_UID = re.compile(rb'\bUID (\d+)')
+
+
+def chunked(items, size):
+    """将列表按固定大小切分"""
+    size = max(1, int(size))
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def build_message_set(ids):
+    """把邮件编号列表压缩为IMAP消息集合
+
+    例如 [1, 2, 3, 5, 7, 8] -> '1:3,5,7:8'
+
+    Args:
+        ids: 邮件编号列表（bytes/str/int均可）
+
+    Returns:
+        消息集合字符串
+    """
+    numbers = sorted({int(i) for i in ids})
+    if not numbers:
+        return ''
+
+    ranges = []
+    start = prev = numbers[0]
+    for n in numbers[1:]:
+        if n == prev + 1:
+            prev = n
+            continue
+        ranges.append(f"{start}:{prev}" if start != prev else str(start))
+        start = prev = n
+    ranges.append(f"{start}:{prev}" if start != prev else str(start))
+
+    return ','.join(ranges)
+
+
+def parse_message_set(message_set):
+    """把IMAP消息集合展开为编号列表（build_message_set 的逆操作）
+
+    例如 '1:3,5' -> [1, 2, 3, 5]
+
+    Args:
+        message_set: 消息集合（str/bytes，不含 *）
+
+    Returns:
+        编号列表
+    """
+    if isinstance(message_set, bytes):
+        message_set = message_set.decode('ascii', errors='ignore')
+
+    numbers = []
+    for part in message_set.strip().split(','):
+        if not part:
+            continue
+        start, _, end = part.partition(':')
+        start, end = int(start), int(end or start)
+        numbers.extend(range(min(start, end), max(start, end) + 1))
+    return numbers
+
+
+def quote_string(value):
+    """把字符串转为IMAP带引号字符串"""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def build_or_from_query(addresses):
+    """构造匹配任一发件人的SEARCH条件
+
+    IMAP的OR只接受两个条件，多个发件人需要嵌套：
+    [a, b, c] -> 'OR FROM "a" OR FROM "b" FROM "c"'
+
+    Args:
+        addresses: 发件人邮箱列表（非空）
+
+    Returns:
+        SEARCH条件字符串
+    """
+    terms = [f'FROM {quote_string(address)}' for address in addresses]
+    query = terms[-1]
+    for term in reversed(terms[:-1]):
+        query = f'OR {term} {query}'
+    return query
+
+
+def parse_fetch_response(data):
+    """解析imaplib批量FETCH返回的多段数据
+
+    imaplib把每封邮件的响应拆成若干 (头部, 字面量) 元组和结尾的 b')'，
+    同一封邮件有多个字面量时，后续元组的头部不以消息编号开头。
+
+    Args:
+        data: imaplib fetch/uid('FETCH') 返回的数据列表
+
+    Returns:
+        [(消息编号bytes, 合并后的头部bytes, [字面量bytes, ...]), ...]
+    """
+    results = []
+    current = None
+
+    for item in data or []:
+        if isinstance(item, tuple):
+            meta, literal = item[0], item[1]
+            match = _FETCH_START.match(meta)
+            if match:
+                current = (match.group(1), bytearray(meta), [literal])
+                results.append(current)
+            elif current is not None:
+                current[1].extend(meta)
+                current[2].append(literal)
+        elif isinstance(item, bytes):
+            match = _FETCH_START.match(item)
+            if match:
+                # 没有字面量的响应，如 b'12 (UID 345 FLAGS (\\Seen))'
+                current = (match.group(1), bytearray(item), [])
+                results.append(current)
+            elif current is not None and item != b')':
+                current[1].extend(item)
+
+    return [(num, bytes(meta), literals) for num, meta, literals in results]
+
+
+def extract_uid(meta):
+    """从FETCH响应头部中提取UID
+
+    Returns:
+        UID bytes，没有UID时返回None
+    """
+    match = _FETCH_UID.search(meta)
+    return match.group(1) if match else None
+
+
+# FETCH响应的词法单元：括号、带引号字符串、字面量标记、原子（如 BODY[HEADER.FIELDS (FROM)]<0>）
+_TOKEN = re.compile(rb'''
+    (?P<open>\()
+  | (?P<close>\))
+  | "(?P<quoted>(?:[^"\\]|\\.)*)"
+  | \{(?P<literal>\d+)\}\s*$
+  | (?P<atom>[^\s()"\[]+(?:\[[^\]]*\](?:<\d+>)?)?)
+''', re.VERBOSE)
+
+
+def _tokenize_fetch_response(data):
+    """把imaplib的FETCH响应拆成词法单元，字面量作为bytes单元插入原位置"""
+    tokens = []
+    for item in data or []:
+        segments = [item[0], item[1]] if isinstance(item, tuple) else [item]
+        for index, segment in enumerate(segments):
+            if not isinstance(segment, bytes):
+                continue
+            if index == 1:
+                tokens.append(('literal', segment))
+                continue
+            for match in _TOKEN.finditer(segment):
+                kind = match.lastgroup
+                if kind == 'quoted':
+                    value = re.sub(rb'\\(.)', rb'\1', match.group('quoted'))
+                    tokens.append(('string', value.decode('utf-8', errors='replace')))
+                elif kind == 'atom':
+                    atom = match.group('atom').decode('utf-8', errors='replace')
+                    tokens.append(('nil', None) if atom.upper() == 'NIL' else ('string', atom))
+                elif kind in ('open', 'close'):
+                    tokens.append((kind, None))
+                # literal标记本身不产生单元，其内容是下一个元组元素
+    return tokens
+
+
+def _parse_tokens(tokens, pos):
+    """递归解析一个值（列表、字符串、字面量或NIL）"""
+    kind, value = tokens[pos]
+    if kind != 'open':
+        return value, pos + 1
+
+    values = []
+    pos += 1
+    while pos < len(tokens) and tokens[pos][0] != 'close':
+        value, pos = _parse_tokens(tokens, pos)
+        values.append(value)
+    return values, pos + 1
+
+
+def parse_fetch_items(data):
+    """完整解析批量FETCH响应中每封邮件的数据项
+
+    与 parse_fetch_response 不同，这里会解析嵌套括号（如BODYSTRUCTURE），
+    并把每个字面量对应到它所属的数据项。
+
+    Args:
+        data: imaplib fetch/uid('FETCH') 返回的数据列表
+
+    Returns:
+        [(消息编号str, {数据项名(大写): 值}), ...]
+        值为 str / bytes（字面量）/ list / None（NIL）
+    """
+    tokens = _tokenize_fetch_response(data)
+    results = []
+    pos = 0
+
+    while pos < len(tokens):
+        kind, value = tokens[pos]
+        if kind == 'string' and value.isdigit() and pos + 1 < len(tokens) and tokens[pos + 1][0] == 'open':
+            item_list, pos = _parse_tokens(tokens, pos + 1)
+            items = {}
+            for i in range(0, len(item_list) - 1, 2):
+                if isinstance(item_list[i], str):
+                    items[item_list[i].upper()] = item_list[i + 1]
+            results.append((value, items))
+        else:
+            pos += 1
+
+    return results
+
+
+def _lower_str(value):
+    """BODYSTRUCTURE中的字符串转小写（字面量为bytes）"""
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', errors='replace')
+    return value.lower() if isinstance(value, str) else ''
+
+
+def _param_dict(params):
+    """BODYSTRUCTURE参数列表 ['CHARSET', 'utf-8'] 转为字典"""
+    if not isinstance(params, list):
+        return {}
+    return {_lower_str(params[i]): params[i + 1] for i in range(0, len(params) - 1, 2)}
+
+
+def iter_body_parts(structure, prefix=''):
+    """按 email.Message.walk() 的顺序遍历BODYSTRUCTURE中的叶子部分
+
+    Args:
+        structure: parse_fetch_items 解析出的BODYSTRUCTURE列表
+
+    Yields:
+        {'section': 部分编号, 'content_type', 'charset', 'encoding', 'size', 'is_attachment'}
+    """
+    if not isinstance(structure, list) or not structure:
+        return
+
+    # 多部分：先是若干子部分（列表），然后是子类型
+    if isinstance(structure[0], list):
+        index = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            index += 1
+            yield from iter_body_parts(child, f"{prefix}.{index}" if prefix else str(index))
+        return
+
+    if len(structure) < 7:
+        return
+
+    maintype, subtype = _lower_str(structure[0]), _lower_str(structure[1])
+    content_type = f"{maintype}/{subtype}"
+    section = prefix or '1'
+
+    # 扩展数据中的 disposition 位置：text 多一个行数字段，message/rfc822 多信封、结构和行数
+    if maintype == 'text':
+        disposition_index = 9
+    elif content_type == 'message/rfc822':
+        disposition_index = 11
+    else:
+        disposition_index = 8
+    disposition = structure[disposition_index] if len(structure) > disposition_index else None
+    is_attachment = isinstance(disposition, list) and bool(disposition) and _lower_str(disposition[0]) == 'attachment'
+
+    size = structure[6]
+    yield {
+        'section': section,
+        'content_type': content_type,
+        'charset': _lower_str(_param_dict(structure[2]).get('charset')),
+        'encoding': _lower_str(structure[5]),
+        'size': int(size) if isinstance(size, str) and size.isdigit() else 0,
+        'is_attachment': is_attachment,
+    }
+
+    # 附件中的邮件（message/rfc822）会继续遍历其内部结构
+    if content_type == 'message/rfc822' and len(structure) > 8 and isinstance(structure[8], list):
+        inner = structure[8]
+        if inner and isinstance(inner[0], list):
+            yield from iter_body_parts(inner, section)
+        else:
+            yield from iter_body_parts(inner, f"{section}.1")
@@ -4,9 +4,9 @@
 """
 import json
 import os
-import re
 import logging
 from typing import Dict, List, Set
+from aho_corasick import AhoCorasick
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +24,7 @@ class KeywordManager:
         self.common_keywords = {}  # 通用关键词（产品相关）
         self.project_keywords = {}  # 项目特定关键词
         self._load_keywords()
+        self._build_matchers()
     
     def _load_keywords(self):
         """加载关键词配置"""
@@ -42,6 +43,18 @@ class KeywordManager:
         except Exception as e:
             logger.error(f"加载关键词配置失败: {str(e)}")
     
+    def _build_matchers(self):
+        """构建关键词自动机（V6.1：每封邮件只扫描一遍，不再逐个关键词正则匹配）"""
+        self._common_entries = [(category, keyword)
+                                for category, keywords in self.common_keywords.items()
+                                for keyword in keywords]
+        self._common_matcher = AhoCorasick([keyword.lower() for _, keyword in self._common_entries],
+                                           whole_word=True)
+        self._project_matchers = {
+            project_code: AhoCorasick([keyword.lower() for keyword in keywords], whole_word=True)
+            for project_code, keywords in self.project_keywords.items()
+        }
+    
     def detect_keywords_in_text(self, text, project_code=None):
         """检测文本中的关键词
         
@@ -64,24 +77,18 @@ class KeywordManager:
         
         text_lower = text.lower()
         
-        # 检测通用关键词
-        for category, keywords in self.common_keywords.items():
-            found_keywords = []
-            for keyword in keywords:
-                if re.search(r'\b' + re.escape(keyword.lower()) + r'\b', text_lower):
-                    found_keywords.append(keyword)
-            
-            if found_keywords:
-                result['common'][category] = found_keywords
-                result['is_important'] = True
+        # 检测通用关键词（整词匹配）
+        for index in self._common_matcher.search(text_lower):
+            category, keyword = self._common_entries[index]
+            result['common'].setdefault(category, []).append(keyword)
+            result['is_important'] = True
         
         # 检测项目关键词
         if project_code and project_code in self.project_keywords:
             project_kws = self.project_keywords[project_code]
-            for keyword in project_kws:
-                if re.search(r'\b' + re.escape(keyword.lower()) + r'\b', text_lower):
-                    result['project'].append(keyword)
-                    result['is_important'] = True
+            for index in self._project_matchers[project_code].search(text_lower):
+                result['project'].append(project_kws[index])
+                result['is_important'] = True
         
         return result
     
@@ -49,7 +49,8 @@ def main():
         imap_server=email_account['imap_server'],
         imap_port=email_account['imap_port'],
         smtp_server=email_account['smtp_server'],
-        smtp_port=email_account['smtp_port']
+        smtp_port=email_account['smtp_port'],
+        delivery_config=config.get('delivery_config', {})
     )
     
     try:
@@ -128,11 +129,10 @@ def main():
             
             subject = f"邮件助手每日报告 V3.0 - {datetime.now().strftime('%Y-%m-%d')}"
             
-            for target_email in target_emails:
-                if target_email:
-                    client.send_email_text(target_email, subject, text_report)
+            client.send_email_text_many(target_emails, subject, text_report)
             
             client.disconnect_imap()
+            client.wait_outbox()  # V6.1：启用发件箱时等待后台发送
             return
         
         # 分析员工邮件中的重复问题
@@ -194,36 +194,49 @@ def main():
         
         success_count = 0
         failed_emails = []
+        queued_emails = []
         
-        for target_email in target_emails:
-            if not target_email:
-                continue
-            
-            logger.info(f"  → 发送到: {target_email}")
-            success = client.send_email_text(target_email, subject, text_report)
-            
+        # V6.1：所有收件人共用一个SMTP会话；启用发件箱时只加入发件箱，由后台线程发送
+        report_id = os.path.splitext(report_filename)[0]
+        send_results = client.send_email_text_many(target_emails, subject, text_report, report_id=report_id)
+        for target_email, success in send_results.items():
             if success:
                 success_count += 1
-                logger.info(f"    ✅ 发送成功")
             else:
                 failed_emails.append(target_email)
-                logger.error(f"    ❌ 发送失败")
+        
+        # 断开连接（发件箱继续在后台发送）
+        client.disconnect_imap()
+        
+        # V6.1：启用发件箱时按发件箱中的状态统计，退出前只短暂等待，未完成的邮件由下次运行继续发送
+        if client.outbox and send_results:
+            logger.info(f"📮 报告已加入发件箱，退出前等待后台发送（最长 {client.delivery_config.get('outbox_wait', 10)} 秒）...")
+            client.wait_outbox()
+            success_count = 0
+            failed_emails = []
+            for target_email, state in client.outbox.get_status(report_id).items():
+                if state['status'] == 'sent':
+                    success_count += 1
+                elif state['status'] == 'failed':
+                    failed_emails.append(target_email)
+                else:
+                    queued_emails.append(target_email)
+                    logger.info(f"   {target_email}: 尚未发送成功（已尝试 {state['attempts']} 次），下次运行时继续重试")
         
         # 总结发送结果
         logger.info("=" * 50)
         logger.info(f"📄 本地报告: {report_filepath}")
         if success_count > 0:
             logger.info(f"✅ 成功发送到 {success_count}/{len(target_emails)} 个邮箱")
-            if failed_emails:
-                logger.warning(f"⚠️  失败邮箱: {', '.join(failed_emails)}")
-        else:
+        if queued_emails:
+            logger.info(f"📮 {len(queued_emails)}/{len(target_emails)} 个邮箱的报告仍在发件箱中，等待后台发送")
+        if failed_emails:
+            logger.warning(f"⚠️  失败邮箱: {', '.join(failed_emails)}")
+        if success_count == 0 and not queued_emails:
             logger.warning("⚠️  邮件发送失败，但报告已保存到本地")
             logger.warning(f"   请直接查看: {report_filepath}")
         logger.info("=" * 50)
         
-        # 断开连接
-        client.disconnect_imap()
-        
         logger.info("=" * 50)
         logger.info("邮件助手运行完成（V3.0）")
         logger.info("=" * 50)
@@ -232,6 +245,9 @@ def main():
         logger.error(f"程序执行出错: {str(e)}", exc_info=True)
         client.disconnect_imap()
         sys.exit(1)
+    finally:
+        # V6.1：scheduler 在同一进程中每天调用 main()，每次运行结束都要停止发件箱的后台发送线程
+        client.stop_outbox_sender()
 
 
 if __name__ == "__main__":
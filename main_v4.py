@@ -8,8 +8,11 @@ import sys
 import os
 from datetime import datetime
 from email_client import EmailClient
+from fetch_orchestrator import FetchOrchestrator
+from offline_source import OfflineMailSource
 from email_analyzer import EmailAnalyzer
 from report_generator_ai import AIReportGenerator
+from report_personalizer import ReportPersonalizer
 from ai_analyzer import AIAnalyzer
 
 # 配置日志
@@ -37,8 +40,13 @@ def load_config(config_file='config.json'):
         sys.exit(1)
 
 
-def main():
-    """主函数 V4.0"""
+def main(replay_path=None, replay_date=None):
+    """主函数 V4.0
+    
+    Args:
+        replay_path: 离线回放的邮件源（V6.1，mbox/Maildir/.eml），指定时不连接邮箱、不发送报告
+        replay_date: 离线回放的"当前时间"（datetime，可选）
+    """
     logger.info("=" * 50)
     logger.info("AI邮件助手开始运行（V5.3 - 组织关系管理）")
     logger.info("=" * 50)
@@ -66,12 +74,18 @@ def main():
         imap_server=email_account['imap_server'],
         imap_port=email_account['imap_port'],
         smtp_server=email_account['smtp_server'],
-        smtp_port=email_account['smtp_port']
+        smtp_port=email_account['smtp_port'],
+        fetch_config=config.get('fetch_config', {}),
+        delivery_config=config.get('delivery_config', {})
     )
     
     try:
-        # 连接到邮箱
-        if not client.connect_imap():
+        # 连接到邮箱（V6.1：离线回放时不需要；配置了多个邮件来源时由FetchOrchestrator各自连接）
+        if replay_path:
+            logger.info(f"📼 离线回放模式: {replay_path}")
+        elif config.get('mail_sources'):
+            logger.info(f"📬 多来源获取模式: {len(config['mail_sources'])} 个邮件来源")
+        elif not client.connect_imap():
             logger.error("无法连接到邮箱服务器，程序退出")
             return
         
@@ -125,7 +139,41 @@ def main():
         logger.info(f"正在获取 {len(all_senders)} 个关键人的邮件...")
         if self_email:
             logger.info(f"📌 将过滤掉自己发送的邮件: {self_email}")
-        all_emails = client.fetch_emails_from_senders(all_senders, days_to_check, exclude_self=self_email)
+        
+        # V6.1：边获取边分析，邮件下载与AI调用同时进行
+        email_source = client
+        if replay_path:
+            # V6.1：从本地邮件文件回放，解析和过滤流程与在线获取相同
+            offline_source = OfflineMailSource(replay_path, client, replay_date)
+            email_iter = offline_source.iter_emails_from_senders(all_senders, days_to_check, exclude_self=self_email)
+        elif config.get('mail_sources'):
+            # V6.1：多账号/多文件夹同时获取，按Message-ID去重
+            email_source = FetchOrchestrator(config)
+            email_iter = email_source.iter_emails_from_senders(all_senders, days_to_check, exclude_self=self_email)
+        else:
+            email_iter = client.iter_emails_from_senders(all_senders, days_to_check, exclude_self=self_email)
+        if ai_analyzer.is_available():
+            logger.info("=" * 50)
+            logger.info("🤖 开始AI智能分析（边获取边分析）...")
+            logger.info("=" * 50)
+            
+            # 创建发件人类型映射
+            sender_type_map = {}
+            for email in customers.keys():
+                sender_type_map[email] = 'customer'
+            for email in suppliers.keys():
+                sender_type_map[email] = 'supplier'
+            
+            # 对所有邮件进行AI分析（传入类型映射）
+            all_emails = ai_analyzer.analyze_emails_stream(email_iter, sender_type_map)
+            
+            # V6.1：AI分析结果写入本地邮件库，供调试工具离线查看
+            email_source.save_analysis(all_emails)
+        else:
+            all_emails = list(email_iter)
+        
+        all_emails.sort(key=lambda x: x['date'], reverse=True)
+        logger.info(f"✅ 总共筛选出 {len(all_emails)} 封符合条件的邮件")
         
         # 分类邮件（5类）
         leader_emails = []
@@ -162,32 +210,6 @@ def main():
             client.disconnect_imap()
             return
         
-        # V4.0新增：AI分析邮件（根据类型定制分析）
-        if ai_analyzer.is_available():
-            logger.info("=" * 50)
-            logger.info("🤖 开始AI智能分析...")
-            logger.info("=" * 50)
-            
-            # 创建发件人类型映射
-            sender_type_map = {}
-            for email in customers.keys():
-                sender_type_map[email] = 'customer'
-            for email in suppliers.keys():
-                sender_type_map[email] = 'supplier'
-            
-            # 对所有邮件进行AI分析（传入类型映射）
-            all_emails = ai_analyzer.analyze_emails_batch(all_emails, sender_type_map)
-            
-            # 重新分类（因为邮件对象已更新）
-            leader_emails = [e for e in all_emails if e['from_email'].lower() in leader_emails_lower]
-            pm_emails = [e for e in all_emails if e['from_email'].lower() in pm_emails_lower]
-            customer_emails = [e for e in all_emails if e['from_email'].lower() in customer_emails_lower]
-            supplier_emails = [e for e in all_emails if e['from_email'].lower() in supplier_emails_lower]
-            employee_emails = [e for e in all_emails if e['from_email'].lower() not in leader_emails_lower 
-                              and e['from_email'].lower() not in pm_emails_lower
-                              and e['from_email'].lower() not in customer_emails_lower
-                              and e['from_email'].lower() not in supplier_emails_lower]
-        
         # 分析员工邮件中的重复问题
         analyzer = EmailAnalyzer(repeat_days=repeat_issue_days)
         
@@ -241,42 +263,85 @@ def main():
             target_emails = [config['target_email']]
         if isinstance(target_emails, str):
             target_emails = [target_emails]
+        if replay_path:
+            logger.info("📼 离线回放模式，不发送报告")
+            target_emails = []
         
         logger.info(f"准备发送报告到 {len(target_emails)} 个邮箱")
         logger.info(f"报告主题: {subject}")
         
+        # V6.1：按组织关系为每个收件人筛选相关邮件（复用同一次分析结果，并行生成）
+        report_bodies = {target_email: text_report for target_email in target_emails if target_email}
+        personalization = config.get('report_personalization', {})
+        if personalization.get('enabled', False) and report_bodies:
+            logger.info("正在生成个性化报告...")
+            personalizer = ReportPersonalizer(
+                person_mgr.org_manager, analyzer, report_gen,
+                full_report_recipients=personalization.get('full_report_recipients', []),
+                max_workers=personalization.get('max_workers', 4)
+            )
+            report_bodies = personalizer.render_reports(
+                list(report_bodies),
+                {'leader': leaders, 'pm': project_managers, 'employee': employees,
+                 'customer': customers, 'supplier': suppliers},
+                {'leader': leader_emails, 'pm': pm_emails, 'employee': employee_emails,
+                 'customer': customer_emails, 'supplier': supplier_emails},
+                employee_repeat_issues, ai_analyzer.is_available(), full_report=text_report
+            )
+            
+            # 个性化报告也保存到本地
+            for target_email, body in report_bodies.items():
+                if body is not text_report:
+                    personal_filename = f"{os.path.splitext(report_filename)[0]}_{target_email.split('@')[0]}.txt"
+                    with open(os.path.join(reports_dir, personal_filename), 'w', encoding='utf-8') as f:
+                        f.write(body)
+        
         success_count = 0
         failed_emails = []
+        queued_emails = []
         
-        for target_email in target_emails:
-            if not target_email:
-                continue
-            
-            logger.info(f"  → 发送到: {target_email}")
-            success = client.send_email_text(target_email, subject, text_report)
-            
+        # V6.1：所有收件人共用一个SMTP会话；启用发件箱时只加入发件箱，由后台线程发送
+        report_id = os.path.splitext(report_filename)[0]
+        send_results = client.send_email_text_each(report_bodies, subject, report_id=report_id)
+        for target_email, success in send_results.items():
             if success:
                 success_count += 1
-                logger.info(f"    ✅ 发送成功")
             else:
                 failed_emails.append(target_email)
-                logger.error(f"    ❌ 发送失败")
+        
+        # 断开连接（发件箱继续在后台发送）
+        client.disconnect_imap()
+        
+        if client.outbox and send_results:
+            # 退出前只短暂等待后台发送，服务器不可用时剩余邮件由下次运行继续发送
+            logger.info(f"📮 报告已加入发件箱，退出前等待后台发送（最长 {client.delivery_config.get('outbox_wait', 10)} 秒）...")
+            client.wait_outbox()
+            success_count = 0
+            failed_emails = []
+            for target_email, state in client.outbox.get_status(report_id).items():
+                if state['status'] == 'sent':
+                    success_count += 1
+                elif state['status'] == 'failed':
+                    failed_emails.append(target_email)
+                else:
+                    queued_emails.append(target_email)
+                    logger.info(f"   {target_email}: 尚未发送成功（已尝试 {state['attempts']} 次），下次运行时继续重试")
+            client.stop_outbox_sender()
         
         # 总结
         logger.info("=" * 50)
         logger.info(f"📄 本地报告: {report_filepath}")
         if success_count > 0:
             logger.info(f"✅ 成功发送到 {success_count}/{len(target_emails)} 个邮箱")
-            if failed_emails:
-                logger.warning(f"⚠️  失败邮箱: {', '.join(failed_emails)}")
-        else:
+        if queued_emails:
+            logger.info(f"📮 {len(queued_emails)}/{len(target_emails)} 个邮箱的报告仍在发件箱中，等待后台发送")
+        if failed_emails:
+            logger.warning(f"⚠️  失败邮箱: {', '.join(failed_emails)}")
+        if success_count == 0 and not queued_emails and not replay_path:
             logger.warning("⚠️  邮件发送失败，但报告已保存到本地")
             logger.warning(f"   请直接查看: {report_filepath}")
         logger.info("=" * 50)
         
-        # 断开连接
-        client.disconnect_imap()
-        
         logger.info("=" * 50)
         logger.info("AI邮件助手运行完成（V5.3）")
         logger.info("=" * 50)
@@ -288,5 +353,11 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    # V6.1：python main_v4.py --replay <mbox/Maildir/.eml目录> [--replay-date 2025-11-12]  离线回放
+    args = sys.argv[1:]
+    replay_path = args[args.index('--replay') + 1] if '--replay' in args else None
+    replay_date = None
+    if '--replay-date' in args:
+        replay_date = datetime.strptime(args[args.index('--replay-date') + 1], '%Y-%m-%d').replace(hour=23, minute=59)
+    main(replay_path, replay_date)
 
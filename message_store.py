@@ -0,0 +1,329 @@
+"""
+本地邮件库模块 - V6.1
+用SQLite保存已获取的邮件（每个UID一行：邮件头、清理后的正文、标记、AI分析结果），
+并用FTS5为主题/正文建立全文索引，报告和调试工具可以离线查询，不必重新连接邮箱
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MessageStore:
+    """本地邮件库（SQLite + FTS5）"""
+
+    def __init__(self, db_path='data/messages.db'):
+        """初始化邮件库
+
+        Args:
+            db_path: SQLite数据库文件路径
+        """
+        self.db_path = db_path
+        self.fts_enabled = False
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+            logger.info(f"创建邮件库目录: {db_dir}")
+
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._init_schema()
+
+    def _init_schema(self):
+        """创建表结构和全文索引"""
+        with self._lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    account TEXT NOT NULL,
+                    folder TEXT NOT NULL,
+                    uid INTEGER NOT NULL,
+                    uidvalidity INTEGER,
+                    message_id TEXT,
+                    from_addr TEXT,
+                    from_email TEXT,
+                    from_name TEXT,
+                    subject TEXT,
+                    date TEXT,
+                    body TEXT,
+                    analysis TEXT,
+                    flags TEXT,
+                    fetched_at TEXT,
+                    PRIMARY KEY (account, folder, uid)
+                )
+            """)
+            # 旧版数据库没有flags列
+            columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(messages)")}
+            if 'flags' not in columns:
+                self.conn.execute("ALTER TABLE messages ADD COLUMN flags TEXT")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_date ON messages(date)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_from ON messages(from_email)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_message_id ON messages(message_id)")
+
+        self.fts_enabled = self._init_fts()
+
+    def _init_fts(self):
+        """创建FTS5全文索引（trigram分词支持中文子串搜索），不支持时退回LIKE查询"""
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                with self._lock, self.conn:
+                    self.conn.execute(f"""
+                        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                            subject, body, content='messages', content_rowid='rowid', tokenize='{tokenizer}'
+                        )
+                    """)
+                    # 外部内容表，用触发器保持索引同步
+                    self.conn.execute("""
+                        CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+                            INSERT INTO messages_fts(rowid, subject, body) VALUES (new.rowid, new.subject, new.body);
+                        END
+                    """)
+                    self.conn.execute("""
+                        CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+                            INSERT INTO messages_fts(messages_fts, rowid, subject, body)
+                            VALUES ('delete', old.rowid, old.subject, old.body);
+                        END
+                    """)
+                    self.conn.execute("""
+                        CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE OF subject, body ON messages BEGIN
+                            INSERT INTO messages_fts(messages_fts, rowid, subject, body)
+                            VALUES ('delete', old.rowid, old.subject, old.body);
+                            INSERT INTO messages_fts(rowid, subject, body) VALUES (new.rowid, new.subject, new.body);
+                        END
+                    """)
+                return True
+            except sqlite3.OperationalError as e:
+                logger.debug(f"FTS5分词器 {tokenizer} 不可用: {str(e)}")
+
+        logger.warning("SQLite不支持FTS5，全文搜索将使用LIKE查询")
+        return False
+
+    def save_emails(self, account, folder, uidvalidity, emails):
+        """保存（或更新）邮件，已有的AI分析结果会保留
+
+        Args:
+            account: 邮箱账号
+            folder: 文件夹
+            uidvalidity: 文件夹的UIDVALIDITY
+            emails: EmailClient返回的邮件数据列表
+        """
+        if not emails:
+            return
+
+        now = datetime.now().isoformat()
+        rows = [(
+            account, folder, int(item['id']), uidvalidity,
+            item.get('message_id', ''), item.get('from', ''), item.get('from_email', ''),
+            item.get('from_name', ''), item.get('subject', ''), item['date'].isoformat(),
+            item.get('body', ''), now
+        ) for item in emails]
+
+        with self._lock, self.conn:
+            self.conn.executemany("""
+                INSERT INTO messages (account, folder, uid, uidvalidity, message_id, from_addr, from_email,
+                                      from_name, subject, date, body, fetched_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(account, folder, uid) DO UPDATE SET
+                    uidvalidity = excluded.uidvalidity,
+                    message_id = excluded.message_id,
+                    from_addr = excluded.from_addr,
+                    from_email = excluded.from_email,
+                    from_name = excluded.from_name,
+                    subject = excluded.subject,
+                    date = excluded.date,
+                    body = excluded.body,
+                    fetched_at = excluded.fetched_at
+            """, rows)
+        logger.debug(f"邮件库已保存 {len(rows)} 封邮件: {account}/{folder}")
+
+    def save_analysis(self, emails):
+        """保存AI分析结果（邮件需包含account/folder字段）"""
+        rows = [(json.dumps(item['ai_analysis'], ensure_ascii=False), item['account'], item['folder'], int(item['id']))
+                for item in emails
+                if item.get('ai_analysis') and item.get('account') and item.get('folder')]
+        if not rows:
+            return
+
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "UPDATE messages SET analysis = ? WHERE account = ? AND folder = ? AND uid = ?", rows)
+        logger.info(f"邮件库已保存 {len(rows)} 条AI分析结果")
+
+    def purge_folder(self, account, folder, keep_uidvalidity):
+        """删除文件夹中UIDVALIDITY已失效的旧邮件"""
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM messages WHERE account = ? AND folder = ? AND uidvalidity IS NOT ?",
+                (account, folder, keep_uidvalidity))
+        if cursor.rowcount:
+            logger.info(f"UIDVALIDITY已变化，邮件库删除了 {cursor.rowcount} 封旧邮件: {account}/{folder}")
+
+    def get_uids(self, account, folder, flags_unknown=False):
+        """获取文件夹中已保存的邮件UID
+
+        Args:
+            flags_unknown: 只返回还没有同步过标记的邮件
+        """
+        sql = "SELECT uid FROM messages WHERE account = ? AND folder = ?"
+        if flags_unknown:
+            sql += " AND flags IS NULL"
+        with self._lock:
+            rows = self.conn.execute(sql + " ORDER BY uid", (account, folder)).fetchall()
+        return [row['uid'] for row in rows]
+
+    def update_flags(self, account, folder, flags_by_uid):
+        """更新邮件标记
+
+        Args:
+            flags_by_uid: {uid: [标记, ...]}，如 {12: ['\\Seen', '\\Flagged']}
+        """
+        rows = [(' '.join(flags), account, folder, int(uid)) for uid, flags in flags_by_uid.items()]
+        if not rows:
+            return
+
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "UPDATE messages SET flags = ? WHERE account = ? AND folder = ? AND uid = ?", rows)
+        logger.debug(f"邮件库已更新 {len(rows)} 封邮件的标记: {account}/{folder}")
+
+    def delete_uids(self, account, folder, uids):
+        """删除服务器上已删除（expunge）的邮件"""
+        rows = [(account, folder, int(uid)) for uid in uids]
+        if not rows:
+            return
+
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM messages WHERE account = ? AND folder = ? AND uid = ?", rows)
+        logger.info(f"邮件库删除了 {len(rows)} 封服务器上已删除的邮件: {account}/{folder}")
+
+    def _row_to_email(self, row):
+        """数据库行转换为EmailClient的邮件数据格式"""
+        email_item = {
+            'id': str(row['uid']),
+            'message_id': row['message_id'] or '',
+            'account': row['account'],
+            'folder': row['folder'],
+            'from': row['from_addr'] or '',
+            'from_email': row['from_email'] or '',
+            'from_name': row['from_name'] or '',
+            'subject': row['subject'] or '',
+            'date': datetime.fromisoformat(row['date']),
+            'body': row['body'] or ''
+        }
+        if row['flags'] is not None:
+            email_item['flags'] = row['flags'].split()
+        if row['analysis']:
+            email_item['ai_analysis'] = json.loads(row['analysis'])
+        return email_item
+
+    def query_emails(self, senders_dict=None, days=None, exclude_self=None, account=None, folder=None):
+        """查询邮件（按日期倒序）
+
+        Args:
+            senders_dict: 只返回这些发件人的邮件 {email: name}，姓名以此为准
+            days: 只返回最近几天的邮件
+            exclude_self: 要排除的自己的邮箱地址
+            account: 只查询某个账号
+            folder: 只查询某个文件夹
+
+        Returns:
+            邮件数据列表
+        """
+        conditions = []
+        params = []
+        if days is not None:
+            conditions.append("date >= ?")
+            params.append((datetime.now() - timedelta(days=days)).isoformat())
+        if account:
+            conditions.append("account = ?")
+            params.append(account)
+        if folder:
+            conditions.append("folder = ?")
+            params.append(folder)
+
+        sql = "SELECT * FROM messages"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY date DESC"
+
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+
+        sender_emails_lower = None
+        if senders_dict is not None:
+            sender_emails_lower = {email.lower(): (email, name) for email, name in senders_dict.items()}
+        exclude_self_lower = exclude_self.lower() if exclude_self else None
+
+        emails = []
+        for row in rows:
+            email_item = self._row_to_email(row)
+            sender_email = email_item['from_email'].lower()
+            if exclude_self_lower and sender_email == exclude_self_lower:
+                continue
+            if sender_emails_lower is not None:
+                if sender_email not in sender_emails_lower:
+                    continue
+                email_item['from_email'], email_item['from_name'] = sender_emails_lower[sender_email]
+            emails.append(email_item)
+
+        return emails
+
+    def fetch_emails_from_senders(self, senders_dict, days=7, exclude_self=None):
+        """离线获取邮件（与 EmailClient.fetch_emails_from_senders 接口相同）"""
+        emails = self.query_emails(senders_dict, days, exclude_self)
+        logger.info(f"✅ 从本地邮件库读取 {len(emails)} 封邮件")
+        return emails
+
+    def search(self, text, limit=50):
+        """全文搜索主题和正文
+
+        Args:
+            text: 搜索文本
+            limit: 最多返回条数
+
+        Returns:
+            邮件数据列表（按日期倒序）
+        """
+        with self._lock:
+            if self.fts_enabled and len(text) >= 3:
+                # 作为短语查询，避免FTS语法字符出错
+                query = '"' + text.replace('"', '""') + '"'
+                rows = self.conn.execute("""
+                    SELECT messages.* FROM messages_fts
+                    JOIN messages ON messages.rowid = messages_fts.rowid
+                    WHERE messages_fts MATCH ?
+                    ORDER BY messages.date DESC LIMIT ?
+                """, (query, limit)).fetchall()
+            else:
+                # trigram 至少需要3个字符，短查询用LIKE
+                pattern = '%' + re.sub(r'([%_\\])', r'\\\1', text) + '%'
+                rows = self.conn.execute("""
+                    SELECT * FROM messages
+                    WHERE subject LIKE ? ESCAPE '\\' OR body LIKE ? ESCAPE '\\'
+                    ORDER BY date DESC LIMIT ?
+                """, (pattern, pattern, limit)).fetchall()
+
+        return [self._row_to_email(row) for row in rows]
+
+    def get_stats(self):
+        """获取邮件库统计信息"""
+        with self._lock:
+            total = self.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+            analyzed = self.conn.execute("SELECT COUNT(*) FROM messages WHERE analysis IS NOT NULL").fetchone()[0]
+        return {
+            'total': total,
+            'analyzed': analyzed,
+            'db_path': self.db_path,
+            'fts_enabled': self.fts_enabled
+        }
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self.conn.close()
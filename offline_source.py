@@ -0,0 +1,101 @@
+"""
+离线邮件源模块 - V6.1
+从本地 mbox 文件、Maildir 目录或 .eml 文件（目录）读取邮件，
+按与 EmailClient 相同的解析、清理和过滤流程产出邮件数据，不需要网络和邮箱账号，
+用于开发调试和可重复的全流程性能测试
+"""
+import mailbox
+import os
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+def detect_source_type(path):
+    """判断离线邮件源类型：maildir / eml_dir / eml / mbox"""
+    if os.path.isdir(path):
+        if all(os.path.isdir(os.path.join(path, sub)) for sub in ('cur', 'new', 'tmp')):
+            return 'maildir'
+        return 'eml_dir'
+    if path.lower().endswith('.eml'):
+        return 'eml'
+    return 'mbox'
+
+
+def iter_raw_messages(path):
+    """按固定顺序读取原始邮件
+
+    Yields:
+        (邮件编号, 原始邮件bytes)，编号从1开始
+    """
+    source_type = detect_source_type(path)
+
+    if source_type == 'maildir':
+        box = mailbox.Maildir(path, factory=None, create=False)
+        for index, key in enumerate(sorted(box.iterkeys()), 1):
+            yield index, box.get_bytes(key)
+
+    elif source_type == 'eml_dir':
+        eml_files = []
+        for root, _, files in os.walk(path):
+            eml_files.extend(os.path.join(root, name) for name in files if name.lower().endswith('.eml'))
+        for index, file_path in enumerate(sorted(eml_files), 1):
+            with open(file_path, 'rb') as f:
+                yield index, f.read()
+
+    elif source_type == 'eml':
+        with open(path, 'rb') as f:
+            yield 1, f.read()
+
+    else:
+        box = mailbox.mbox(path, factory=None, create=False)
+        try:
+            for index, key in enumerate(box.iterkeys(), 1):
+                yield index, box.get_bytes(key)
+        finally:
+            box.close()
+
+
+class OfflineMailSource:
+    """离线邮件源（接口与 EmailClient 的获取方法相同）"""
+
+    def __init__(self, path, client, replay_date=None):
+        """初始化
+
+        Args:
+            path: mbox文件、Maildir目录、.eml文件或包含.eml文件的目录
+            client: EmailClient，提供与在线获取相同的解析和清理逻辑（不会连接邮箱）
+            replay_date: 回放的"当前时间"（datetime，默认为现在），用于回放历史邮件
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"离线邮件源不存在: {path}")
+        self.path = path
+        self.client = client
+        self.replay_date = replay_date
+        self.source_type = detect_source_type(path)
+
+    def iter_emails_from_senders(self, senders_dict, days=7, exclude_self=None):
+        """逐封产出指定发件人在回放时间之前几天内的邮件
+
+        Yields:
+            邮件数据，folder 字段为 offline:<路径>
+        """
+        reference = self.replay_date or datetime.now()
+        logger.info(f"离线回放（{self.source_type}）: {self.path}，"
+                    f"时间范围 {days} 天（截至 {reference.strftime('%Y-%m-%d %H:%M')}）")
+
+        count = 0
+        for email_item in self.client.iter_raw_emails(iter_raw_messages(self.path), senders_dict, days,
+                                                      exclude_self, folder=f"offline:{self.path}",
+                                                      now=self.replay_date):
+            count += 1
+            yield email_item
+
+        logger.info(f"✅ 离线回放完成: {count} 封符合条件的邮件")
+
+    def fetch_emails_from_senders(self, senders_dict, days=7, exclude_self=None):
+        """获取邮件（按日期倒序的列表）"""
+        emails_data = list(self.iter_emails_from_senders(senders_dict, days, exclude_self))
+        emails_data.sort(key=lambda x: x['date'], reverse=True)
+        return emails_data
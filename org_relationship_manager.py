@@ -302,6 +302,43 @@ class OrgRelationshipManager:
         
         return result
     
+    def get_report_scope(self, person_email):
+        """获取人员在报告中关注的联系人范围（V6.1：个性化报告）
+        
+        范围包括：本人、管理部门的成员、所有下属（逐级）及其负责的客户、上级领导链
+        
+        Args:
+            person_email: 人员邮箱
+            
+        Returns:
+            邮箱集合（小写）；不在人员信息中时返回None
+        """
+        if person_email not in self.persons:
+            return None
+        
+        # 管理的部门（部门领导/高层）
+        departments = list(self.leader_departments.get(person_email, []))
+        departments += [dept for dept, leader in self.department_leaders.items() if leader == person_email]
+        
+        pending = [person_email]
+        for department in departments:
+            pending.extend(self.department_members.get(department, []))
+        
+        # 逐级下属，以及范围内PM负责的客户
+        scope = set()
+        while pending:
+            email = pending.pop()
+            if email in scope:
+                continue
+            scope.add(email)
+            pending.extend(self.leader_subordinates.get(email, []))
+            scope.update(self.pm_customers.get(email, []))
+        
+        # 上级领导链
+        scope.update(item['email'] for item in self.get_responsibility_chain(person_email))
+        
+        return {email.lower() for email in scope}
+    
     def get_org_summary(self):
         """获取组织架构摘要
         
@@ -0,0 +1,299 @@
+"""
+发件箱模块 - V6.1
+待发送的报告先写入本地SQLite发件箱（按 报告ID + 收件人 去重），由后台线程发送：
+失败时按指数退避重试，记录每个收件人的发送状态；程序中途退出时未发送的邮件下次运行继续发送
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+
+def make_report_id(kind, subject, body):
+    """根据邮件内容生成报告ID（相同内容重复入队时只发送一次）"""
+    digest = hashlib.sha1(f"{kind}\n{subject}\n{body}".encode('utf-8')).hexdigest()
+    return digest[:16]
+
+
+class Outbox:
+    """本地发件箱（SQLite）"""
+
+    def __init__(self, db_path='data/outbox.db', max_attempts=8, retry_delay=60, max_retry_delay=3600,
+                 sending_timeout=600):
+        """初始化发件箱
+
+        Args:
+            db_path: SQLite数据库文件路径
+            max_attempts: 每个收件人最多尝试发送的次数，超过后标记为失败
+            retry_delay: 第一次重试前等待的秒数（之后每次翻倍）
+            max_retry_delay: 重试等待的最大秒数
+            sending_timeout: 正在发送的邮件超过该秒数仍未完成（如程序被中断）时重新发送
+        """
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.sending_timeout = sending_timeout
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+            logger.info(f"创建发件箱目录: {db_dir}")
+
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._init_schema()
+
+    def _init_schema(self):
+        """创建表结构"""
+        with self._lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    report_id TEXT NOT NULL,
+                    recipient TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    subject TEXT,
+                    body TEXT,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at TEXT,
+                    updated_at TEXT,
+                    sent_at TEXT,
+                    UNIQUE (report_id, recipient)
+                )
+            """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)")
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self.conn.close()
+
+    def enqueue(self, report_id, recipient, subject, body, kind='text'):
+        """加入发件箱
+
+        Args:
+            report_id: 报告ID，同一报告ID + 收件人只会发送一次
+            kind: text（纯文本）或 html
+
+        Returns:
+            是否为新加入的邮件（已在发件箱中时返回False）
+        """
+        now = datetime.now().isoformat()
+        with self._lock, self.conn:
+            cursor = self.conn.execute("""
+                INSERT OR IGNORE INTO outbox
+                    (report_id, recipient, kind, subject, body, status, next_attempt_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (report_id, recipient, kind, subject, body, PENDING, time.time(), now, now))
+        if cursor.rowcount:
+            logger.info(f"📮 已加入发件箱: {recipient}（报告 {report_id}）")
+            return True
+        logger.info(f"发件箱中已有该报告，跳过: {recipient}（报告 {report_id}）")
+        return False
+
+    def claim_due(self, limit=50):
+        """取出到期待发送的邮件并标记为发送中
+
+        多个发送线程/进程可能共用同一个发件箱：每封邮件用带条件的UPDATE认领，
+        只有UPDATE成功（rowcount为1）的邮件才由本线程发送，同一封邮件不会被发送两次
+
+        Returns:
+            [{'id', 'report_id', 'recipient', 'kind', 'subject', 'body', 'attempts'}, ...]
+        """
+        now = time.time()
+        claimed = []
+        with self._lock, self.conn:
+            rows = self.conn.execute("""
+                SELECT id, report_id, recipient, kind, subject, body, attempts FROM outbox
+                WHERE status IN (?, ?) AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id LIMIT ?
+            """, (PENDING, SENDING, now, limit)).fetchall()
+            for row in rows:
+                cursor = self.conn.execute("""
+                    UPDATE outbox SET status = ?, next_attempt_at = ?, updated_at = ?
+                    WHERE id = ? AND status IN (?, ?) AND next_attempt_at <= ?
+                """, (SENDING, now + self.sending_timeout, datetime.now().isoformat(), row['id'],
+                      PENDING, SENDING, now))
+                if cursor.rowcount:
+                    claimed.append(dict(row))
+        return claimed
+
+    def mark_sent(self, item_id):
+        """标记为已发送"""
+        now = datetime.now().isoformat()
+        with self._lock, self.conn:
+            self.conn.execute("""
+                UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = NULL,
+                    sent_at = ?, updated_at = ?
+                WHERE id = ?
+            """, (SENT, now, now, item_id))
+
+    def mark_error(self, item_id, error, permanent=False):
+        """记录发送失败：安排退避重试，永久错误或次数用完时标记为失败
+
+        Returns:
+            新状态（pending / failed）
+        """
+        with self._lock, self.conn:
+            row = self.conn.execute("SELECT attempts FROM outbox WHERE id = ?", (item_id,)).fetchone()
+            if row is None:
+                return None
+            attempts = row['attempts'] + 1
+            status = FAILED if permanent or attempts >= self.max_attempts else PENDING
+            delay = min(self.retry_delay * (2 ** (attempts - 1)), self.max_retry_delay)
+            self.conn.execute("""
+                UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ?
+                WHERE id = ?
+            """, (status, attempts, time.time() + delay, str(error), datetime.now().isoformat(), item_id))
+        return status
+
+    def get_status(self, report_id):
+        """获取报告的发送状态
+
+        Returns:
+            {收件人: {'status', 'attempts', 'last_error', 'sent_at'}}
+        """
+        with self._lock:
+            rows = self.conn.execute("""
+                SELECT recipient, status, attempts, last_error, sent_at FROM outbox
+                WHERE report_id = ? ORDER BY id
+            """, (report_id,)).fetchall()
+        return {row['recipient']: {key: row[key] for key in ('status', 'attempts', 'last_error', 'sent_at')}
+                for row in rows}
+
+    def pending_count(self, report_id=None):
+        """尚未发送完成（待发送/发送中）的邮件数量"""
+        query = "SELECT COUNT(*) FROM outbox WHERE status IN (?, ?)"
+        params = [PENDING, SENDING]
+        if report_id is not None:
+            query += " AND report_id = ?"
+            params.append(report_id)
+        with self._lock:
+            return self.conn.execute(query, params).fetchone()[0]
+
+    def next_due_in(self):
+        """距离下一封待发送邮件到期的秒数（没有待发送邮件时返回None）"""
+        with self._lock:
+            row = self.conn.execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status IN (?, ?)",
+                                    (PENDING, SENDING)).fetchone()
+        if row[0] is None:
+            return None
+        return max(0, row[0] - time.time())
+
+
+class OutboxSender:
+    """后台发送线程：定期取出到期的邮件，用同一个SMTP会话发送"""
+
+    def __init__(self, outbox, deliver, is_permanent=None, poll_interval=30, batch_size=50):
+        """初始化
+
+        Args:
+            outbox: Outbox
+            deliver: 发送函数，参数为 claim_due 返回的邮件列表，返回 {邮件id: None（成功）或异常}
+            is_permanent: 判断异常是否为永久错误（不再重试）的函数
+            poll_interval: 没有到期邮件时的最长等待秒数
+            batch_size: 每次最多取出的邮件数量
+        """
+        self.outbox = outbox
+        self.deliver = deliver
+        self.is_permanent = is_permanent or (lambda error: False)
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动后台线程（已启动时不重复启动）"""
+        if self._thread and self._thread.is_alive():
+            self.notify()
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-sender", daemon=True)
+        self._thread.start()
+        logger.info("📮 后台发送线程已启动")
+
+    def stop(self, timeout=5):
+        """停止后台线程（最多等待 timeout 秒，正在发送的一批邮件发送完成后线程退出）"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def notify(self):
+        """有新邮件加入发件箱，立即唤醒后台线程"""
+        self._wakeup.set()
+
+    def run_once(self):
+        """发送一批到期的邮件
+
+        Returns:
+            本次处理的邮件数量
+        """
+        items = self.outbox.claim_due(self.batch_size)
+        if not items:
+            return 0
+
+        try:
+            results = self.deliver(items)
+        except Exception as e:
+            results = {item['id']: e for item in items}
+
+        for item in items:
+            error = results.get(item['id'])
+            if error is None:
+                self.outbox.mark_sent(item['id'])
+                logger.info(f"✅ 发件箱邮件已发送: {item['recipient']}（报告 {item['report_id']}）")
+                continue
+
+            status = self.outbox.mark_error(item['id'], error, self.is_permanent(error))
+            if status == FAILED:
+                logger.error(f"❌ 发件箱邮件发送失败，不再重试: {item['recipient']}: {str(error)}")
+            else:
+                logger.warning(f"⚠️  发件箱邮件发送失败（第 {item['attempts'] + 1} 次），稍后重试: "
+                               f"{item['recipient']}: {str(error)}")
+        return len(items)
+
+    def _run(self):
+        """后台线程主循环"""
+        while not self._stopped.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception as e:
+                logger.error(f"发件箱发送出错: {str(e)}", exc_info=True)
+
+            due_in = self.outbox.next_due_in()
+            wait = self.poll_interval if due_in is None else min(self.poll_interval, due_in)
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+
+    def wait(self, timeout):
+        """等待发件箱中的邮件全部发送完成（或不再重试）
+
+        Returns:
+            是否已全部完成（超时返回False，剩余邮件由后台线程或下次运行继续发送）
+        """
+        deadline = time.monotonic() + timeout
+        while self.outbox.pending_count():
+            if time.monotonic() >= deadline:
+                return False
+            self.notify()
+            time.sleep(min(0.5, max(0, deadline - time.monotonic())))
+        return True
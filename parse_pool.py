@@ -0,0 +1,124 @@
+"""
+批量解析模块 - V6.1
+把原始邮件分批交给进程池：MIME解析、邮件头解码、正文提取和清理在子进程中完成，
+主线程只负责网络收发和正文缓存，大量回填时解析速度随CPU核数增长
+"""
+import email
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import logging
+from body_cache import BodyCache
+
+logger = logging.getLogger(__name__)
+
+# 子进程中的解析器（每个子进程初始化一次）
+_parser = None
+
+
+class _PrefetchedBodies:
+    """子进程使用的正文缓存：只包含主进程预先查到的条目，新清理的正文随结果返回主进程写入"""
+
+    make_key = staticmethod(BodyCache.make_key)
+
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.new_entries = {}
+
+    def get(self, key):
+        return self.bodies.get(key)
+
+    def set(self, key, body):
+        self.new_entries[key] = body
+
+
+def _init_worker(username, fetch_config):
+    """子进程初始化：创建只用于解析的EmailClient（不打开邮件库和正文缓存）"""
+    global _parser
+    from email_client import EmailClient
+    fetch_config = dict(fetch_config, message_store=False, body_cache=False, parse_workers=0)
+    _parser = EmailClient(username, '', '', 0, '', 0, fetch_config=fetch_config)
+
+
+def _parse_chunk(items, sender_emails_lower, cutoff_date, exclude_self_lower, cached_bodies):
+    """子进程：解析一批原始邮件
+
+    Returns:
+        ([(邮件编号, 邮件数据或None, 错误信息或None), ...], 新清理的正文 {缓存键: 正文})
+    """
+    cache = _PrefetchedBodies(cached_bodies) if cached_bodies is not None else None
+    _parser.body_cache = cache
+
+    results = []
+    for email_id, raw_email in items:
+        try:
+            msg = email.message_from_bytes(raw_email)
+            record = _parser._build_email_record(email_id, msg, sender_emails_lower, cutoff_date,
+                                                 exclude_self_lower, raw=raw_email)
+            results.append((email_id, record, None))
+        except Exception as e:
+            results.append((email_id, None, str(e)))
+    return results, cache.new_entries if cache else {}
+
+
+class ParsePool:
+    """原始邮件解析进程池"""
+
+    def __init__(self, username, fetch_config, workers, chunk_size=20):
+        """初始化（子进程在第一次提交任务时启动）
+
+        Args:
+            username: 邮箱账号（邮件数据中的account字段）
+            fetch_config: 与主进程相同的fetch_config（正文截断、HTML转换等设置保持一致）
+            workers: 子进程数量
+            chunk_size: 每个任务包含的邮件数量
+        """
+        self.workers = workers
+        self.chunk_size = max(1, chunk_size)
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                            initargs=(username, fetch_config))
+
+    def parse(self, raw_emails, sender_emails_lower, cutoff_date, exclude_self_lower, body_cache=None,
+              cache_key=None):
+        """并行解析原始邮件，按输入顺序产出结果
+
+        Args:
+            raw_emails: 可迭代的 (邮件编号 bytes, 原始邮件 bytes)
+            body_cache: 主进程的BodyCache（可选），命中的正文随任务发给子进程
+            cache_key: 根据原始邮件计算缓存键的函数
+
+        Yields:
+            (邮件编号, 邮件数据或None, 错误信息或None)
+        """
+        raw_emails = iter(raw_emails)
+        in_flight = deque()
+        max_in_flight = self.workers * 2
+
+        while True:
+            # 保持每个子进程都有任务，同时限制内存中未处理的原始邮件数量
+            while len(in_flight) < max_in_flight:
+                items = list(itertools.islice(raw_emails, self.chunk_size))
+                if not items:
+                    break
+                cached_bodies = None
+                if body_cache:
+                    cached_bodies = {}
+                    for _, raw_email in items:
+                        key = cache_key(raw_email)
+                        body = body_cache.get(key)
+                        if body is not None:
+                            cached_bodies[key] = body
+                in_flight.append(self.executor.submit(_parse_chunk, items, sender_emails_lower, cutoff_date,
+                                                      exclude_self_lower, cached_bodies))
+            if not in_flight:
+                return
+
+            results, new_entries = in_flight.popleft().result()
+            if body_cache:
+                for key, body in new_entries.items():
+                    body_cache.set(key, body)
+            yield from results
+
+    def close(self):
+        """关闭进程池"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
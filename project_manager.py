@@ -5,7 +5,7 @@
 import json
 import os
 import logging
-import re
+from aho_corasick import AhoCorasick
 from project_doc_loader import ProjectDocLoader
 from product_params_manager import ProductParamsManager
 
@@ -32,6 +32,15 @@ class ProjectManager:
         self.params_manager = ProductParamsManager()
         
         self._load_profiles()
+        self._build_keyword_matcher()
+    
+    def _build_keyword_matcher(self):
+        """构建项目关键词自动机（V6.1：不区分大小写、整词匹配，一次扫描检测所有项目）"""
+        self._keyword_entries = [(project_code, keyword)
+                                 for project_code, keywords in self.project_keywords.items()
+                                 for keyword in keywords]
+        self._keyword_matcher = AhoCorasick([keyword for _, keyword in self._keyword_entries],
+                                            ignore_case=True, whole_word=True)
     
     def _load_profiles(self):
         """加载项目信息"""
@@ -73,13 +82,11 @@ class ProjectManager:
         """
         detected_projects = []
         
-        for project_code, keywords in self.project_keywords.items():
-            for keyword in keywords:
-                # 不区分大小写的搜索
-                if re.search(r'\b' + re.escape(keyword) + r'\b', text, re.IGNORECASE):
-                    if project_code not in detected_projects:
-                        detected_projects.append(project_code)
-                    break
+        # 不区分大小写的整词搜索（按项目配置顺序返回）
+        for index in self._keyword_matcher.search(text):
+            project_code = self._keyword_entries[index][0]
+            if project_code not in detected_projects:
+                detected_projects.append(project_code)
         
         return detected_projects
     
@@ -0,0 +1,133 @@
+"""
+限流模块 - V6.1
+令牌桶限流：同时限制每分钟请求数（RPM）和每分钟token数（TPM），
+多个线程并发调用AI接口时共享同一个限流器，超出预算时阻塞等待；
+服务器返回限流时所有线程暂停并降低速率，之后随成功请求逐渐恢复
+"""
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Bucket:
+    """单个令牌桶（容量为每分钟的预算，至少为1，按秒匀速补充）"""
+
+    def __init__(self, per_minute):
+        self.per_minute = float(per_minute)
+        self.capacity = max(1.0, self.per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def scale(self, factor, now):
+        """按比例调整容量和补充速度（factor 为配置预算的比例）
+
+        容量不低于1：否则桶里永远攒不满一个请求，acquire 会一直等待
+        """
+        self.refill(now)
+        self.capacity = max(1.0, self.per_minute * factor)
+        self.rate = self.per_minute * factor / 60.0
+        self.level = min(self.level, self.capacity)
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """还需要等待多少秒才能取出 amount 个令牌"""
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+class TokenBucketLimiter:
+    """请求数 + token数 双令牌桶限流器（线程安全）"""
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, min_factor=0.1, recovery_step=0.05):
+        """初始化
+
+        Args:
+            requests_per_minute: 每分钟最多请求数（0 表示不限制）
+            tokens_per_minute: 每分钟最多token数（0 表示不限制）
+            min_factor: 服务器限流后速率最低降到配置预算的比例
+            recovery_step: 每次成功请求后恢复的比例
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.min_factor = min_factor
+        self.recovery_step = recovery_step
+        self._requests = _Bucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._tokens = _Bucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self._lock = threading.Lock()
+        self._factor = 1.0          # 当前速率占配置预算的比例
+        self._paused_until = 0.0    # 服务器要求暂停到的时间（time.monotonic）
+        self.waited = 0.0  # 累计等待秒数
+
+    def acquire(self, tokens=0):
+        """取出一次请求和 tokens 个token的预算，预算不足时阻塞等待
+
+        Args:
+            tokens: 本次请求预计消耗的token数（超过每分钟预算时按预算计）
+
+        Returns:
+            本次等待的秒数
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = max(0.0, self._paused_until - now)
+                if self._requests:
+                    self._requests.refill(now)
+                    wait = max(wait, self._requests.wait_time(1))
+                if self._tokens:
+                    self._tokens.refill(now)
+                    tokens = min(tokens, self._tokens.capacity)
+                    wait = max(wait, self._tokens.wait_time(tokens))
+
+                if wait <= 0:
+                    if self._requests:
+                        self._requests.level -= 1
+                    if self._tokens:
+                        self._tokens.level -= tokens
+                    self.waited += waited
+                    return waited
+
+            time.sleep(wait)
+            waited += wait
+
+    def _scale(self, factor, now):
+        self._factor = factor
+        for bucket in (self._requests, self._tokens):
+            if bucket:
+                bucket.scale(factor, now)
+
+    def slow_down(self, retry_after=None):
+        """服务器返回限流（429）：所有线程暂停到 Retry-After 之后，速率减半
+
+        Args:
+            retry_after: 服务器要求等待的秒数（可选）
+        """
+        with self._lock:
+            now = time.monotonic()
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            factor = max(self.min_factor, self._factor / 2)
+            if factor < self._factor:
+                self._scale(factor, now)
+                if self._requests or self._tokens:
+                    logger.warning(f"⚠️  AI接口限流，速率降至配置的 {factor:.0%}")
+
+    def record_success(self):
+        """请求成功：逐渐恢复到配置的速率"""
+        if self._factor >= 1.0:
+            return
+        with self._lock:
+            self._scale(min(1.0, self._factor + self.recovery_step), time.monotonic())
+
+    @staticmethod
+    def estimate_tokens(text):
+        """粗略估算文本的token数（中文约每字1个token，英文约每4个字符1个token）"""
+        chars = len(text)
+        non_ascii = (len(text.encode('utf-8')) - chars) // 2
+        return non_ascii + (chars - non_ascii) // 4 + 1
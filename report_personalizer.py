@@ -0,0 +1,116 @@
+"""
+个性化报告模块 - V6.1
+根据组织关系（下属、管理的部门、负责的客户）为每个收件人筛选相关邮件，
+复用同一次获取和AI分析的结果，多个收件人的报告并行生成
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ('leader', 'pm', 'employee', 'customer', 'supplier')
+
+
+class ReportPersonalizer:
+    """按收件人生成个性化报告"""
+
+    def __init__(self, org_manager, analyzer, report_generator, full_report_recipients=None, max_workers=4):
+        """初始化
+
+        Args:
+            org_manager: OrgRelationshipManager（没有人员信息时为None，所有人收到完整报告）
+            analyzer: EmailAnalyzer，用于生成摘要
+            report_generator: AIReportGenerator，用于生成文本报告
+            full_report_recipients: 始终收到完整报告的收件人
+            max_workers: 并行生成报告的线程数
+        """
+        self.org_manager = org_manager
+        self.analyzer = analyzer
+        self.report_generator = report_generator
+        self.full_report_recipients = {email.lower() for email in (full_report_recipients or [])}
+        self.max_workers = max(1, max_workers)
+
+        persons = org_manager.persons if org_manager else {}
+        self._person_keys = {email.lower(): email for email in persons}
+
+    def get_scope(self, recipient):
+        """获取收件人的联系人范围（小写邮箱集合），返回None表示收到完整报告"""
+        recipient_lower = recipient.lower()
+        if recipient_lower in self.full_report_recipients:
+            return None
+        person_key = self._person_keys.get(recipient_lower)
+        if person_key is None:
+            return None
+        return self.org_manager.get_report_scope(person_key)
+
+    @staticmethod
+    def _filter_emails(emails, scope):
+        return [email_item for email_item in emails if email_item['from_email'].lower() in scope]
+
+    @staticmethod
+    def _filter_repeat_issues(repeat_issues, scope):
+        """保留至少有一封邮件来自范围内联系人的重复问题"""
+        return [issue for issue in repeat_issues
+                if any(email_item['from_email'].lower() in scope for email_item in issue['emails'])]
+
+    def _render(self, scope, persons_config, categorized_emails, repeat_issues, ai_enabled):
+        """生成一份报告（scope为None时为完整报告）"""
+        if scope is not None:
+            categorized_emails = {category: self._filter_emails(emails, scope)
+                                  for category, emails in categorized_emails.items()}
+            repeat_issues = self._filter_repeat_issues(repeat_issues, scope)
+
+        summary = self.analyzer.generate_summary(
+            *(persons_config[category] for category in CATEGORIES),
+            *(categorized_emails[category] for category in CATEGORIES),
+            repeat_issues
+        )
+        return self.report_generator.generate_text_report(summary, ai_enabled)
+
+    def render_reports(self, recipients, persons_config, categorized_emails, repeat_issues, ai_enabled=False,
+                       full_report=None):
+        """为每个收件人生成报告
+
+        Args:
+            recipients: 收件人列表
+            persons_config: {'leader': {...}, 'pm': {...}, 'employee': {...}, 'customer': {...}, 'supplier': {...}}
+            categorized_emails: 已分析、已分类的邮件 {'leader': [...], 'pm': [...], ...}
+            repeat_issues: 员工邮件中的重复问题（完整列表）
+            ai_enabled: 是否启用了AI分析
+            full_report: 已生成的完整报告（可选，范围为全部的收件人直接使用）
+
+        Returns:
+            {收件人: 报告文本}
+        """
+        scopes = {recipient: self.get_scope(recipient) for recipient in recipients if recipient}
+
+        # 相同范围只生成一次
+        unique_scopes = {}
+        for recipient, scope in scopes.items():
+            key = frozenset(scope) if scope is not None else None
+            unique_scopes.setdefault(key, scope)
+
+        rendered = {}
+        if None in unique_scopes and full_report is not None:
+            rendered[None] = full_report
+        pending = [key for key in unique_scopes if key not in rendered]
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending) or 1),
+                                thread_name_prefix="report-render") as executor:
+            futures = {key: executor.submit(self._render, unique_scopes[key], persons_config,
+                                            categorized_emails, repeat_issues, ai_enabled)
+                       for key in pending}
+            for key, future in futures.items():
+                rendered[key] = future.result()
+
+        reports = {}
+        for recipient, scope in scopes.items():
+            key = frozenset(scope) if scope is not None else None
+            reports[recipient] = rendered[key]
+            if scope is None:
+                logger.info(f"  {recipient}: 完整报告")
+            else:
+                logger.info(f"  {recipient}: 个性化报告（{len(scope)} 位相关联系人）")
+
+        logger.info(f"✅ 已为 {len(reports)} 个收件人生成报告（{len(unique_scopes)} 种范围，并行 {self.max_workers}）")
+        return reports
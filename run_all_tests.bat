@@ -36,6 +36,33 @@ if exist "persons\人员信息表_迁移.xlsx" (
 )
 echo.
 
+echo [测试4] IDLE守护进程测试（本地IMAP测试服务器）
+echo ----------------------------------------
+python test_idle_daemon.py
+if %errorlevel% neq 0 (
+    echo [失败] IDLE守护进程测试失败
+    pause
+    exit /b 1
+)
+echo.
+echo [测试5] 字符集解码测试
+echo ----------------------------------------
+python test_charset_decoder.py
+if %errorlevel% neq 0 (
+    echo [失败] 字符集解码测试失败
+    pause
+    exit /b 1
+)
+echo.
+echo [测试6] SMTP发送重试测试
+echo ----------------------------------------
+python test_smtp_delivery.py
+if %errorlevel% neq 0 (
+    echo [失败] SMTP发送重试测试失败
+    pause
+    exit /b 1
+)
+echo.
 echo ========================================
 echo 测试完成！
 echo ========================================
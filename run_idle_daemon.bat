@@ -0,0 +1,13 @@
+@echo off
+chcp 65001
+echo ========================================
+echo 邮箱助手 - IDLE实时模式
+echo ========================================
+echo.
+echo 保持IMAP长连接，关注的发件人来新邮件后立即分析
+echo 按 Ctrl+C 可以停止
+echo.
+
+python idle_daemon.py
+
+pause
@@ -4,8 +4,10 @@
 """
 import json
 import logging
+import sys
 from datetime import datetime
 from email_client import EmailClient
+from message_store import MessageStore
 from person_manager import PersonManager
 
 # 配置日志
@@ -16,7 +18,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def show_all_emails():
+def show_all_emails(offline=False):
     """显示所有获取到的邮件"""
     print("=" * 80)
     print("邮件获取详情")
@@ -39,25 +41,30 @@ def show_all_emails():
     print(f"监控 {len(all_senders)} 个关键人员")
     print()
     
-    # 连接邮箱
-    email_account = config['email_account']
-    client = EmailClient(
-        username=email_account['username'],
-        password=email_account['password'],
-        imap_server=email_account['imap_server'],
-        imap_port=email_account['imap_port'],
-        smtp_server=email_account['smtp_server'],
-        smtp_port=email_account['smtp_port']
-    )
-    
-    if not client.connect_imap():
-        print("无法连接到邮箱")
-        return
-    
-    # 获取邮件
+    # 获取邮件（V6.1：--offline 时从本地邮件库读取，不连接邮箱）
     days_to_check = config.get('days_to_check', 1)
     print(f"获取最近 {days_to_check} 天的邮件...")
-    all_emails = client.fetch_emails_from_senders(all_senders, days_to_check)
+    client = None
+    if offline:
+        store = MessageStore(config.get('fetch_config', {}).get('message_store_path', 'data/messages.db'))
+        all_emails = store.fetch_emails_from_senders(all_senders, days_to_check)
+    else:
+        email_account = config['email_account']
+        client = EmailClient(
+            username=email_account['username'],
+            password=email_account['password'],
+            imap_server=email_account['imap_server'],
+            imap_port=email_account['imap_port'],
+            smtp_server=email_account['smtp_server'],
+            smtp_port=email_account['smtp_port'],
+            fetch_config=config.get('fetch_config', {})
+        )
+        
+        if not client.connect_imap():
+            print("无法连接到邮箱")
+            return
+        
+        all_emails = client.fetch_emails_from_senders(all_senders, days_to_check)
     
     print(f"总共: {len(all_emails)} 封")
     print()
@@ -95,12 +102,14 @@ def show_all_emails():
             date_str = email['date'].strftime('%m-%d %H:%M')
             print(f"  [{date_str}] {email['subject'][:50]}")
     
-    client.disconnect_imap()
+    if client:
+        client.disconnect_imap()
     
     print()
     print("=" * 80)
 
 
 if __name__ == '__main__':
-    show_all_emails()
+    # python show_all_emails.py --offline  从本地邮件库读取（V6.1）
+    show_all_emails(offline='--offline' in sys.argv)
 
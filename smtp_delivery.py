@@ -0,0 +1,146 @@
+"""
+SMTP发送模块 - V6.1
+一次运行只建立一个已登录的SMTP会话，依次发送给所有收件人；
+只有服务器返回限流/临时错误（421、4xx）或断开连接时才等待并重试，正常发送不再固定延迟
+"""
+import smtplib
+import ssl
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SmtpDelivery:
+    """复用单个SMTP会话的发送器（可用作上下文管理器）"""
+
+    def __init__(self, smtp_server, smtp_port, username, password, use_ssl=True, max_retries=3,
+                 retry_delay=5, max_retry_delay=120, timeout=60):
+        """初始化
+
+        Args:
+            use_ssl: 使用SMTP_SSL（默认）；为False时使用普通SMTP（本地测试服务器）
+            max_retries: 临时错误时每封邮件最多重试次数
+            retry_delay: 第一次重试前等待的秒数（之后每次翻倍，服务器断开时会重新登录）
+            max_retry_delay: 重试等待的最大秒数
+            timeout: SMTP连接超时（秒）
+        """
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.timeout = timeout
+        self.server = None
+        self.sessions = 0  # 本次建立的SMTP会话数（含重连）
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _connect(self):
+        """建立SMTP会话并登录"""
+        if self.use_ssl:
+            context = ssl.create_default_context()
+            server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, context=context, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+        server.login(self.username, self.password)
+        self.server = server
+        self.sessions += 1
+
+    def close(self):
+        """结束SMTP会话"""
+        if self.server:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+    @staticmethod
+    def _is_transient(error):
+        """是否为可重试的临时错误（限流、服务暂不可用、连接断开）
+
+        smtplib.SMTPException 是 OSError 的子类，先按响应码判断，只有没有响应码的连接错误才视为临时错误
+        """
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            codes = [code for code, _ in error.recipients.values()]
+            return bool(codes) and all(400 <= code < 500 for code in codes)
+        code = getattr(error, 'smtp_code', None)
+        if code is not None:
+            return 400 <= code < 500
+        return SmtpDelivery.is_connection_error(error)
+
+    @staticmethod
+    def is_connection_error(error):
+        """是否为连不上服务器或连接断开（重试用完后仍失败时，同一批的其余邮件也不会成功）"""
+        if isinstance(error, (smtplib.SMTPConnectError, smtplib.SMTPServerDisconnected)):
+            return True
+        return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+    @staticmethod
+    def is_permanent(error):
+        """是否为永久错误（收件人/邮件内容被拒绝的5xx），重试也不会成功"""
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            codes = [code for code, _ in error.recipients.values()]
+            return bool(codes) and all(code >= 500 for code in codes)
+        if isinstance(error, (smtplib.SMTPDataError, smtplib.SMTPSenderRefused)):
+            return error.smtp_code >= 500
+        return False
+
+    def send(self, msg):
+        """发送一封邮件（收件人取自邮件头），临时错误时退避重试
+
+        Raises:
+            smtplib.SMTPException / OSError：永久错误或重试次数用完
+        """
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.server is None:
+                    self._connect()
+                refused = self.server.send_message(msg)
+                if refused:
+                    logger.warning(f"部分收件人被拒绝: {', '.join(refused)}")
+                return
+            except (smtplib.SMTPException, OSError) as e:
+                if not self._is_transient(e) or attempt >= self.max_retries:
+                    raise
+                code = getattr(e, 'smtp_code', None)
+                if code == 421 or self.is_connection_error(e):
+                    # 421 或连接断开：服务器会关闭会话，重新登录
+                    self.close()
+                logger.warning(f"SMTP临时错误（{str(e)}），{delay} 秒后重试（{attempt + 1}/{self.max_retries}）")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    def send_many(self, messages):
+        """用同一个会话依次发送多封邮件（连接失败且重试用完后，其余邮件不再尝试，记为同一个错误）
+
+        Args:
+            messages: [(收件人, 邮件对象), ...]
+
+        Returns:
+            {收件人: None（成功）或发送失败的异常}
+        """
+        results = {}
+        connection_error = None
+        for recipient, msg in messages:
+            if connection_error is not None:
+                results[recipient] = connection_error
+                continue
+            try:
+                self.send(msg)
+                results[recipient] = None
+            except Exception as e:
+                results[recipient] = e
+                if self.is_connection_error(e):
+                    logger.warning(f"SMTP服务器连接失败，本批其余 {len(messages) - len(results)} 封邮件不再尝试")
+                    connection_error = e
+        return results
@@ -0,0 +1,117 @@
+"""
+邮件同步状态模块 - V6.1
+按账号/文件夹持久化 UIDVALIDITY、已处理的最大UID和HIGHESTMODSEQ，支持增量同步
+"""
+import json
+import os
+import threading
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SyncStateStore:
+    """IMAP增量同步检查点"""
+
+    def __init__(self, state_dir='sync_state'):
+        """初始化同步状态
+
+        Args:
+            state_dir: 状态文件目录
+        """
+        self.state_dir = state_dir
+        self.state_file = os.path.join(state_dir, 'imap_sync_state.json')
+        self.state_data = {}
+        self._lock = threading.Lock()  # 多个EmailClient（多账号/文件夹）共享同一个实例
+
+        self._load_state()
+
+    @staticmethod
+    def make_key(username, imap_server, folder):
+        """生成检查点key（账号 + 服务器 + 文件夹）"""
+        return f"{username.lower()}@{imap_server}/{folder}"
+
+    def _load_state(self):
+        """加载同步状态"""
+        try:
+            if os.path.exists(self.state_file):
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    self.state_data = json.load(f)
+                logger.info(f"同步状态加载成功: {len(self.state_data)} 个文件夹")
+            else:
+                self.state_data = {}
+        except Exception as e:
+            logger.error(f"加载同步状态失败: {str(e)}")
+            self.state_data = {}
+
+    def _save_state(self):
+        """保存同步状态"""
+        try:
+            # 第一次保存检查点时才创建目录（只读取邮件的脚本不会留下空目录）
+            if not os.path.exists(self.state_dir):
+                os.makedirs(self.state_dir)
+                logger.info(f"创建同步状态目录: {self.state_dir}")
+            with open(self.state_file, 'w', encoding='utf-8') as f:
+                json.dump(self.state_data, f, ensure_ascii=False, indent=2)
+            logger.debug("同步状态已保存")
+        except Exception as e:
+            logger.error(f"保存同步状态失败: {str(e)}")
+
+    def get_checkpoint(self, key, uidvalidity):
+        """获取检查点
+
+        Args:
+            key: make_key 生成的key
+            uidvalidity: 当前文件夹的UIDVALIDITY
+
+        Returns:
+            已处理的最大UID；没有检查点或UIDVALIDITY已变化时返回None
+        """
+        checkpoint = self.state_data.get(key)
+        if not checkpoint:
+            return None
+
+        if checkpoint.get('uidvalidity') != uidvalidity:
+            logger.warning(f"UIDVALIDITY已变化（{checkpoint.get('uidvalidity')} → {uidvalidity}），检查点失效: {key}")
+            return None
+
+        return checkpoint.get('last_uid')
+
+    def update_checkpoint(self, key, uidvalidity, last_uid):
+        """更新检查点"""
+        with self._lock:
+            checkpoint = self.state_data.get(key, {})
+            if checkpoint.get('uidvalidity') != uidvalidity:
+                checkpoint = {}
+
+            checkpoint.update({
+                'uidvalidity': uidvalidity,
+                'last_uid': last_uid,
+                'updated_at': datetime.now().isoformat()
+            })
+            self.state_data[key] = checkpoint
+            self._save_state()
+        logger.debug(f"检查点已更新: {key} → UID {last_uid}")
+
+    def get_modseq(self, key, uidvalidity):
+        """获取上次同步时的HIGHESTMODSEQ（CONDSTORE），UIDVALIDITY已变化时返回None"""
+        checkpoint = self.state_data.get(key)
+        if not checkpoint or checkpoint.get('uidvalidity') != uidvalidity:
+            return None
+        return checkpoint.get('highest_modseq')
+
+    def update_modseq(self, key, uidvalidity, highest_modseq):
+        """更新HIGHESTMODSEQ（与UID检查点保存在同一条记录中）"""
+        with self._lock:
+            checkpoint = self.state_data.get(key, {})
+            if checkpoint.get('uidvalidity') != uidvalidity:
+                checkpoint = {'uidvalidity': uidvalidity}
+
+            checkpoint.update({
+                'highest_modseq': highest_modseq,
+                'updated_at': datetime.now().isoformat()
+            })
+            self.state_data[key] = checkpoint
+            self._save_state()
+        logger.debug(f"HIGHESTMODSEQ已更新: {key} → {highest_modseq}")
@@ -0,0 +1,93 @@
+"""
+测试V6.1 字符集解码（声明缺失/错误时识别GB18030和UTF-8，7位编码按声明的字符集解码）
+"""
+import sys
+from email.header import Header
+
+from charset_decoder import CharsetDecoder
+
+TEXT_JA = '会議の資料を送ります'
+TEXT_ZH = '请查收项目进度报告'
+
+
+def check(name, actual, expected):
+    """比较解码结果，打印并返回是否一致"""
+    if actual == expected:
+        print(f"[OK] {name}: {actual}")
+        return True
+    print(f"[ERROR] {name}: 期望 {expected!r}，实际 {actual!r}")
+    return False
+
+
+def test_seven_bit_charsets():
+    """ISO-2022-JP / HZ-GB-2312 / UTF-7 编码后全是ASCII字节，必须按声明的字符集解码"""
+    print("\n" + "=" * 60)
+    print("测试1: 7位编码的字符集")
+    print("=" * 60)
+
+    decoder = CharsetDecoder()
+    results = []
+    for charset, text in (('iso-2022-jp', TEXT_JA), ('hz-gb-2312', TEXT_ZH), ('utf-7', TEXT_ZH)):
+        data = text.encode(charset)
+        if not data.isascii():
+            print(f"[ERROR] {charset} 编码结果不是纯ASCII，测试数据无效")
+            results.append(False)
+            continue
+        results.append(check(charset, decoder.decode(data, charset), text))
+    return all(results)
+
+
+def test_encoded_header():
+    """=?ISO-2022-JP?B?...?= 邮件头"""
+    print("\n" + "=" * 60)
+    print("测试2: ISO-2022-JP 编码的邮件头")
+    print("=" * 60)
+
+    from email_client import EmailClient
+    client = EmailClient('me@example.com', '', '', 0, '', 0)
+    header = Header(TEXT_JA, 'iso-2022-jp').encode()
+    print(f"  邮件头: {header}")
+    return check("decode_mime_words", client.decode_mime_words(header), TEXT_JA)
+
+
+def test_detection():
+    """未声明或声明错误的GBK/UTF-8内容，以及纯ASCII内容"""
+    print("\n" + "=" * 60)
+    print("测试3: 字符集识别")
+    print("=" * 60)
+
+    decoder = CharsetDecoder()
+    return all([
+        check("未声明的GBK", decoder.decode(TEXT_ZH.encode('gbk')), TEXT_ZH),
+        check("声明为GB2312的GB18030", decoder.decode('䶮'.encode('gb18030'), 'gb2312'), '䶮'),
+        check("标为ISO-8859-1的UTF-8", decoder.decode(TEXT_ZH.encode('utf-8'), 'iso-8859-1'), TEXT_ZH),
+        check("纯ASCII", decoder.decode(b'Weekly report', 'gbk'), 'Weekly report'),
+        check("截断的UTF-8", decoder.decode(TEXT_ZH.encode('utf-8')[:-1], 'utf-8', final=False), TEXT_ZH[:-1]),
+    ])
+
+
+def main():
+    """主函数"""
+    print("\n" + "=" * 60)
+    print("V6.1 字符集解码测试")
+    print("=" * 60)
+
+    results = [
+        ("7位编码的字符集", test_seven_bit_charsets()),
+        ("ISO-2022-JP 编码的邮件头", test_encoded_header()),
+        ("字符集识别", test_detection()),
+    ]
+
+    print("\n" + "=" * 60)
+    print("测试结果汇总")
+    print("=" * 60)
+    for name, ok in results:
+        print(f"{'[OK]' if ok else '[FAIL]'} {name}")
+
+    all_passed = all(ok for _, ok in results)
+    print("\n" + ("[OK] 所有测试通过！" if all_passed else "[WARN] 部分测试失败"))
+    return 0 if all_passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
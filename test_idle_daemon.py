@@ -0,0 +1,214 @@
+"""
+测试V6.1 IDLE守护进程（使用本地IMAP测试服务器 fake_imap_server，不需要真实邮箱）
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from email.message import EmailMessage
+from email.utils import format_datetime
+
+from fake_imap_server import FakeImapServer
+
+SENDER = 'boss@example.com'
+
+# 收到通知后应在几秒内处理完，远小于IDLE超时
+NOTIFY_WAIT = 5
+IDLE_TIMEOUT = 60
+
+
+def make_message(subject, sender=SENDER):
+    """生成一封原始邮件"""
+    msg = EmailMessage()
+    msg['From'] = f'老板 <{sender}>'
+    msg['To'] = 'me@example.com'
+    msg['Subject'] = subject
+    msg['Date'] = format_datetime(datetime.now().astimezone())
+    msg['Message-ID'] = f'<{subject}@example.com>'
+    msg.set_content(f'{subject} 的正文')
+    return msg.as_bytes().replace(b'\r\n', b'\n').replace(b'\n', b'\r\n')
+
+
+class DaemonRunner:
+    """在后台线程运行IDLE守护进程，记录每次处理到的邮件UID"""
+
+    def __init__(self, server, workdir):
+        from email_client import EmailClient
+        from ai_analyzer import AIAnalyzer
+        from idle_daemon import IdleDaemon
+
+        fetch_config = {
+            'imap_ssl': False,
+            'imap_compress': False,
+            'header_first': False,
+            'server_filter': False,
+            'flag_sync': False,
+            'message_store': False,
+            'body_cache': False,
+            'incremental_sync': True,
+            'sync_state_dir': os.path.join(workdir, 'sync_state'),
+        }
+        client = EmailClient('me@example.com', 'secret', '127.0.0.1', server.port, '127.0.0.1', 0,
+                             fetch_config=fetch_config)
+        config = {
+            'self_email': 'me@example.com',
+            'leaders': {SENDER: '老板'},
+            'idle_config': {'idle_timeout': IDLE_TIMEOUT, 'days': 7, 'reconnect_delay': 1},
+        }
+        self.daemon = IdleDaemon(config, client=client, ai_analyzer=AIAnalyzer({'enabled': False}))
+        self.processed = []
+        self.idling = threading.Event()
+
+        process_new_mail = self.daemon.process_new_mail
+        idle_wait = client.idle_wait
+
+        def recording_process_new_mail():
+            emails = process_new_mail()
+            self.processed.extend(int(item['id']) for item in emails)
+            return emails
+
+        def recording_idle_wait(*args, **kwargs):
+            self.idling.set()
+            return idle_wait(*args, **kwargs)
+
+        self.daemon.process_new_mail = recording_process_new_mail
+        client.idle_wait = recording_idle_wait
+        self.thread = threading.Thread(target=self.daemon.run, name="idle-daemon", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        if not self.idling.wait(NOTIFY_WAIT):
+            raise RuntimeError("守护进程没有进入IDLE")
+
+    def wait_for(self, uid, timeout=NOTIFY_WAIT):
+        """等待守护进程处理到指定UID，返回用时（秒），超时返回None"""
+        started = time.monotonic()
+        while time.monotonic() - started < timeout:
+            if uid in self.processed:
+                return time.monotonic() - started
+            time.sleep(0.05)
+        return None
+
+    def stop(self):
+        self.daemon.stop()
+
+
+def run_scenario(name, setup, trigger):
+    """启动服务器和守护进程，触发新邮件，检查守护进程是否及时获取到新UID"""
+    print("\n" + "=" * 60)
+    print(name)
+    print("=" * 60)
+
+    server = FakeImapServer().start()
+    runner = None
+    try:
+        old_uid = server.add_message(make_message('old-mail'))
+        setup(server)
+        # 每个场景使用独立的同步检查点目录
+        runner = DaemonRunner(server, tempfile.mkdtemp(dir=os.getcwd()))
+        runner.start()
+        if old_uid not in runner.processed:
+            print(f"[ERROR] 启动时没有补取已有邮件 UID {old_uid}")
+            return False
+        print(f"[OK] 启动时补取已有邮件 UID {old_uid}")
+
+        new_uid = trigger(server)
+        elapsed = runner.wait_for(new_uid)
+        if elapsed is None:
+            print(f"[ERROR] {NOTIFY_WAIT} 秒内没有获取到新邮件 UID {new_uid}（IDLE超时 {IDLE_TIMEOUT} 秒）")
+            return False
+        print(f"[OK] 收到EXISTS通知后 {elapsed:.2f} 秒获取到新邮件 UID {new_uid}")
+
+        if runner.processed.count(new_uid) != 1:
+            print(f"[ERROR] 新邮件被重复处理: {runner.processed}")
+            return False
+        print("[OK] 新邮件只处理一次")
+
+        unexpected = set(runner.processed) - {old_uid, new_uid}
+        if unexpected:
+            print(f"[ERROR] 处理了非关注发件人的邮件: {sorted(unexpected)}")
+            return False
+        return True
+    except Exception as e:
+        print(f"[ERROR] 测试失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        if runner:
+            runner.stop()
+        server.stop()
+        if runner:
+            runner.thread.join(NOTIFY_WAIT)
+
+
+def test_exists_during_idle():
+    """IDLE期间服务器推送 * N EXISTS"""
+    def trigger(server):
+        time.sleep(0.2)  # 确保守护进程已发送IDLE
+        return server.deliver(make_message('new-mail'))
+    return run_scenario("测试1: IDLE期间推送新邮件", lambda server: None, trigger)
+
+
+def test_exists_with_continuation():
+    """EXISTS与IDLE的继续响应（+ idling）在同一个数据包中到达（必须从读取缓冲区中取出）"""
+    expected = {}
+
+    def setup(server):
+        # 第一次IDLE时服务器在"+ idling"之后立刻推送EXISTS
+        expected['uid'] = server.next_uid
+        server.arrive_on_idle.append(make_message('pipelined-mail'))
+
+    def trigger(server):
+        return expected['uid']
+
+    return run_scenario("测试2: EXISTS与IDLE继续响应同时到达", setup, trigger)
+
+
+def test_ignore_other_senders():
+    """非关注发件人的新邮件不处理，随后关注发件人的新邮件正常处理"""
+    def trigger(server):
+        time.sleep(0.2)
+        server.deliver(make_message('spam-mail', sender='spam@example.com'))
+        time.sleep(0.5)
+        return server.deliver(make_message('boss-mail'))
+    return run_scenario("测试3: 只处理关注发件人的新邮件", lambda server: None, trigger)
+
+
+def main():
+    """主函数"""
+    print("\n" + "=" * 60)
+    print("V6.1 IDLE守护进程测试")
+    print("=" * 60)
+
+    # 守护进程在导入时创建日志文件，检查点也写在当前目录，全部放在临时目录中
+    original_dir = os.getcwd()
+    sys.path.insert(0, original_dir)
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            results = [
+                ("IDLE期间推送新邮件", test_exists_during_idle()),
+                ("EXISTS与IDLE继续响应同时到达", test_exists_with_continuation()),
+                ("只处理关注发件人的新邮件", test_ignore_other_senders()),
+            ]
+        finally:
+            import logging
+            logging.shutdown()
+            os.chdir(original_dir)
+
+    print("\n" + "=" * 60)
+    print("测试结果汇总")
+    print("=" * 60)
+    for name, ok in results:
+        print(f"{'[OK]' if ok else '[FAIL]'} {name}")
+
+    all_passed = all(ok for _, ok in results)
+    print("\n" + ("[OK] 所有测试通过！" if all_passed else "[WARN] 部分测试失败"))
+    return 0 if all_passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
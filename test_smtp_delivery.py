@@ -0,0 +1,122 @@
+"""
+测试V6.1 SMTP发送的重试判断（永久错误不重试，临时错误和断开连接退避重试）
+不连接真实SMTP服务器：用脚本化的假会话代替 smtplib 连接
+"""
+import smtplib
+import sys
+from email.mime.text import MIMEText
+
+from smtp_delivery import SmtpDelivery
+
+
+class ScriptedServer:
+    """假SMTP会话：send_message 依次抛出脚本中的异常（None 表示发送成功）"""
+
+    def __init__(self, script):
+        self.script = script
+        self.calls = 0
+
+    def send_message(self, msg):
+        self.calls += 1
+        error = self.script.pop(0) if self.script else None
+        if error is not None:
+            raise error
+        return {}
+
+    def quit(self):
+        pass
+
+
+class ScriptedDelivery(SmtpDelivery):
+    """用假会话代替登录（记录登录次数）"""
+
+    def __init__(self, script, **kwargs):
+        super().__init__('smtp.example.com', 465, 'me@example.com', 'secret', retry_delay=0, **kwargs)
+        self.fake = ScriptedServer(script)
+
+    def _connect(self):
+        self.server = self.fake
+        self.sessions += 1
+
+
+def make_message(to_email='boss@example.com'):
+    msg = MIMEText('正文', 'plain', 'utf-8')
+    msg['From'] = 'me@example.com'
+    msg['To'] = to_email
+    msg['Subject'] = '测试'
+    return msg
+
+
+def run_case(name, script, expect_error, expect_calls, expect_sessions):
+    """发送一封邮件，检查是否失败、发送次数和登录次数"""
+    delivery = ScriptedDelivery(list(script), max_retries=3)
+    error = None
+    try:
+        delivery.send(make_message())
+    except Exception as e:
+        error = e
+
+    ok = (error is not None) == expect_error and delivery.fake.calls == expect_calls \
+        and delivery.sessions == expect_sessions
+    status = '[OK]' if ok else '[ERROR]'
+    print(f"{status} {name}: 发送 {delivery.fake.calls} 次，登录 {delivery.sessions} 次，"
+          f"{'失败: ' + type(error).__name__ if error else '成功'}")
+    if not ok:
+        print(f"  期望: 发送 {expect_calls} 次，登录 {expect_sessions} 次，{'失败' if expect_error else '成功'}")
+    return ok
+
+
+def test_permanent_errors():
+    """永久错误只尝试一次"""
+    print("\n" + "=" * 60)
+    print("测试1: 永久错误不重试")
+    print("=" * 60)
+
+    refused = smtplib.SMTPRecipientsRefused({'boss@example.com': (550, b'5.1.1 User unknown')})
+    return all([
+        run_case("收件人被拒绝 550", [refused], True, 1, 1),
+        run_case("不支持的命令", [smtplib.SMTPNotSupportedError('SMTPUTF8 not supported')], True, 1, 1),
+        run_case("内容被拒绝 554", [smtplib.SMTPDataError(554, b'spam')], True, 1, 1),
+    ])
+
+
+def test_transient_errors():
+    """临时错误退避重试：4xx 在同一会话重试，421 和断开连接重新登录"""
+    print("\n" + "=" * 60)
+    print("测试2: 临时错误重试")
+    print("=" * 60)
+
+    greylisted = smtplib.SMTPRecipientsRefused({'boss@example.com': (450, b'4.2.0 Greylisted')})
+    return all([
+        run_case("收件人暂时拒绝 450", [greylisted, None], False, 2, 1),
+        run_case("服务器限流 421", [smtplib.SMTPDataError(421, b'try later'), None], False, 2, 2),
+        run_case("连接断开", [smtplib.SMTPServerDisconnected('closed'), None], False, 2, 2),
+        run_case("网络错误", [ConnectionResetError('reset'), None], False, 2, 2),
+        run_case("重试用完", [smtplib.SMTPServerDisconnected('closed')] * 4, True, 4, 4),
+    ])
+
+
+def main():
+    """主函数"""
+    print("\n" + "=" * 60)
+    print("V6.1 SMTP发送重试测试")
+    print("=" * 60)
+
+    results = [
+        ("永久错误不重试", test_permanent_errors()),
+        ("临时错误重试", test_transient_errors()),
+    ]
+
+    print("\n" + "=" * 60)
+    print("测试结果汇总")
+    print("=" * 60)
+    for name, ok in results:
+        print(f"{'[OK]' if ok else '[FAIL]'} {name}")
+
+    all_passed = all(ok for _, ok in results)
+    print("\n" + ("[OK] 所有测试通过！" if all_passed else "[WARN] 部分测试失败"))
+    return 0 if all_passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())